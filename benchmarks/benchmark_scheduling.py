@@ -0,0 +1,118 @@
+"""
+Benchmark the size-based (largest first) scheduling of the transfer helpers
+against list-order scheduling, on a synthetic skewed batch of many small files
+and a few large videos.
+
+The transfers are simulated: each one sleeps for a fixed request latency plus its
+size divided by the per-connection bandwidth, and objects above the ranged
+download threshold are split over `range_workers` connections, like
+`download_ranged` does. This isolates the effect of the scheduling from the
+network, so no s3 credentials are needed.
+
+    python benchmarks/benchmark_scheduling.py --n_small=2000 --n_large=4 --max_workers=16
+"""
+
+import argparse
+import random
+import time
+
+from fuegodata.utils import boto3 as _s3
+
+KB = 1024
+GB = 1024 ** 3
+
+
+def skewed_sizes(n_small, n_medium, n_large, seed=0):
+    """
+    A shuffled list of object sizes (bytes): `n_small` json files of 1-8KB,
+    `n_medium` images of 1-20MB and `n_large` videos of 1-2GB.
+    """
+
+    rng = random.Random(seed)
+    sizes = (
+        [rng.randint(1, 8) * KB for i in range(n_small)]
+        + [rng.randint(1, 20) * _s3.MB for i in range(n_medium)]
+        + [rng.randint(1024, 2048) * _s3.MB for i in range(n_large)]
+    )
+    rng.shuffle(sizes)
+
+    return sizes
+
+
+def simulated_transfer(latency, bandwidth, range_threshold, range_workers, time_scale):
+    """
+    A function which sleeps for the simulated transfer time of an object size.
+
+    Args:
+        latency: float. The time (seconds) to first byte of each request.
+        bandwidth: float. The bandwidth (bytes/second) of a single connection.
+        range_threshold: int. The size (bytes) at which objects are split into
+            concurrent ranges.
+        range_workers: int. The number of ranges fetched concurrently.
+        time_scale: float. The factor applied to the simulated times, so the
+            benchmark runs in seconds instead of minutes.
+    """
+
+    def transfer(size):
+        connections = 1
+        if size >= range_threshold:
+            connections = range_workers
+        time.sleep(time_scale * (latency + size / (connections * bandwidth)))
+        return size
+
+    return transfer
+
+
+def run(sizes, transfer, max_workers, largest_first):
+    """The wall-clock time (seconds) to transfer the batch"""
+
+    start = time.perf_counter()
+    _s3.thread_map(
+        transfer, sizes, max_workers, sizes=sizes if largest_first else None
+    )
+
+    return time.perf_counter() - start
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--n_small", type=int, default=2000)
+    parser.add_argument("--n_medium", type=int, default=100)
+    parser.add_argument("--n_large", type=int, default=4)
+    parser.add_argument("--max_workers", type=int, default=_s3.DEFAULT_MAX_WORKERS)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--bandwidth_mb", type=float, default=50.0)
+    parser.add_argument("--time_scale", type=float, default=0.2)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    sizes = skewed_sizes(args.n_small, args.n_medium, args.n_large, args.seed)
+    transfer = simulated_transfer(
+        args.latency,
+        args.bandwidth_mb * _s3.MB,
+        _s3.MULTIPART_THRESHOLD,
+        _s3.MAX_FILE_CONCURRENCY,
+        args.time_scale,
+    )
+
+    # the shuffled order, and the worst case of the large objects listed last
+    batches = {"shuffled": sizes, "large last": sorted(sizes)}
+
+    print(
+        f"{len(sizes)} objects, {sum(sizes) / GB:.1f}GB,",
+        f"max_workers={args.max_workers}, time_scale={args.time_scale}",
+    )
+    for name, batch in batches.items():
+        for largest_first in [False, True]:
+            seconds = min(
+                run(batch, transfer, args.max_workers, largest_first)
+                for i in range(args.repeats)
+            )
+            schedule = "largest first" if largest_first else "list order"
+            print(f"\t{name:>10} | {schedule:>13}: {seconds:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,10 @@ fuegodata utility operations/submodules
 from fuegodata.utils import parse
 from fuegodata.utils import files
 from fuegodata.utils import boto3
+from fuegodata.utils import s3index
+from fuegodata.utils import s3cache
+from fuegodata.utils import shards
+from fuegodata.utils import s3async
 from fuegodata.utils import zipper
 from fuegodata.utils import videos
 from fuegodata.utils import bash
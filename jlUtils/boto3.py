@@ -1,11 +1,44 @@
 """
 Set up boto3 for communications with McQueen buckets.
 """
+import asyncio as _asyncio
+import atexit as _atexit
+import contextlib as _contextlib
+import copy as _copy
+import glob as _glob
+import gzip as _gzip
+import hashlib as _hashlib
+import json as _json
+import logging as _logging
+import math as _math
 import os as _os
+import queue as _queue
+import random as _random
+import shutil as _shutil
+import tempfile as _tempfile
+import threading as _threading
+import time as _time
+import warnings as _warnings
+import zlib as _zlib
+from concurrent.futures import ProcessPoolExecutor as _ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor as _ThreadPoolExecutor
+from concurrent.futures import FIRST_COMPLETED as _FIRST_COMPLETED
+from concurrent.futures import as_completed as _as_completed
+from concurrent.futures import wait as _wait
+
 import boto3 as _boto3
 import yaml as _yaml
 import botocore as _botocore
+from botocore import exceptions as _botocore_exceptions
+from botocore.config import Config as _Config
+from boto3.s3.transfer import TransferConfig as _TransferConfig
 import tqdm as _tqdm
+import urllib3 as _urllib3
+
+try:
+    import zstandard as _zstd
+except ImportError:
+    _zstd = None
 
 import fuegosecrets as _secrets
 
@@ -16,6 +49,141 @@ from fuegodata.utils import zipper as _zipper
 # test and prod region names
 REGION_NAMES = ["store-test", "store-030"]
 
+# default number of concurrent transfers
+DEFAULT_MAX_WORKERS = 10
+
+# default size of the http connection pool of the clients built by `client`
+# and `resource`. This leaves room for DEFAULT_MAX_WORKERS concurrent
+# transfers which each transfer several parts at once
+DEFAULT_MAX_POOL_CONNECTIONS = 64
+
+# endpoint url templates for the `client` and `resource` connections
+ENDPOINT_URLS = {
+    "client": "https://{region_name}.....:{port}/",
+    "resource": "https://{region_name}.....com:{port}/",
+}
+
+# cache of the parsed credentials files, keyed by file path
+_CREDENTIALS_CACHE = {}
+_CREDENTIALS_LOCK = _threading.Lock()
+
+# cache of the clients/resources built by `client` and `resource`. The pool lock
+# only guards the dictionaries, connections are built under a lock per request
+# (see `_pooled_connection`) so one slow connect doesn't block the other threads
+_POOL = {}
+_POOL_LOCK = _threading.Lock()
+_BUILD_LOCKS = {}
+
+# seconds a region is skipped for after a failed connection, before it is
+# probed again in the background
+CIRCUIT_COOLDOWN = 60.0
+
+# circuit breaker state per endpoint url, and the last healthy region per namespace
+_REGION_HEALTH = {}
+_HEALTHY_REGIONS = {}
+_HEALTH_LOCK = _threading.Lock()
+
+# the circuit breaker state is persisted to a state file per credentials file,
+# so new processes skip the failed regions too. The paths of the state files
+# which were loaded by this process
+REGION_HEALTH_DIR = _os.path.join(_os.path.expanduser("~"), ".cache", "fuegodata")
+_HEALTH_FPATHS = set()
+
+# set at exit, so no background probe is scheduled anymore (see `_record_failure`)
+_REPROBES_STOPPED = _threading.Event()
+
+# timeouts (seconds) of the request which checks that a new connection can reach
+# its region. The check is not retried, so a dead region fails over quickly
+PROBE_CONNECT_TIMEOUT = 2.0
+PROBE_READ_TIMEOUT = 5.0
+
+_logger = _logging.getLogger("fuegodata")
+
+MB = 1024 ** 2
+
+# multipart transfer policy. Files smaller than MULTIPART_THRESHOLD are sent
+# in a single request, larger files are split into parts of at least
+# MULTIPART_CHUNKSIZE which are transferred with up to MAX_FILE_CONCURRENCY
+# threads per file
+MULTIPART_THRESHOLD = 64 * MB
+MULTIPART_CHUNKSIZE = 16 * MB
+MAX_FILE_CONCURRENCY = 8
+MAX_PARTS = 10000  # the s3 limit on the number of parts per multipart upload
+
+# server-side copy policy. Objects from COPY_MULTIPART_THRESHOLD are copied as
+# multipart uploads with parts of at least COPY_PART_SIZE. MAX_COPY_SIZE is the
+# s3 limit on the size of a single CopyObject request
+COPY_MULTIPART_THRESHOLD = 512 * MB
+COPY_PART_SIZE = 128 * MB
+MAX_COPY_SIZE = 5 * 1024 * MB
+
+# the s3 limit on the number of keys per DeleteObjects request
+DELETE_BATCH_SIZE = 1000
+
+# transient errors which are retried by the transfer helpers
+RETRYABLE_ERROR_CODES = [
+    "500",
+    "502",
+    "503",
+    "504",
+    "InternalError",
+    "RequestTimeout",
+    "RequestTimeTooSkewed",
+    "ServiceUnavailable",
+    "SlowDown",
+    "Throttling",
+    "ThrottlingException",
+]
+RETRYABLE_ERRORS = (
+    _botocore_exceptions.ConnectionError,
+    _botocore_exceptions.HTTPClientError,
+    _botocore_exceptions.IncompleteReadError,
+    _urllib3.exceptions.ProtocolError,
+    _urllib3.exceptions.ReadTimeoutError,
+    ConnectionError,
+    TimeoutError,
+)
+
+# codecs of the compressed object storage (see `pick_codec`). Compressed objects
+# keep their key, and are marked with the codec in their metadata
+CODECS = ["gzip", "zstd"]
+CODEC_METADATA_KEY = "jlutils-codec"
+
+# the size and md5 of the uncompressed content of compressed objects, which their
+# local files are compared against (see `plan_sync`)
+SOURCE_SIZE_METADATA_KEY = "jlutils-source-size"
+SOURCE_ETAG_METADATA_KEY = "jlutils-source-etag"
+
+# file types which are already compressed, and are never re-compressed
+COMPRESSED_EXTENSIONS = [
+    ".7z",
+    ".avi",
+    ".bz2",
+    ".gz",
+    ".jpeg",
+    ".jpg",
+    ".mkv",
+    ".mov",
+    ".mp4",
+    ".npz",
+    ".png",
+    ".tgz",
+    ".webp",
+    ".xz",
+    ".zip",
+    ".zst",
+]
+
+# prefix of the bookkeeping files kept inside a local bucket directory.
+# These files are never uploaded
+SIDECAR_PREFIX = ".jlutils-"
+MANIFEST_FNAME = SIDECAR_PREFIX + "manifest.json"
+JOURNAL_PREFIX = SIDECAR_PREFIX + "journal-"
+
+# suffixes of the partial files left behind by interrupted downloads and sidecar
+# writes. These files are never uploaded either
+PARTIAL_SUFFIXES = [".part", ".ranges", ".tmp"]
+
 
 def fetch_aws_credentials_fpath():
     """
@@ -32,34 +200,52 @@ def fetch_aws_credentials_fpath():
     """
 
     aws_credentials_fpath = _os.path.join(_paths.secrets_dir, "aws", "credentials.yml")
-    _secrets.reveal(verbose=0)
+    if not _os.path.isfile(aws_credentials_fpath):
+        _secrets.reveal(verbose=0)
 
     return aws_credentials_fpath
 
 
-def fetch_credentials(aws_credentials_fpath=fetch_aws_credentials_fpath()):
+def fetch_credentials(aws_credentials_fpath=None):
     """
-    fetch/load the aws credentials as a dictionary
+    fetch/load the aws credentials as a dictionary. The parsed file is cached
+    in memory and is only re-read when its modification time or size changes.
     
     Args:
         aws_credentials_fpath: string. The file path to where the aws credentials
-           file are stored
+           file are stored. If None, the path is resolved via
+           `fetch_aws_credentials_fpath`
            
     Returns:
         credentials: dictionary of aws credentials
     """
 
+    if aws_credentials_fpath is None:
+        aws_credentials_fpath = fetch_aws_credentials_fpath()
+
     assert _os.path.isfile(
         aws_credentials_fpath
     ), f"The aws_credentials_fpath: {aws_credentials_fpath} does not exist"
 
-    with open(aws_credentials_fpath, "r") as f:
-        credentials = _yaml.load(f, Loader=_yaml.FullLoader)
+    stat = _os.stat(aws_credentials_fpath)
+    signature = (stat.st_mtime_ns, stat.st_size)
+
+    with _CREDENTIALS_LOCK:
+        cached = _CREDENTIALS_CACHE.get(aws_credentials_fpath)
+        if cached is not None and cached[0] == signature:
+            credentials = cached[1]
+        else:
+            with open(aws_credentials_fpath, "r") as f:
+                credentials = _yaml.load(f, Loader=_yaml.FullLoader)
+            _CREDENTIALS_CACHE[aws_credentials_fpath] = (signature, credentials)
+
+    # don't let the caller modify the cached credentials
+    credentials = _copy.deepcopy(credentials)
 
     return credentials
 
 
-def fetch_keys(namespace, aws_credentials_fpath=fetch_aws_credentials_fpath()):
+def fetch_keys(namespace, aws_credentials_fpath=None):
     """
     fetch the aws credential keys (aws_access_key_id, aws_secret_access_key) corresponding
     to the specified namespace in the credentials file.
@@ -68,7 +254,8 @@ def fetch_keys(namespace, aws_credentials_fpath=fetch_aws_credentials_fpath()):
         namespace: string. the namespace associated with the access keys. 
             Sometimes called the "profile".
         aws_credentials_fpath: string. The file path to where the aws credentials
-           file are stored
+           file are stored. If None, the path is resolved on first use via
+           `fetch_aws_credentials_fpath`
     Returns:
         aws_access_key_id: string. the aws_access_key_id string associated with the namespace.
         aws_secret_access_key: string. the aws_secret_access_key string associated with the namespace.
@@ -91,119 +278,517 @@ def fetch_keys(namespace, aws_credentials_fpath=fetch_aws_credentials_fpath()):
     return aws_access_key_id, aws_secret_access_key
 
 
+def _add_xml_header(params, **kwargs):
+    """configure the xml parser for the ListObjects requests"""
+    params["headers"]["Accept"] = "application/xml"
+
+
+def _build_connection(
+    kind, region_name, endpoint_url, keys, max_pool_connections,
+):
+    """
+    Build a new s3 client or resource (`kind`) for a single region and
+    make sure the connection is established.
+    """
+
+    aws_access_key_id, aws_secret_access_key = keys
+
+    session = _boto3.session.Session(
+        aws_access_key_id=aws_access_key_id,
+        aws_secret_access_key=aws_secret_access_key,
+        region_name=region_name,
+    )
+    config = _Config(max_pool_connections=max_pool_connections)
+
+    if kind == "client":
+        connection = session.client("s3", endpoint_url=endpoint_url, config=config)
+        s3_client = connection
+    else:
+        connection = session.resource("s3", endpoint_url=endpoint_url, config=config)
+        s3_client = connection.meta.client
+        s3_client.meta.events.unregister(
+            "before-sign.s3", _botocore.utils.fix_s3_host
+        )
+
+    # both connections list objects via `iter_objects`
+    s3_client.meta.events.register("before-call.s3.ListObjects", _add_xml_header)
+    s3_client.meta.events.register("needs-retry.s3", _report_throttle)
+
+    # Make sure the connection is established, with a probe client which gives
+    # up quickly instead of going through the default timeouts and retries
+    probe_config = _Config(
+        connect_timeout=PROBE_CONNECT_TIMEOUT,
+        read_timeout=PROBE_READ_TIMEOUT,
+        retries={"max_attempts": 1},
+    )
+    session.client("s3", endpoint_url=endpoint_url, config=probe_config).list_buckets()
+
+    # only the connections which made it through the probe take request tokens
+    limit_requests(s3_client)
+
+    return connection
+
+
+def _pooled_connection(
+    kind,
+    region_names,
+    namespace,
+    aws_credentials_fpath,
+    port,
+    max_pool_connections,
+    ttl,
+):
+    """
+    Fetch a cached s3 client or resource (`kind`) from the pool, or build one
+    for the first region in `region_names` which can be connected to.
+    The pool is keyed by (kind, namespace, credentials file, region, endpoint url,
+    pool size), and the credentials are only read when a new connection is built.
+    Concurrent calls for the same connection wait for a single build, while
+    other connections can be fetched or built meanwhile.
+
+    Regions which fail to connect are skipped for CIRCUIT_COOLDOWN seconds (their
+    circuit is open) and probed again in the background, and new connections
+    start from the last healthy region of the namespace. The pooled connections
+    of a region are dropped when its circuit opens. This state is shared with
+    other processes through a state file in REGION_HEALTH_DIR (see
+    `_load_region_health`). Failovers are timed and logged to the "fuegodata"
+    logger.
+    
+    Returns:
+        connection: the s3 client or resource
+    """
+
+    pool_keys = [
+        (
+            kind,
+            namespace,
+            aws_credentials_fpath,
+            region_name,
+            ENDPOINT_URLS[kind].format(region_name=region_name, port=port),
+            max_pool_connections,
+        )
+        for region_name in region_names
+    ]
+
+    def pooled():
+        """The highest priority connection in the pool to a healthy region, if any"""
+        now = _time.monotonic()
+        healthy_keys = [key for key in pool_keys if not _circuit_open(key[4], now)]
+        with _POOL_LOCK:
+            for pool_key in healthy_keys:
+                if pool_key in _POOL:
+                    connection, created = _POOL[pool_key]
+                    if ttl is None or now - created < ttl:
+                        return connection
+                    del _POOL[pool_key]
+        return None
+
+    connection = pooled()
+    if connection is not None:
+        return connection
+
+    with _POOL_LOCK:
+        build_lock = _BUILD_LOCKS.setdefault(tuple(pool_keys), _threading.Lock())
+
+    with build_lock:
+
+        # another thread may have built the connection while this one waited
+        connection = pooled()
+        if connection is not None:
+            return connection
+
+        keys = fetch_keys(namespace, aws_credentials_fpath)
+        _load_region_health(aws_credentials_fpath)
+        now = _time.monotonic()
+
+        # skip the regions which failed recently, and start from the last healthy
+        # region of the namespace. Regions whose circuit is open are only tried
+        # once all the others failed
+        healthy = _HEALTHY_REGIONS.get(namespace)
+        closed = [key for key in pool_keys if not _circuit_open(key[4], now)]
+        closed.sort(key=lambda key: key[3] != healthy)
+        candidates = closed + [key for key in pool_keys if key not in closed]
+
+        start = _time.monotonic()
+        for i, pool_key in enumerate(candidates):
+            region_name, endpoint_url = pool_key[3:5]
+            attempt_start = _time.monotonic()
+            try:
+                connection = _build_connection(
+                    kind, region_name, endpoint_url, keys, max_pool_connections
+                )
+                break
+
+            except Exception as e:
+                _logger.warning(
+                    f"s3 {kind} connection to region {region_name} failed after "
+                    f"{_time.monotonic() - attempt_start:.2f}s: {e!r}"
+                )
+                _record_failure(pool_key, keys)
+                if i + 1 == len(candidates):
+                    raise e
+
+        if i > 0:
+            _logger.info(
+                f"s3 {kind} failed over to region {region_name} in "
+                f"{_time.monotonic() - start:.2f}s"
+            )
+        _record_success(pool_key)
+
+        with _POOL_LOCK:
+            _POOL[pool_key] = (connection, _time.monotonic())
+
+    return connection
+
+
+def _region_health_fpath(aws_credentials_fpath):
+    """
+    The path of the region health state file of a credentials file. The state
+    is kept out of the secrets directory, in a file named after the credentials path
+    """
+    if aws_credentials_fpath is None:
+        aws_credentials_fpath = fetch_aws_credentials_fpath()
+    digest = _hashlib.sha1(
+        _os.path.abspath(aws_credentials_fpath).encode("utf-8")
+    ).hexdigest()
+    return _os.path.join(REGION_HEALTH_DIR, f"region_health-{digest[:16]}.json")
+
+
+def _load_region_health(aws_credentials_fpath):
+    """
+    Load the circuit breaker state persisted by other processes (see
+    `_save_region_health`), once per state file. The state of this process
+    takes precedence.
+    """
+
+    fpath = _region_health_fpath(aws_credentials_fpath)
+    with _HEALTH_LOCK:
+        if fpath in _HEALTH_FPATHS:
+            return
+        _HEALTH_FPATHS.add(fpath)
+
+        try:
+            with open(fpath, "r") as f:
+                state = _json.load(f)
+        except (OSError, ValueError):
+            return
+
+        for namespace, region_name in state.get("healthy", {}).items():
+            _HEALTHY_REGIONS.setdefault(namespace, region_name)
+
+        # the open circuits are stored with wall-clock times
+        offset = _time.monotonic() - _time.time()
+        for endpoint_url, health in state.get("failed", {}).items():
+            if endpoint_url in _REGION_HEALTH or health["open_until"] < _time.time():
+                continue
+            _REGION_HEALTH[endpoint_url] = {
+                "region_name": health["region_name"],
+                "failures": health["failures"],
+                "open_until": health["open_until"] + offset,
+                "timer": None,
+            }
+
+
+def _save_region_health(aws_credentials_fpath):
+    """
+    Persist the last healthy region of each namespace and the open circuits to
+    the state file of the credentials file. The file is replaced atomically,
+    and failures to write it (i.e. a read-only home directory) are ignored.
+    """
+
+    fpath = _region_health_fpath(aws_credentials_fpath)
+    offset = _time.time() - _time.monotonic()
+    with _HEALTH_LOCK:
+        state = {
+            "healthy": dict(_HEALTHY_REGIONS),
+            "failed": {
+                endpoint_url: {
+                    "region_name": health["region_name"],
+                    "failures": health["failures"],
+                    "open_until": health["open_until"] + offset,
+                }
+                for endpoint_url, health in _REGION_HEALTH.items()
+            },
+        }
+
+    tmp_fpath = f"{fpath}.{_os.getpid()}.{_threading.get_ident()}.tmp"
+    try:
+        _os.makedirs(_os.path.dirname(fpath), exist_ok=True)
+        with open(tmp_fpath, "w") as f:
+            _json.dump(state, f)
+        _os.replace(tmp_fpath, fpath)
+    except OSError as e:
+        _logger.debug(f"failed to save the region health to {fpath}: {e!r}")
+
+
+def _circuit_open(endpoint_url, now):
+    """Whether or not the circuit of the region at `endpoint_url` is open"""
+    with _HEALTH_LOCK:
+        health = _REGION_HEALTH.get(endpoint_url)
+        return health is not None and health["open_until"] > now
+
+
+def _record_failure(pool_key, keys):
+    """
+    Open the circuit of a region which failed to connect, drop its pooled
+    connections, and schedule a background probe of the region once the
+    cooldown is over.
+    """
+
+    (
+        kind,
+        namespace,
+        aws_credentials_fpath,
+        region_name,
+        endpoint_url,
+        max_pool_connections,
+    ) = pool_key
+
+    with _HEALTH_LOCK:
+        health = _REGION_HEALTH.setdefault(
+            endpoint_url, {"region_name": region_name, "failures": 0, "timer": None}
+        )
+        health["failures"] += 1
+        health["open_until"] = _time.monotonic() + CIRCUIT_COOLDOWN
+
+        if health["timer"] is None and not _REPROBES_STOPPED.is_set():
+            timer = _threading.Timer(CIRCUIT_COOLDOWN, _reprobe, args=(pool_key, keys))
+            timer.daemon = True
+            health["timer"] = timer
+            timer.start()
+
+    # the connections which were pooled before the region failed (i.e. of another
+    # kind, namespace or pool size) would keep sending requests to it
+    with _POOL_LOCK:
+        for key in [key for key in _POOL if key[3] == region_name]:
+            del _POOL[key]
+
+    _save_region_health(aws_credentials_fpath)
+
+
+def _record_success(pool_key):
+    """Close the circuit of a region, and cache it as healthy for its namespace"""
+
+    (
+        kind,
+        namespace,
+        aws_credentials_fpath,
+        region_name,
+        endpoint_url,
+        max_pool_connections,
+    ) = pool_key
+
+    with _HEALTH_LOCK:
+        health = _REGION_HEALTH.pop(endpoint_url, None)
+        if health is not None and health["timer"] is not None:
+            health["timer"].cancel()
+        changed = health is not None or _HEALTHY_REGIONS.get(namespace) != region_name
+        _HEALTHY_REGIONS[namespace] = region_name
+
+    if changed:
+        _save_region_health(aws_credentials_fpath)
+
+
+def _reprobe(pool_key, keys):
+    """
+    Background probe of a region whose circuit is open. Once the region can be
+    connected to again, its connection is added to the pool, so the next call to
+    `client`/`resource` goes back to it if it has a higher priority.
+    """
+
+    (
+        kind,
+        namespace,
+        aws_credentials_fpath,
+        region_name,
+        endpoint_url,
+        max_pool_connections,
+    ) = pool_key
+
+    with _HEALTH_LOCK:
+        health = _REGION_HEALTH.get(endpoint_url)
+        if health is None or _REPROBES_STOPPED.is_set():
+            return
+        health["timer"] = None
+
+    start = _time.monotonic()
+    try:
+        connection = _build_connection(
+            kind, region_name, endpoint_url, keys, max_pool_connections
+        )
+    except Exception as e:
+        _logger.warning(
+            f"s3 region {region_name} is still unavailable after "
+            f"{_time.monotonic() - start:.2f}s: {e!r}"
+        )
+        _record_failure(pool_key, keys)
+        return
+
+    with _POOL_LOCK:
+        _POOL.setdefault(pool_key, (connection, _time.monotonic()))
+    _record_success(pool_key)
+    _logger.info(f"s3 region {region_name} is available again")
+
+
+def region_health():
+    """
+    The state of the region circuit breaker.
+
+    Returns:
+        health: dictionary with the last "healthy" region of each namespace,
+            and for each endpoint url which failed recently, the "region_name",
+            the number of consecutive "failures" and the seconds "open_for"
+    """
+
+    now = _time.monotonic()
+    with _HEALTH_LOCK:
+        return {
+            "healthy": dict(_HEALTHY_REGIONS),
+            "failed": {
+                endpoint_url: {
+                    "region_name": health["region_name"],
+                    "failures": health["failures"],
+                    "open_for": max(0.0, health["open_until"] - now),
+                }
+                for endpoint_url, health in _REGION_HEALTH.items()
+            },
+        }
+
+
+def _cancel_reprobes():
+    """Cancel the pending background probes of the regions"""
+    with _HEALTH_LOCK:
+        for health in _REGION_HEALTH.values():
+            if health["timer"] is not None:
+                health["timer"].cancel()
+                health["timer"] = None
+
+
+def _stop_reprobes():
+    """Stop probing the regions in the background, once the interpreter exits"""
+    _REPROBES_STOPPED.set()
+    _cancel_reprobes()
+
+
+_atexit.register(_stop_reprobes)
+
+
+def reset_region_health(shared=False):
+    """
+    Close all the region circuits and forget the cached healthy regions of this
+    process. The state files loaded by this process are not loaded again.
+
+    Args:
+        shared: bool. If True, also delete the state files loaded by this process,
+            which resets the region health of all the processes sharing them
+            (see `_load_region_health`).
+    """
+    _cancel_reprobes()
+    with _HEALTH_LOCK:
+        _REGION_HEALTH.clear()
+        _HEALTHY_REGIONS.clear()
+
+        if shared:
+            for fpath in _HEALTH_FPATHS:
+                try:
+                    _os.remove(fpath)
+                except FileNotFoundError:
+                    pass
+
+
+def clear_pool():
+    """
+    Drop all the cached clients/resources, so the next call to `client`, `resource`
+    or `ClientResource` builds new connections.
+    """
+    with _POOL_LOCK:
+        _POOL.clear()
+
+
 def client(
     region_names=REGION_NAMES,
     namespace=None,
-    aws_credentials_fpath=fetch_aws_credentials_fpath(),
+    aws_credentials_fpath=None,
     port="443",
+    max_pool_connections=DEFAULT_MAX_POOL_CONNECTIONS,
+    ttl=None,
 ):
 
     """
     Instantiates a boto3 client object to interact with the s3 blob store.
+    Clients are cached per (namespace, region, endpoint), so repeated calls reuse
+    the same client and its warm http connections. Clients are thread-safe.
     
     Args:
         region_names: list of strings. The region names for which the connection will be attempted
             (note: mcqueen-test is 'store-test').
         namespace: string. The namespace of interest. call `fetch_credentials` to see the namespaces
-        aws_credentials_fpath: string. The file path to where the aws credentials
-           file are stored
+        aws_credentials_fpath: None or string. The file path to where the aws
+           credentials file are stored. If None, the default path is resolved on first use
         port: str. The port to be used for the connection
+        max_pool_connections: int. The maximum number of http connections kept
+            open by the client.
+        ttl: None or float. The number of seconds a cached client is reused for.
+            If None, cached clients are reused until `clear_pool` is called.
             
     Returns:
         s3_client. botocore.client.S3 object on which other operations may be called to interact with the blob store.
     """
 
-    aws_access_key_id, aws_secret_access_key = fetch_keys(
-        namespace, aws_credentials_fpath
+    s3_client = _pooled_connection(
+        "client",
+        region_names,
+        namespace,
+        aws_credentials_fpath,
+        port,
+        max_pool_connections,
+        ttl,
     )
 
-    _boto3.setup_default_session()
-
-    for i, region_name in enumerate(region_names):
-        try:
-            endpoint_url = f"https://{region_name}.....:{port}/"
-
-            s3_client = _boto3.client(
-                "s3",
-                region_name=region_name,
-                endpoint_url=endpoint_url,
-                aws_access_key_id=aws_access_key_id,
-                aws_secret_access_key=aws_secret_access_key,
-            )
-
-            # Make sure the connection is established
-            s3_client.list_buckets()
-
-            break
-
-        except Exception as e:
-            if i + 1 == len(region_names):
-                raise e
-            else:
-                pass
-
     return s3_client
 
 
 def resource(
     region_names=REGION_NAMES,
     namespace=None,
-    aws_credentials_fpath=fetch_aws_credentials_fpath(),
+    aws_credentials_fpath=None,
     port="443",
+    max_pool_connections=DEFAULT_MAX_POOL_CONNECTIONS,
+    ttl=None,
 ):
 
     """
     Instantiates a boto3 resource object to interact with the s3 blob store.
+    Resources are cached per (namespace, region, endpoint). Note that resources
+    are not thread-safe; use `s3_resource.meta.client` to share them across threads.
     
     Args:
         region_names: list of strings. The region names for which the connection 
             will be attempted
         namespace: string. The namespace of interest. call `fetch_credentials` to 
             see the namespaces
-        aws_credentials_fpath: string. The file path to where the aws credentials
-           file are stored
+        aws_credentials_fpath: None or string. The file path to where the aws
+           credentials file are stored. If None, the default path is resolved on first use
         port: str. The port to be used for the connection
+        max_pool_connections: int. The maximum number of http connections kept
+            open by the resource's client.
+        ttl: None or float. The number of seconds a cached resource is reused for.
+            If None, cached resources are reused until `clear_pool` is called.
         
     Returns:
         s3_resource. botocore.resource.S3 object on which other operations may be called
         to interact with the blob store.
     """
 
-    aws_access_key_id, aws_secret_access_key = fetch_keys(
-        namespace, aws_credentials_fpath
+    s3_resource = _pooled_connection(
+        "resource",
+        region_names,
+        namespace,
+        aws_credentials_fpath,
+        port,
+        max_pool_connections,
+        ttl,
     )
-    _boto3.setup_default_session()
-
-    for i, region_name in enumerate(region_names):
-        try:
-            endpoint_url = f"https://{region_name}.....com:{port}/"
-
-            s3_resource = _boto3.resource(
-                "s3",
-                region_name=region_name,
-                endpoint_url=endpoint_url,
-                aws_access_key_id=aws_access_key_id,
-                aws_secret_access_key=aws_secret_access_key,
-            )
-
-            # configure xml parser
-            def add_xml_header(params, **kwargs):
-                params["headers"]["Accept"] = "application/xml"
-
-            client = s3_resource.meta.client
-            client.meta.events.unregister("before-sign.s3", _botocore.utils.fix_s3_host)
-            client.meta.events.register("before-call.s3.ListObjects", add_xml_header)
-
-            # Make sure the connection is established
-            client.list_buckets()
-
-            break
-
-        except Exception as e:
-            if i + 1 == len(region_names):
-                raise e
-            else:
-                pass
 
     return s3_resource
 
@@ -211,18 +796,26 @@ def resource(
 def ClientResource(
     region_names=REGION_NAMES,
     namespace=None,
-    aws_credentials_fpath=fetch_aws_credentials_fpath(),
+    aws_credentials_fpath=None,
+    port="443",
+    max_pool_connections=DEFAULT_MAX_POOL_CONNECTIONS,
+    ttl=None,
 ):
     """
-    Instantiate an s3 client and rasource.
+    Instantiate an s3 client and rasource. Both are fetched from the same
+    cache as `client` and `resource`.
     
     Args:
         region_names: list of strings. The region names for which the connection 
             will be attempted
         namespace: string. The namespace of interest. call `fetch_credentials` to 
             see the namespaces
-        aws_credentials_fpath: string. The file path to where the aws credentials
-           file are stored
+        aws_credentials_fpath: None or string. The file path to where the aws
+           credentials file are stored. If None, the default path is resolved on first use
+        port: str. The port to be used for the connection
+        max_pool_connections: int. The maximum number of http connections kept
+            open by each connection.
+        ttl: None or float. The number of seconds cached connections are reused for.
             
     Returns:
         s3_client: botocore.client.S3 object on which other operations may be
@@ -232,8 +825,22 @@ def ClientResource(
         called to interact with the blob store.
 
     """
-    resource_out = resource(region_names, namespace, aws_credentials_fpath)
-    client_out = client(region_names, namespace, aws_credentials_fpath)
+    resource_out = resource(
+        region_names,
+        namespace,
+        aws_credentials_fpath,
+        port,
+        max_pool_connections,
+        ttl,
+    )
+    client_out = client(
+        region_names,
+        namespace,
+        aws_credentials_fpath,
+        port,
+        max_pool_connections,
+        ttl,
+    )
     return client_out, resource_out
 
 
@@ -250,336 +857,4102 @@ def list_buckets(s3_client):
     return buckets
 
 
-def list_objects(s3_resource, s3_bucket):
-    """
-    fetch a list of the datasets contained in the fuego_data bucket
-    """
-
-    objs = [obj.key for obj in s3_resource.Bucket(s3_bucket).objects.all()]
-    objs = [obj for obj in objs if len(_os.path.basename(obj)) > 0]
-
-    return objs
-
-
-def delete_obj(s3_client, s3_bucket, path_obj):
+def iter_objects(
+    s3_client,
+    s3_bucket,
+    prefix="",
+    delimiter=None,
+    start_after=None,
+    page_size=1000,
+    meta=False,
+):
     """
-    Delete an object in a bucket.
+    Lazily list the objects in a bucket, one page at a time. The `prefix`
+    is pushed to the server, so only the matching keys are ever listed.
     
     Args:
         s3_client: botocore.client.S3. The s3_client to be called.
-        s3_bucket: string. The bucket where the object is stored.
-        path_obj: string. The path to the object to be deleted in the bucket. (i.e. the key).
-    Returns:
-        None. The object will be deleted.
-        
+        s3_bucket: string. The bucket of interest.
+        prefix: string. Only keys starting with this prefix are listed.
+        delimiter: None or string. If passed (i.e. "/"), keys containing the
+            delimiter after the prefix are rolled up into common prefixes and
+            are not yielded.
+        start_after: None or string. Only keys which sort after this key are listed.
+        page_size: int. The number of keys requested per page (max 1000).
+        meta: boolean. Whether to yield the listing metadata for each object
+            instead of the key.
+    
+    Yields:
+        obj: string key of each object, or if `meta`, the listing dictionary
+            with the "Key", "Size", "ETag" and "LastModified" of each object
     """
-    s3_client.delete_object(Bucket=s3_bucket, Key=path_obj)
+
+    kwargs = {
+        "Bucket": s3_bucket,
+        "Prefix": prefix,
+        "PaginationConfig": {"PageSize": page_size},
+    }
+    if delimiter is not None:
+        kwargs["Delimiter"] = delimiter
+    if start_after is not None:
+        kwargs["Marker"] = start_after
+
+    paginator = s3_client.get_paginator("list_objects")
+    pages = iter(paginator.paginate(**kwargs))
+    while True:
+        with _timed("list") as record:
+            page = next(pages, None)
+            record["objects"] = 0 if page is None else len(page.get("Contents", []))
+        if page is None:
+            break
+
+        for obj in page.get("Contents", []):
+            if meta:
+                yield obj
+            else:
+                yield obj["Key"]
 
 
-def delete_all_objs(s3_resource, s3_client, s3_bucket, verbose=1):
+def list_objects(
+    s3_resource,
+    s3_bucket,
+    prefix="",
+    sharded=False,
+    max_workers=DEFAULT_MAX_WORKERS,
+    meta=False,
+):
     """
-    Delete all the objs in a s3_bucket
-    
+    fetch a list of the datasets contained in the fuego_data bucket
+
     Args:
         s3_resource: The s3_resource object to be called.
-        s3_client: botocore.client.S3. The s3_client to be called.
-        s3_bucket: string. The bucket where the object is stored.
-        verbose: print-out verbosity. If >=1, a progress bar will be added.
-            If >=1, the object path for each deleted obj will be printed
+        s3_bucket: string. The bucket of interest.
+        prefix: string. Only keys starting with this prefix are listed.
+        sharded: boolean. Whether to list the first level of common prefixes
+            under `prefix` concurrently (see `iter_objects_sharded`).
+        max_workers: int. The number of shards listed concurrently.
+        meta: boolean. Whether to return the listing metadata for each object
+            instead of the key.
+
     Returns:
-        deleted_objs: list of strings of deleted objs
+        objs: list of strings. The keys of the objects (or if `meta`, the listing
+            dictionaries), excluding directory placeholder keys
     """
-    objs = list_objects(s3_resource, s3_bucket)
-
-    if verbose >= 1:
-        try:
-            _tqdm.tqdm._instances.clear()
-        except:
-            pass
-        pbar = _tqdm.tqdm(objs)
 
-    for obj in objs:
-        if verbose >= 1:
-            pbar.update()
-        if verbose >= 2:
-            print(f"deleting obj: {obj}")
+    if sharded:
+        objs = iter_objects_sharded(
+            s3_resource.meta.client,
+            s3_bucket,
+            prefix=prefix,
+            max_workers=max_workers,
+            sort=True,
+            meta=meta,
+        )
+    else:
+        objs = iter_objects(
+            s3_resource.meta.client, s3_bucket, prefix=prefix, meta=meta
+        )
 
-        delete_obj(s3_client, s3_bucket, obj)
+    objs = [
+        obj
+        for obj in objs
+        if len(_os.path.basename(obj["Key"] if meta else obj)) > 0
+    ]
 
-    if verbose >= 1:
-        pbar.close()
+    return objs
 
-    deleted_objs = objs
 
-    return deleted_objs
+def _largest_first(sizes):
+    """
+    The indices of the `sizes`, largest first. Starting the largest transfers
+    first (longest processing time first scheduling) keeps one large straggler
+    from running alone at the end of a batch, while the small transfers fill
+    in the idle workers. Items of equal size keep their order.
+    """
+    return sorted(range(len(sizes)), key=lambda i: -sizes[i])
 
 
-def download_single_object(
-    s3_resource,
-    s3_bucket,
-    path_obj,
-    local_bucket,
-    verbose=0,
-    unzip=True,
-    ignore_missing=False,
+def thread_map(
+    fxn, items, max_workers=DEFAULT_MAX_WORKERS, pbar=None, controller=None, sizes=None
 ):
     """
-    Download a single object.
+    Apply `fxn` to each item in `items` on a bounded thread pool.
 
     Args:
-        s3_resource: The s3_resource object to be called.
-        s3_bucket: string. The s3 bucket of interest.
-        path_obj: string. The path to the object in the s3 bucket.
-        local_bucket: string. The path to where object will be downloaded.
-        verbose: int. print-out verbosity.
-        unzip: boolean. Whether or not to unzip the object (if it is a zip file)
-            after downloading
-        ignore_missing: boolean. Whether or not to ignore missing files which
-            are not found (True), or throw an error if a missing file is
-            encountered (False)
+        fxn: function. Called as `fxn(item)` for each item.
+        items: list. The items to be processed.
+        max_workers: int. The maximum number of threads. If None or <= 1,
+            the items are processed serially in the calling thread.
+        pbar: None or tqdm.tqdm. If passed, the progress bar is updated
+            each time an item finishes.
+        controller: None or ConcurrencyController. If passed, the number of
+            items processed at once follows the controller's limit, and
+            `max_workers` is replaced by its `max_concurrency`.
+        sizes: None or list of numbers. The size (i.e. bytes) of each item. If
+            passed, the largest items are started first (see `_largest_first`).
 
     Returns:
-        local_path_obj: str. The local path to the downloaded obj
+        outputs: list. The outputs of `fxn`, in the same order as `items`
     """
 
-    local_bucket = str(local_bucket)
-
-    trys = 0
-    data_returned = False
-    while (
-        data_returned == False or trys <= 2
-    ):  # Try pulling data 2 times if download fails
+    outputs = [None] * len(items)
 
-        local_subfolder = _os.path.join(local_bucket, _os.path.dirname(path_obj))
-        if verbose >= 2 and trys == 0:
-            print("local_subfolder:", local_subfolder)
+    if controller is not None:
+        fxn = _controlled(fxn, controller)
+        max_workers = controller.max_concurrency
 
-        local_path_obj = _os.path.join(local_subfolder, _os.path.basename(path_obj))
-        if verbose >= 3 and trys == 0:
-            print("local_path_obj:", local_path_obj)
+    if max_workers is None or max_workers <= 1:
+        for i, item in enumerate(items):
+            outputs[i] = fxn(item)
+            if pbar is not None:
+                pbar.update()
+        return outputs
 
-        if not _os.path.isdir(local_subfolder):
-            _os.makedirs(local_subfolder)
+    order = range(len(items)) if sizes is None else _largest_first(sizes)
 
-        if verbose >= 1:
-            print("\t", path_obj, end="\r")
-
-        trys += 1
+    with _ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # the pool starts the submitted items in order
+        futures = {executor.submit(fxn, items[i]): i for i in order}
         try:
-            s3_resource.Bucket(s3_bucket).download_file(path_obj, local_path_obj)
-            data_returned = True
-        except Exception as e:
-            if "max retries" in str(e):
-                pass
-            elif "Not Found" in str(e):
-                if ignore_missing:
-                    _warnings.warn(path_obj + " Not Found")
-                    break
-                else:
-                    raise
-            else:
-                raise
-    if data_returned:
-        if unzip and ".zip" in local_path_obj:
-            local_path_obj = _zipper.unzip_file(local_path_obj)
-    else:
-        local_path_obj = None
+            for future in _as_completed(futures):
+                outputs[futures[future]] = future.result()
+                if pbar is not None:
+                    pbar.update()
+        except BaseException:
+            # don't start any queued work once one of the items has failed
+            for future in futures:
+                future.cancel()
+            raise
 
-    return local_path_obj
+    return outputs
 
 
-def download_objs(
-    s3_resource,
-    s3_bucket,
-    objs,
-    local_bucket,
-    unzip=True,
-    overwrite=False,
-    ignore_missing=False,
+def thread_imap(
+    fxn, items, max_workers=DEFAULT_MAX_WORKERS, max_pending=None, controller=None
 ):
     """
-    Download a multiple objects (`objs`)
+    Lazily apply `fxn` to each item in `items` on a bounded thread pool,
+    yielding the outputs as they complete. Items are only pulled from `items`
+    as capacity frees up, so `items` may be an arbitrarily long generator.
 
     Args:
-        s3_resource: The s3_resource object to be called.
-        s3_bucket: string. The s3 bucket of interest.
-        obj: list of strings. The paths to the objects in the s3 bucket.
-        local_bucket: string. The path to where objects will be downloaded.
-        verbose: int. print-out verbosity.
-        unzip: boolean. Whether or not to unzip the object (if it is a zip file)
-            after downloading
-        overwrite: boolean. Whether or not to overwrite the existing objects if
-            they are already present locally
-        ignore_missing: boolean. Whether or not to ignore missing files which
-            are not found (True), or throw an error if a missing file is
-            encountered (False)
-
-    Returns:
-        fpaths: str. The local filepaths paths to the downloaded objs
+        fxn: function. Called as `fxn(item)` for each item.
+        items: iterable. The items to be processed.
+        max_workers: int. The maximum number of threads. If None or <= 1,
+            the items are processed serially in the calling thread.
+        max_pending: None or int. The maximum number of submitted items which
+            have not been yielded yet. Defaults to 2 * max_workers.
+        controller: None or ConcurrencyController. If passed, the number of
+            items processed at once follows the controller's limit, and
+            `max_workers` is replaced by its `max_concurrency`.
+
+    Yields:
+        output: The output of `fxn` for each item, in completion order
     """
 
-    try:
-        _tqdm.tqdm._instances.clear()
-    except:
-        pass
-    pbar = _tqdm.tqdm(objs)
+    if controller is not None:
+        fxn = _controlled(fxn, controller)
+        max_workers = controller.max_concurrency
 
-    fpaths = []
-    for obj in objs:
+    if max_workers is None or max_workers <= 1:
+        for item in items:
+            yield fxn(item)
+        return
 
-        pbar.update()
+    if max_pending is None:
+        max_pending = 2 * max_workers
 
-        # Check if the track is already in ACI object store, otherwise download the obj
-        fpath = _os.path.join(local_bucket, obj)
-        if overwrite or _os.path.exists(fpath) == False:
+    with _ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = set()
+        try:
+            for item in items:
+                pending.add(executor.submit(fxn, item))
+                if len(pending) >= max_pending:
+                    done, pending = _wait(pending, return_when=_FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
 
-            fpath = download_single_object(
-                s3_resource,
-                s3_bucket,
-                obj,
-                local_bucket,
-                verbose=0,
-                unzip=unzip,
-                ignore_missing=ignore_missing,
-            )
+            while pending:
+                done, pending = _wait(pending, return_when=_FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
 
-        if not fpath == None:
-            fpaths.append(fpath)
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            raise
 
-    pbar.close()
 
-    return fpaths
+def _batches(items, batch_size):
+    """Lazily group the `items` iterable into lists of up to `batch_size` items"""
 
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
 
-def upload_single_object(s3_client, s3_bucket, local_fpath, bucket_subdir, verbose=0):
-    """
-    Upload a single object.
+    if len(batch) > 0:
+        yield batch
 
+
+def _list_level(s3_client, s3_bucket, prefix, delimiter, page_size, meta):
+    """
+    List a single level of the key hierarchy under `prefix`.
+
+    Returns:
+        objs: list. The keys (or listing dictionaries if `meta`) directly under `prefix`
+        prefixes: list of strings. The common prefixes directly under `prefix`
+    """
+
+    objs = []
+    prefixes = []
+
+    paginator = s3_client.get_paginator("list_objects")
+    for page in paginator.paginate(
+        Bucket=s3_bucket,
+        Prefix=prefix,
+        Delimiter=delimiter,
+        PaginationConfig={"PageSize": page_size},
+    ):
+        for obj in page.get("Contents", []):
+            objs.append(obj if meta else obj["Key"])
+        prefixes += [common["Prefix"] for common in page.get("CommonPrefixes", [])]
+
+    # a common prefix may be repeated across pages
+    prefixes = sorted(set(prefixes))
+
+    return objs, prefixes
+
+
+def list_prefixes(s3_client, s3_bucket, prefix="", delimiter="/"):
+    """
+    List the common prefixes (i.e. the "subfolders") directly under a prefix.
+    
+    Args:
+        s3_client: botocore.client.S3. The s3_client to be called.
+        s3_bucket: string. The bucket of interest.
+        prefix: string. The parent prefix.
+        delimiter: string. The delimiter which separates the levels of the keys.
+    
+    Returns:
+        prefixes: list of strings. The common prefixes, ending with the delimiter
+    """
+
+    objs, prefixes = _list_level(s3_client, s3_bucket, prefix, delimiter, 1000, False)
+
+    return prefixes
+
+
+def _discover_shards(
+    s3_client, s3_bucket, prefix, delimiter, depth, max_workers, page_size, meta
+):
+    """
+    Walk `depth` levels of the key hierarchy under `prefix` to find the shards
+    (common prefixes) which can be listed independently.
+
+    Returns:
+        shards: list of strings. The prefixes which still need to be listed
+        objs: list. The keys (or listing dictionaries) found above the shards
+    """
+
+    shards = [prefix]
+    objs = []
+
+    for level in range(depth):
+        results = thread_map(
+            lambda shard: _list_level(
+                s3_client, s3_bucket, shard, delimiter, page_size, meta
+            ),
+            shards,
+            max_workers,
+        )
+
+        shards = []
+        for level_objs, level_prefixes in results:
+            objs += level_objs
+            shards += level_prefixes
+
+        if len(shards) == 0:
+            break
+
+    return shards, objs
+
+
+def _put_until(q, item, stop):
+    """
+    Put `item` on the queue `q`, giving up once the `stop` event is set.
+
+    Returns:
+        put: boolean. Whether or not the item was put on the queue
+    """
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except _queue.Full:
+            pass
+    return False
+
+
+def iter_objects_sharded(
+    s3_client,
+    s3_bucket,
+    prefix="",
+    delimiter="/",
+    depth=1,
+    max_workers=DEFAULT_MAX_WORKERS,
+    sort=False,
+    page_size=1000,
+    meta=False,
+):
+    """
+    Lazily list the objects under a prefix by listing its shards concurrently.
+    The shards are the common prefixes found `depth` levels below `prefix`
+    (i.e. the store/camera/date "subfolders"), and each shard is listed with
+    its own paginated cursor. The results are merged into a single stream.
+    
+    Args:
+        s3_client: botocore.client.S3. The s3_client to be called.
+        s3_bucket: string. The bucket of interest.
+        prefix: string. Only keys starting with this prefix are listed.
+        delimiter: string. The delimiter which separates the levels of the keys.
+        depth: int. The number of levels walked to discover the shards.
+        max_workers: int. The number of shards listed concurrently.
+        sort: boolean. Whether to yield the keys in sorted order (like
+            `iter_objects`) instead of as soon as each page arrives.
+        page_size: int. The number of keys requested per page.
+        meta: boolean. Whether to yield the listing metadata for each object
+            instead of the key.
+    
+    Yields:
+        obj: string key of each object, or if `meta`, the listing dictionary.
+            Closing the generator early stops the shards after their current page.
+    """
+
+    def obj_key(obj):
+        return obj["Key"] if meta else obj
+
+    shards, objs = _discover_shards(
+        s3_client, s3_bucket, prefix, delimiter, depth, max_workers, page_size, meta
+    )
+
+    if len(shards) == 0:
+        for obj in sorted(objs, key=obj_key) if sort else objs:
+            yield obj
+        return
+
+    stop = _threading.Event()
+    if sort:
+        queues = [_queue.Queue(maxsize=2) for shard in shards]
+    else:
+        queues = [_queue.Queue(maxsize=2 * max_workers)] * len(shards)
+
+    def list_shard(i):
+        # once the generator is closed, the shards stop listing before their next
+        # page, so closing it early doesn't list the rest of the bucket
+        try:
+            page = []
+            for obj in iter_objects(
+                s3_client, s3_bucket, prefix=shards[i], page_size=page_size, meta=meta
+            ):
+                if stop.is_set():
+                    return
+                page.append(obj)
+                if len(page) == page_size:
+                    if not _put_until(queues[i], page, stop):
+                        return
+                    page = []
+            if len(page) > 0 and not _put_until(queues[i], page, stop):
+                return
+            _put_until(queues[i], None, stop)
+        except BaseException as e:
+            _put_until(queues[i], e, stop)
+
+    executor = _ThreadPoolExecutor(max_workers=max_workers)
+    futures = [executor.submit(list_shard, i) for i in range(len(shards))]
+    try:
+        if sort:
+            # the shards and the keys found above them cover disjoint key ranges,
+            # so sorting them as blocks sorts the keys. The shards are submitted
+            # in this order, so the shard being drained has always been started
+            blocks = [(shard, i) for i, shard in enumerate(shards)]
+            blocks += [(obj_key(obj), obj) for obj in objs]
+            for block_key, block in sorted(blocks, key=lambda block: block[0]):
+                if not isinstance(block, int):
+                    yield block
+                    continue
+                while True:
+                    page = queues[block].get()
+                    if page is None:
+                        break
+                    if isinstance(page, BaseException):
+                        raise page
+                    for obj in page:
+                        yield obj
+        else:
+            for obj in objs:
+                yield obj
+            n_done = 0
+            while n_done < len(shards):
+                page = queues[0].get()
+                if page is None:
+                    n_done += 1
+                    continue
+                if isinstance(page, BaseException):
+                    raise page
+                for obj in page:
+                    yield obj
+    finally:
+        stop.set()
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def delete_obj(s3_client, s3_bucket, path_obj):
+    """
+    Delete an object in a bucket.
+    
+    Args:
+        s3_client: botocore.client.S3. The s3_client to be called.
+        s3_bucket: string. The bucket where the object is stored.
+        path_obj: string. The path to the object to be deleted in the bucket. (i.e. the key).
+    Returns:
+        None. The object will be deleted.
+        
+    """
+    s3_client.delete_object(Bucket=s3_bucket, Key=path_obj)
+
+
+class DeleteError(RuntimeError):
+    """
+    Raised by the helpers which delete objects when some of the objects failed
+    to be deleted. The full list of failures is kept on the exception, so the
+    failed keys can be retried or reported.
+
+    Args:
+        errors: list of dictionaries with the "Key", "Code" and "Message" of
+            each object which failed to be deleted, as returned by `delete_objs`.
+        n_deleted: int. The number of objects which were deleted.
+    """
+
+    def __init__(self, errors, n_deleted):
+        self.errors = errors
+        self.n_deleted = n_deleted
+        codes = sorted(set(str(error["Code"]) for error in errors))
+        super().__init__(
+            f"Failed to delete {len(errors)} objs ({n_deleted} deleted), "
+            f"error codes: {codes}. See the `errors` of the exception."
+        )
+
+
+def delete_objs(
+    s3_client,
+    s3_bucket,
+    objs,
+    max_workers=DEFAULT_MAX_WORKERS,
+    batch_size=DELETE_BATCH_SIZE,
+    verbose=0,
+    pbar=None,
+    controller=None,
+    callback=None,
+):
+    """
+    Delete multiple objects using batched DeleteObjects requests which are
+    issued concurrently. The `objs` are consumed lazily, so at most
+    `2 * max_workers` batches of keys are held in memory at once, and the
+    deleted keys are only counted (pass `callback` to receive them).
+    
+    Args:
+        s3_client: botocore.client.S3. The s3_client to be called.
+        s3_bucket: string. The bucket where the objects are stored.
+        objs: iterable of strings. The paths to the objects to be deleted
+            (i.e. the keys). May be a generator.
+        max_workers: int. The number of batches deleted concurrently.
+        batch_size: int. The number of keys per request (max 1000).
+        verbose: int. print-out verbosity. If >=2, the object path for each
+            deleted obj will be printed
+        pbar: None or tqdm.tqdm. If passed, the progress bar is advanced by
+            the number of keys in each completed batch.
+        controller: None or ConcurrencyController. If passed, the number of
+            concurrent batches follows the controller's adaptive limit instead
+            of `max_workers`.
+        callback: None or function. If passed, called as `callback(deleted_objs)`
+            with the list of keys deleted by each batch.
+        
+    Returns:
+        n_deleted: int. The number of deleted objs
+        errors: list of dictionaries with the "Key", "Code" and "Message"
+            of each object which failed to be deleted
+    """
+
+    def delete_batch(keys):
+        with _timed("delete", objects=len(keys)):
+            response = s3_client.delete_objects(
+                Bucket=s3_bucket,
+                Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True},
+            )
+        return keys, response.get("Errors", [])
+
+    n_deleted = 0
+    errors = []
+    for keys, batch_errors in thread_imap(
+        delete_batch, _batches(objs, batch_size), max_workers, controller=controller
+    ):
+        failed = set(error["Key"] for error in batch_errors)
+        batch_deleted = [key for key in keys if key not in failed]
+
+        if verbose >= 2:
+            for key in batch_deleted:
+                print(f"deleted obj: {key}")
+
+        n_deleted += len(batch_deleted)
+        if callback is not None:
+            callback(batch_deleted)
+        errors += [
+            {
+                "Key": error["Key"],
+                "Code": error.get("Code"),
+                "Message": error.get("Message"),
+            }
+            for error in batch_errors
+        ]
+
+        if pbar is not None:
+            pbar.update(len(keys))
+
+    return n_deleted, errors
+
+
+def delete_all_objs(
+    s3_resource,
+    s3_client,
+    s3_bucket,
+    verbose=1,
+    max_workers=DEFAULT_MAX_WORKERS,
+    sharded=False,
+    controller=None,
+    callback=None,
+):
+    """
+    Delete all the objs in a s3_bucket. The keys are streamed from the
+    paginated bucket listing straight into batched DeleteObjects requests,
+    so the full key list is never held in memory.
+    
+    Args:
+        s3_resource: The s3_resource object to be called.
+        s3_client: botocore.client.S3. The s3_client to be called.
+        s3_bucket: string. The bucket where the object is stored.
+        verbose: print-out verbosity. If >=1, a progress bar will be added.
+            If >=2, the object path for each deleted obj will be printed
+        max_workers: int. The number of batches deleted concurrently.
+        sharded: boolean. Whether to list the top-level prefixes of the bucket
+            concurrently (see `iter_objects_sharded`).
+        controller: None or ConcurrencyController. If passed, the number of
+            concurrent batches follows the controller's adaptive limit instead
+            of `max_workers`.
+        callback: None or function. If passed, called as `callback(deleted_objs)`
+            with the list of keys deleted by each batch.
+    Returns:
+        n_deleted: int. The number of deleted objs. Note that the deleted objs
+            are no longer returned as a list, use `callback` to collect them.
+            A DeleteError with the failed keys is raised if any of the objs
+            failed to be deleted.
+    """
+    if sharded:
+        objs = iter_objects_sharded(
+            s3_resource.meta.client, s3_bucket, max_workers=max_workers
+        )
+    else:
+        objs = iter_objects(s3_resource.meta.client, s3_bucket)
+
+    pbar = None
+    if verbose >= 1:
+        try:
+            _tqdm.tqdm._instances.clear()
+        except:
+            pass
+        pbar = _tqdm.tqdm(unit="obj")
+
+    try:
+        n_deleted, errors = delete_objs(
+            s3_client,
+            s3_bucket,
+            objs,
+            max_workers=max_workers,
+            verbose=verbose,
+            pbar=pbar,
+            controller=controller,
+            callback=callback,
+        )
+    finally:
+        if pbar is not None:
+            pbar.close()
+
+    if len(errors) > 0:
+        raise DeleteError(errors, n_deleted)
+
+    return n_deleted
+
+
+class RetryPolicy:
+    """
+    Retry policy for the transfer helpers: failed requests are retried with
+    exponential backoff and full jitter, i.e. before retry `n` the caller sleeps
+    for a random time between 0 and `min(max_delay, base_delay * 2 ** n)` seconds.
+
+    Args:
+        max_attempts: int. The maximum number of attempts (including the first one).
+        base_delay: float. The backoff delay (seconds) before the first retry.
+        max_delay: float. The maximum backoff delay (seconds).
+    """
+
+    def __init__(self, max_attempts=5, base_delay=0.5, max_delay=30.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt):
+        """The backoff delay (seconds) before retrying after `attempt` failures"""
+        return _random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def is_retryable(self, error):
+        """Whether or not `error` is a transient error worth retrying"""
+
+        if isinstance(error, _botocore_exceptions.ClientError):
+            return _error_code(error) in RETRYABLE_ERROR_CODES
+
+        return isinstance(error, RETRYABLE_ERRORS)
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
+
+
+def _error_code_of(response):
+    """The error code (i.e. "404", "SlowDown") of a parsed s3 response"""
+    return str(response.get("Error", {}).get("Code"))
+
+
+def _error_code(error):
+    """The error code (i.e. "404", "SlowDown") of a botocore ClientError"""
+    return _error_code_of(error.response)
+
+
+def _is_not_found(error):
+    """Whether or not `error` is a botocore ClientError for a missing object"""
+    return isinstance(
+        error, _botocore_exceptions.ClientError
+    ) and _error_code(error) in ["404", "NoSuchKey", "NotFound"]
+
+
+# errors which signal that the store is overloaded, and the concurrency should
+# be cut (see `ConcurrencyController`)
+THROTTLE_ERROR_CODES = [
+    "503",
+    "RequestTimeout",
+    "ServiceUnavailable",
+    "SlowDown",
+    "Throttling",
+    "ThrottlingException",
+]
+THROTTLE_ERRORS = (
+    _botocore_exceptions.ConnectTimeoutError,
+    _botocore_exceptions.ReadTimeoutError,
+    _urllib3.exceptions.ReadTimeoutError,
+    TimeoutError,
+)
+
+# the controller of the transfer running in the current thread, if any
+_CONTROLLER_LOCAL = _threading.local()
+
+# the controllers with transfers in flight, which are told about the throttles
+# retried by botocore in threads without a controller (see `_report_throttle`)
+_ACTIVE_CONTROLLERS = set()
+_ACTIVE_CONTROLLERS_LOCK = _threading.Lock()
+
+
+class ConcurrencyController:
+    """
+    Adaptive (AIMD) concurrency limit for the transfer helpers. The number of
+    transfers in flight is bounded by `limit`, which is re-evaluated every
+    `interval` seconds: it grows by `increase` while the throughput keeps rising
+    and the limit is being used, and is multiplied by `decrease` (at most once
+    per interval) when a throttling or timeout error is seen. The limit stays
+    within [`min_concurrency`, `max_concurrency`].
+
+    Pass the same controller to several helpers (i.e. `download_objs` and
+    `upload_objs`) to share one limit across them. `throughput` reports the
+    live rate.
+
+    Args:
+        min_concurrency: int. The lower bound of the limit.
+        max_concurrency: int. The upper bound of the limit, and the number of
+            threads used by the helpers.
+        initial_concurrency: None or int. The starting limit. Defaults to
+            `min_concurrency`.
+        increase: int. The additive increase of the limit.
+        decrease: float. The multiplicative decrease of the limit.
+        interval: float. The length (seconds) of the measurement window.
+    """
+
+    def __init__(
+        self,
+        min_concurrency=1,
+        max_concurrency=64,
+        initial_concurrency=None,
+        increase=1,
+        decrease=0.5,
+        interval=1.0,
+    ):
+        assert 1 <= min_concurrency <= max_concurrency
+
+        if initial_concurrency is None:
+            initial_concurrency = min_concurrency
+
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.increase = increase
+        self.decrease = decrease
+        self.interval = interval
+
+        self.limit = max(min_concurrency, min(max_concurrency, initial_concurrency))
+        self.in_flight = 0
+        self.throttles = 0
+
+        self._cond = _threading.Condition()
+        self._window_start = _time.monotonic()
+        self._window_ops = 0
+        self._window_bytes = 0
+        self._window_peak = 0
+        self._window_throttled = False
+        self._last_decrease = None
+        self._prev_rate = None
+        self._rates = (0.0, 0.0)
+
+    def is_throttle(self, error):
+        """Whether or not `error` signals that the store is overloaded"""
+
+        if isinstance(error, _botocore_exceptions.ClientError):
+            return _error_code(error) in THROTTLE_ERROR_CODES
+
+        return isinstance(error, THROTTLE_ERRORS)
+
+    def acquire(self):
+        """Block until a transfer may start under the current limit"""
+        with self._cond:
+            while self.in_flight >= self.limit:
+                self._cond.wait()
+            self.in_flight += 1
+            self._window_peak = max(self._window_peak, self.in_flight)
+            if self.in_flight == 1:
+                with _ACTIVE_CONTROLLERS_LOCK:
+                    _ACTIVE_CONTROLLERS.add(self)
+
+    def release(self):
+        """Record the end of a transfer started with `acquire`"""
+        with self._cond:
+            self.in_flight -= 1
+            if self.in_flight == 0:
+                with _ACTIVE_CONTROLLERS_LOCK:
+                    _ACTIVE_CONTROLLERS.discard(self)
+            self._window_ops += 1
+            self._update()
+            self._cond.notify_all()
+
+    def add_bytes(self, nbytes):
+        """Record `nbytes` transferred"""
+        with self._cond:
+            self._window_bytes += nbytes
+
+    def on_error(self, error):
+        """
+        Record a failed request, and cut the limit if `error` is a throttling error.
+
+        Returns:
+            throttled: boolean. Whether or not `error` is a throttling error
+        """
+
+        if not self.is_throttle(error):
+            return False
+
+        with self._cond:
+            self.throttles += 1
+            self._window_throttled = True
+
+            now = _time.monotonic()
+            if self._last_decrease is None or now - self._last_decrease >= self.interval:
+                self.limit = max(self.min_concurrency, int(self.limit * self.decrease))
+                self._last_decrease = now
+                self._prev_rate = None
+
+        return True
+
+    def _update(self):
+        """Close the measurement window once it is `interval` long. Holds the lock"""
+
+        now = _time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed < self.interval:
+            return
+
+        ops_rate = self._window_ops / elapsed
+        bytes_rate = self._window_bytes / elapsed
+        self._rates = (ops_rate, bytes_rate)
+
+        # compare bytes when they are reported, since the transfers vary in size
+        rate = bytes_rate if self._window_bytes > 0 else ops_rate
+        if (
+            not self._window_throttled
+            and self._window_peak >= self.limit
+            and (self._prev_rate is None or rate >= self._prev_rate)
+        ):
+            self.limit = min(self.max_concurrency, self.limit + self.increase)
+
+        if not self._window_throttled:
+            self._prev_rate = rate
+
+        self._window_start = now
+        self._window_ops = 0
+        self._window_bytes = 0
+        self._window_peak = self.in_flight
+        self._window_throttled = False
+
+    def throughput(self):
+        """
+        The live state of the controller.
+
+        Returns:
+            throughput: dictionary with the current "limit", the number of
+                transfers "in_flight", the "ops_per_sec" and "bytes_per_sec"
+                of the last measurement window, and the number of "throttles"
+        """
+        with self._cond:
+            return {
+                "limit": self.limit,
+                "in_flight": self.in_flight,
+                "ops_per_sec": self._rates[0],
+                "bytes_per_sec": self._rates[1],
+                "throttles": self.throttles,
+            }
+
+    @_contextlib.contextmanager
+    def slot(self):
+        """
+        Context manager which holds a transfer slot. Errors raised in the block,
+        and the errors retried within it by the transfer helpers, are reported
+        to `on_error`.
+        """
+
+        self.acquire()
+        previous = getattr(_CONTROLLER_LOCAL, "controller", None)
+        _CONTROLLER_LOCAL.controller = self
+        try:
+            yield self
+        except Exception as e:
+            if not _already_reported(e):
+                self.on_error(e)
+            raise
+        finally:
+            _CONTROLLER_LOCAL.controller = previous
+            self.release()
+
+
+def _active_controller():
+    """The controller of the transfer running in the current thread, if any"""
+    return getattr(_CONTROLLER_LOCAL, "controller", None)
+
+
+def _already_reported(error):
+    """
+    Whether or not `error` was raised from the last response which
+    `_report_throttle` reported in the current thread
+    """
+
+    reported = getattr(_CONTROLLER_LOCAL, "reported", None)
+    if reported is None:
+        return False
+
+    if isinstance(error, _botocore_exceptions.ClientError):
+        return error.response is reported
+
+    return error is reported
+
+
+def _report_throttle(response=None, caught_exception=None, operation=None, **kwargs):
+    """
+    Report each throttled attempt of a request to the controller of the current
+    thread, or, in threads without a controller (i.e. the s3transfer threads of
+    `upload_file`), to every controller with transfers in flight. botocore
+    retries these attempts internally, so the transfer helpers never see them.
+
+    Registered on the "needs-retry" event by `_build_connection`. Returns None,
+    so the retry decision is left to botocore.
+    """
+
+    if caught_exception is not None:
+        if not isinstance(caught_exception, THROTTLE_ERRORS):
+            return None
+        error = reported = caught_exception
+    elif response is not None:
+        reported = response[1]
+        if _error_code_of(reported) not in THROTTLE_ERROR_CODES:
+            return None
+        error = _botocore_exceptions.ClientError(reported, operation.name)
+    else:
+        return None
+
+    controller = _active_controller()
+    if controller is not None:
+        controllers = [controller]
+    else:
+        with _ACTIVE_CONTROLLERS_LOCK:
+            controllers = list(_ACTIVE_CONTROLLERS)
+
+    _CONTROLLER_LOCAL.reported = reported
+    for controller in controllers:
+        controller.on_error(error)
+
+    return None
+
+
+def _note_error(error):
+    """
+    Report a retried error to the controller of the current thread, if any,
+    and to the active TransferStats
+    """
+    controller = _active_controller()
+    if controller is not None and not _already_reported(error):
+        controller.on_error(error)
+
+    if len(_STATS_COLLECTORS) > 0:
+        _STATS_LOCAL.retries = getattr(_STATS_LOCAL, "retries", 0) + 1
+        with _STATS_LOCK:
+            collectors = list(_STATS_COLLECTORS)
+        for stats in collectors:
+            stats.record_retry(error)
+
+
+def _controlled(fxn, controller):
+    """Wrap `fxn(item)` so each call holds a slot of the `controller`"""
+
+    def controlled_fxn(item):
+        with controller.slot():
+            return fxn(item)
+
+    return controlled_fxn
+
+
+class RateLimiter:
+    """
+    Token-bucket limits on the bandwidth and request rate of the transfer helpers,
+    shared by all of their threads. Each limit refills at its rate and holds up to
+    `burst_seconds` worth of tokens, and the threads which run out of tokens wait
+    for the bucket to refill. A transfer larger than the bucket borrows against
+    the following ones, so the average rate is kept.
+
+    The rates can be changed at any time (i.e. from a scheduler thread) via
+    `set_rates`, and the waiting threads pick up the new rates immediately.
+
+    The helpers use the module-level `RATE_LIMITER` (see `set_rate_limits`). The
+    bytes are counted by the helpers of this module and of `s3async` as they are
+    read from, or sent to, the network. The requests are counted as they are
+    sent, retries included, by the clients of `client`, `resource`,
+    `ClientResource` and `s3async.aclient` only: clients built otherwise (i.e.
+    passed to the helpers by the caller) must be passed to `limit_requests`.
+    The time spent waiting is reported to the active TransferStats.
+
+    Args:
+        bytes_per_sec: None or number. The bandwidth limit. If None, unlimited.
+        requests_per_sec: None or number. The request rate limit. If None, unlimited.
+        burst_seconds: float. The number of seconds of tokens each bucket holds.
+    """
+
+    def __init__(self, bytes_per_sec=None, requests_per_sec=None, burst_seconds=1.0):
+
+        self.burst_seconds = burst_seconds
+
+        self._cond = _threading.Condition()
+        self._buckets = {
+            "bytes": {"rate": None, "tokens": 0.0, "last": _time.monotonic()},
+            "requests": {"rate": None, "tokens": 0.0, "last": _time.monotonic()},
+        }
+
+        self.set_rates(bytes_per_sec, requests_per_sec)
+
+    def _capacity(self, bucket):
+        """The maximum number of tokens of a bucket"""
+        return max(1.0, bucket["rate"] * self.burst_seconds)
+
+    def _refill(self, bucket, now):
+        """Add the tokens accumulated since the last refill to the bucket"""
+
+        if bucket["rate"] is not None:
+            bucket["tokens"] = min(
+                self._capacity(bucket),
+                bucket["tokens"] + (now - bucket["last"]) * bucket["rate"],
+            )
+        bucket["last"] = now
+
+    def set_rates(self, bytes_per_sec=None, requests_per_sec=None):
+        """
+        Change the limits. None removes a limit.
+
+        Args:
+            bytes_per_sec: None or number. The bandwidth limit.
+            requests_per_sec: None or number. The request rate limit.
+        """
+
+        with self._cond:
+            now = _time.monotonic()
+            for kind, rate in [("bytes", bytes_per_sec), ("requests", requests_per_sec)]:
+                assert rate is None or rate > 0, f"invalid {kind} rate: {rate}"
+                bucket = self._buckets[kind]
+                self._refill(bucket, now)
+                if rate is not None and bucket["rate"] is None:
+                    # a new limit starts with a full bucket
+                    bucket["tokens"] = rate * self.burst_seconds
+                bucket["rate"] = None if rate is None else float(rate)
+                if rate is not None:
+                    bucket["tokens"] = min(bucket["tokens"], self._capacity(bucket))
+
+            # wake the waiting threads up, so they wait for the new rates instead
+            self._cond.notify_all()
+
+    def rates(self):
+        """
+        The current limits.
+
+        Returns:
+            rates: dictionary with the "bytes_per_sec" and "requests_per_sec"
+        """
+        with self._cond:
+            return {
+                "bytes_per_sec": self._buckets["bytes"]["rate"],
+                "requests_per_sec": self._buckets["requests"]["rate"],
+            }
+
+    def consume(self, kind, amount=1):
+        """
+        Take `amount` tokens from a bucket, waiting for it to refill if needed.
+
+        Args:
+            kind: string. "bytes" or "requests".
+            amount: number. The number of bytes or requests.
+        """
+
+        if amount <= 0:
+            return
+
+        bucket = self._buckets[kind]
+        start = None
+        with self._cond:
+            while True:
+                wait = self._take(bucket, amount)
+                if wait == 0:
+                    break
+                if start is None:
+                    start = _time.monotonic()
+                self._cond.wait(wait)
+
+        if start is not None:
+            _emit_wait(kind, _time.monotonic() - start)
+
+    async def aconsume(self, kind, amount=1):
+        """
+        Counterpart of `consume` for coroutines, which sleep instead of blocking
+        the event loop while the bucket refills.
+
+        Args:
+            kind: string. "bytes" or "requests".
+            amount: number. The number of bytes or requests.
+        """
+
+        if amount <= 0:
+            return
+
+        bucket = self._buckets[kind]
+        start = None
+        while True:
+            with self._cond:
+                wait = self._take(bucket, amount)
+            if wait == 0:
+                break
+            if start is None:
+                start = _time.monotonic()
+            # wake up at least every second, to pick up new rates
+            await _asyncio.sleep(min(wait, 1.0))
+
+        if start is not None:
+            _emit_wait(kind, _time.monotonic() - start)
+
+    def _take(self, bucket, amount):
+        """
+        Take `amount` tokens from a bucket if it holds enough of them. Called
+        under the lock.
+
+        Returns:
+            wait: float. 0 if the tokens were taken (or the bucket is unlimited),
+                else the seconds until the bucket holds enough of them
+        """
+
+        if bucket["rate"] is None:
+            return 0
+
+        self._refill(bucket, _time.monotonic())
+
+        # amounts larger than the bucket are let through once it is full,
+        # leaving it in debt
+        needed = min(amount, self._capacity(bucket))
+        if bucket["tokens"] >= needed:
+            bucket["tokens"] -= amount
+            return 0
+
+        return (needed - bucket["tokens"]) / bucket["rate"]
+
+    def consume_bytes(self, amount):
+        """Take `amount` bytes, i.e. as an s3transfer `Callback`"""
+        self.consume("bytes", amount)
+
+
+# the limits shared by all of the transfer helpers
+RATE_LIMITER = RateLimiter()
+
+
+def set_rate_limits(bytes_per_sec=None, requests_per_sec=None):
+    """
+    Limit the bandwidth and request rate of all of the transfer helpers, i.e.
+    to keep a shared uplink free for other traffic. Can be called at any time,
+    including while transfers are running. See `RateLimiter`.
+
+        set_rate_limits(bytes_per_sec=2 * MB, requests_per_sec=50)  # day
+        set_rate_limits()  # night, unlimited
+
+    Args:
+        bytes_per_sec: None or number. The bandwidth limit. If None, unlimited.
+        requests_per_sec: None or number. The request rate limit. If None, unlimited.
+    """
+    RATE_LIMITER.set_rates(bytes_per_sec, requests_per_sec)
+
+
+# the id of the `before-send` handlers of the request limit, so they are only
+# registered once per client
+_LIMIT_REQUESTS_ID = "fuegodata-limit-requests"
+
+
+def _limit_request(**kwargs):
+    """botocore `before-send` handler which takes a token of the request limit"""
+    RATE_LIMITER.consume("requests")
+
+
+def limit_requests(s3_client):
+    """
+    Apply the request limit of `RATE_LIMITER` to a client which was not built by
+    `client`, `resource`, `ClientResource` or `s3async.aclient`, i.e. one built
+    by the caller and passed to the helpers. Calling it again on the same client
+    has no effect.
+
+    Args:
+        s3_client: botocore.client.S3. The s3_client of interest.
+    """
+    s3_client.meta.events.register(
+        "before-send.s3", _limit_request, unique_id=_LIMIT_REQUESTS_ID
+    )
+
+
+# the TransferStats collectors which are active (see `TransferStats.__enter__`)
+_STATS_COLLECTORS = []
+_STATS_LOCK = _threading.Lock()
+
+# the number of retries in the current thread, for the per-operation counts
+_STATS_LOCAL = _threading.local()
+
+
+def _emit_wait(kind, seconds):
+    """Record the time a thread waited for a rate limit in the active TransferStats"""
+    with _STATS_LOCK:
+        collectors = list(_STATS_COLLECTORS)
+    for stats in collectors:
+        stats.record_wait(kind, seconds)
+
+
+def _percentile(values, q):
+    """The `q`th percentile (nearest rank) of the sorted `values`"""
+    if len(values) == 0:
+        return None
+    return values[min(len(values) - 1, max(0, _math.ceil(q / 100 * len(values)) - 1))]
+
+
+class TransferStats:
+    """
+    Telemetry of the transfer helpers. While the stats are active (used as a
+    context manager), every list, download, upload, copy, delete and unzip
+    operation run by the helpers, in any thread, is recorded with its latency,
+    byte and object counts, and retries. `summary` reports the latency and
+    throughput percentiles of each operation type.
+
+        with TransferStats(report_fpath="sync-stats.json") as stats:
+            download_endpoint(...)
+        print(stats.summary()["download"]["latency"])
+
+    Args:
+        name: None or string. The name of the run in the report.
+        report_fpath: None or string. If passed, the report is saved there as
+            json when the context exits.
+        log: boolean. Whether to log the summary to the "fuegodata" logger
+            when the context exits.
+        log_ops: boolean. Whether to log every operation at the DEBUG level.
+    """
+
+    def __init__(self, name=None, report_fpath=None, log=True, log_ops=False):
+        self.name = name
+        self.report_fpath = report_fpath
+        self.log_summary = log
+        self.log_ops = log_ops
+
+        self._lock = _threading.Lock()
+        self.ops = {}
+        self.retry_codes = {}
+        self.rate_limited = {"bytes": 0.0, "requests": 0.0}
+        self.started = None
+        self.finished = None
+
+    def __enter__(self):
+        self.started = _time.time()
+        with _STATS_LOCK:
+            _STATS_COLLECTORS.append(self)
+        return self
+
+    def __exit__(self, *args):
+        with _STATS_LOCK:
+            _STATS_COLLECTORS.remove(self)
+        self.finished = _time.time()
+
+        if self.report_fpath is not None:
+            self.save(self.report_fpath)
+        if self.log_summary:
+            self.log()
+
+    def record(self, op, start, seconds, nbytes=0, objects=1, retries=0, ok=True):
+        """
+        Record a single operation.
+
+        Args:
+            op: string. The operation type (i.e. "download").
+            start: float. The start time (time.monotonic()) of the operation.
+            seconds: float. The latency of the operation.
+            nbytes: int. The number of bytes transferred.
+            objects: int. The number of objects the operation covered.
+            retries: int. The number of retried errors.
+            ok: boolean. Whether or not the operation succeeded.
+        """
+        with self._lock:
+            self.ops.setdefault(op, []).append(
+                (start, seconds, nbytes, objects, retries, ok)
+            )
+
+        if self.log_ops:
+            _logger.debug(
+                f"{op}: {seconds * 1000:.1f}ms, {nbytes} bytes, "
+                f"{retries} retries{'' if ok else ', failed'}"
+            )
+
+    def record_retry(self, error):
+        """Count a retried error by its error code (or type)"""
+        if isinstance(error, _botocore_exceptions.ClientError):
+            code = _error_code(error)
+        else:
+            code = type(error).__name__
+        with self._lock:
+            self.retry_codes[code] = self.retry_codes.get(code, 0) + 1
+
+    def record_wait(self, kind, seconds):
+        """Add the `seconds` a thread waited for the "bytes" or "requests" limit"""
+        with self._lock:
+            self.rate_limited[kind] += seconds
+
+    def summary(self):
+        """
+        Summarize the recorded operations.
+
+        Returns:
+            summary: dictionary keyed by operation type, with the "count" of
+                operations, the number of "objects", "bytes", "retries" and
+                "errors", the "wall_seconds" from the first start to the last
+                end, the "latency" percentiles (seconds), and the "throughput"
+                (overall "bytes_per_sec", and percentiles of the per-operation
+                bytes/sec)
+        """
+
+        with self._lock:
+            ops = {op: list(records) for op, records in self.ops.items()}
+
+        summary = {}
+        for op, records in ops.items():
+            latencies = sorted(seconds for start, seconds, *rest in records)
+            rates = sorted(
+                nbytes / seconds
+                for start, seconds, nbytes, *rest in records
+                if nbytes > 0 and seconds > 0
+            )
+            wall_seconds = max(start + seconds for start, seconds, *rest in records) - min(
+                start for start, *rest in records
+            )
+            nbytes = sum(record[2] for record in records)
+
+            summary[op] = {
+                "count": len(records),
+                "objects": sum(record[3] for record in records),
+                "bytes": nbytes,
+                "retries": sum(record[4] for record in records),
+                "errors": sum(not record[5] for record in records),
+                "wall_seconds": wall_seconds,
+                "latency": {
+                    "mean": sum(latencies) / len(latencies),
+                    "p50": _percentile(latencies, 50),
+                    "p90": _percentile(latencies, 90),
+                    "p99": _percentile(latencies, 99),
+                    "max": latencies[-1],
+                },
+                "throughput": {
+                    "bytes_per_sec": nbytes / wall_seconds if wall_seconds > 0 else None,
+                    "p10": _percentile(rates, 10),
+                    "p50": _percentile(rates, 50),
+                    "p90": _percentile(rates, 90),
+                },
+            }
+
+        return summary
+
+    def report(self):
+        """
+        The report of the run.
+
+        Returns:
+            report: dictionary with the "name", "started" and "finished" times
+                (unix), the `summary` of the "ops", the "retry_codes" counts, and
+                the "rate_limited" seconds the threads waited for the bandwidth
+                ("bytes") and request rate ("requests") limits of `RATE_LIMITER`
+        """
+        with self._lock:
+            retry_codes = dict(self.retry_codes)
+            rate_limited = dict(self.rate_limited)
+        return {
+            "name": self.name,
+            "started": self.started,
+            "finished": self.finished,
+            "ops": self.summary(),
+            "retry_codes": retry_codes,
+            "rate_limited": rate_limited,
+        }
+
+    def save(self, fpath):
+        """Save the `report` as json to `fpath`"""
+        fdir = _os.path.dirname(str(fpath))
+        if len(fdir) > 0:
+            _os.makedirs(fdir, exist_ok=True)
+        with open(fpath, "w") as f:
+            _json.dump(self.report(), f, indent=2)
+
+    def log(self, logger=None, level=_logging.INFO):
+        """
+        Log one summary line per operation type, and the time spent waiting for
+        the rate limits, if any.
+
+        Args:
+            logger: None or logging.Logger. Defaults to the "fuegodata" logger.
+            level: int. The logging level.
+        """
+
+        if logger is None:
+            logger = _logger
+
+        for op, op_summary in sorted(self.summary().items()):
+            latency = op_summary["latency"]
+            rate = op_summary["throughput"]["bytes_per_sec"]
+            logger.log(
+                level,
+                " ".join(
+                    [
+                        f"{op}: {op_summary['count']} ops,",
+                        f"{op_summary['objects']} objs,",
+                        f"{op_summary['bytes'] / MB:.1f}MB",
+                        f"in {op_summary['wall_seconds']:.2f}s",
+                        f"({(rate or 0) / MB:.2f}MB/s),",
+                        f"latency p50 {latency['p50'] * 1000:.0f}ms",
+                        f"p99 {latency['p99'] * 1000:.0f}ms,",
+                        f"{op_summary['retries']} retries,",
+                        f"{op_summary['errors']} errors",
+                    ]
+                ),
+            )
+
+        with self._lock:
+            rate_limited = dict(self.rate_limited)
+        if sum(rate_limited.values()) > 0:
+            logger.log(
+                level,
+                f"rate limited: {rate_limited['bytes']:.2f}s waiting for bandwidth, "
+                f"{rate_limited['requests']:.2f}s waiting for requests",
+            )
+
+
+@_contextlib.contextmanager
+def _timed(op, nbytes=0, objects=1):
+    """
+    Context manager which records an operation in the active TransferStats.
+    The yielded dictionary may be updated with the "op", "bytes" and "objects"
+    of the operation once they are known.
+    """
+
+    if len(_STATS_COLLECTORS) == 0:
+        yield {}
+        return
+
+    record = {"op": op, "bytes": nbytes, "objects": objects}
+    retries = getattr(_STATS_LOCAL, "retries", 0)
+    start = _time.monotonic()
+    ok = False
+    try:
+        yield record
+        ok = True
+    finally:
+        _emit_op(
+            record["op"],
+            start,
+            _time.monotonic() - start,
+            record["bytes"],
+            record["objects"],
+            getattr(_STATS_LOCAL, "retries", 0) - retries,
+            ok,
+        )
+
+
+def _emit_op(op, start, seconds, nbytes=0, objects=1, retries=0, ok=True):
+    """Record an operation in all the active TransferStats"""
+    with _STATS_LOCK:
+        collectors = list(_STATS_COLLECTORS)
+    for stats in collectors:
+        stats.record(op, start, seconds, nbytes, objects, retries, ok)
+
+
+def _timed_unzip(fpath):
+    """Unzip a file, returning the unzipped path, and the start and seconds it took"""
+    start = _time.monotonic()
+    unzipped = _zipper.unzip_file(fpath)
+    return unzipped, start, _time.monotonic() - start
+
+
+def _unzipped(future):
+    """The unzipped path of a `_timed_unzip` future, which is recorded as an unzip"""
+    unzipped, start, seconds = future.result()
+    _emit_op("unzip", start, seconds)
+    return unzipped
+
+
+def _download_resumable(
+    s3_client,
+    s3_bucket,
+    path_obj,
+    local_path_obj,
+    retry_policy,
+    head=None,
+    response=None,
+):
+    """
+    Download an object to `local_path_obj` via a `.part` file. After a transient
+    failure the download resumes from the end of the `.part` file with a ranged
+    GET, instead of re-fetching the bytes which were already written. The `.part`
+    file is named after the object's ETag, so bytes of an older version of the
+    object are never resumed from, and it is atomically renamed once complete.
+    `response`, if passed, is the already started GET (see `_get_object`) which
+    is read by the first attempt, and continued if it only covers the first bytes.
+    """
+
+    attempt = 0
+    part_fpath = None
+    while True:
+        try:
+            if head is None:
+                response, head = _get_object(
+                    s3_client, s3_bucket, path_obj, local_path_obj
+                )
+
+            if part_fpath is None:
+                size = head["ContentLength"]
+                etag = head["ETag"]
+                part_fpath = _part_fpath(local_path_obj, etag)
+
+                # clean up the partial downloads of other versions of the object
+                for stale_fpath in _glob.glob(_glob.escape(local_path_obj) + ".*.part"):
+                    if stale_fpath != part_fpath:
+                        _os.remove(stale_fpath)
+
+            with open(part_fpath, "ab") as f:
+                offset = f.tell()
+
+                if offset > size:
+                    f.truncate(0)
+                    offset = 0
+
+                # the started GET can only be used if it begins at the offset
+                if response is not None and (
+                    offset >= size or _range_start(response) != offset
+                ):
+                    response["Body"].close()
+                    response = None
+
+                # a started GET of the first bytes only is continued from its end
+                while offset < size:
+                    if response is None:
+                        kwargs = {"Bucket": s3_bucket, "Key": path_obj, "IfMatch": etag}
+                        if offset > 0:
+                            kwargs["Range"] = f"bytes={offset}-"
+                        response = s3_client.get_object(**kwargs)
+                    body, response = response["Body"], None
+                    for chunk in body.iter_chunks(MB):
+                        RATE_LIMITER.consume_bytes(len(chunk))
+                        f.write(chunk)
+
+                    if f.tell() == offset:
+                        break
+                    offset = f.tell()
+
+            if offset != size:
+                raise _botocore_exceptions.IncompleteReadError(
+                    actual_bytes=offset, expected_bytes=size
+                )
+
+            break
+
+        except Exception as e:
+            if isinstance(e, _botocore_exceptions.ClientError) and _error_code(e) in [
+                "412",
+                "PreconditionFailed",
+            ]:
+                # the object changed since the download started, start over
+                head = None
+                part_fpath = None
+            elif not retry_policy.is_retryable(e):
+                raise
+
+            _note_error(e)
+
+            attempt += 1
+            if attempt >= retry_policy.max_attempts:
+                raise
+
+            _time.sleep(retry_policy.delay(attempt - 1))
+
+    _os.replace(part_fpath, local_path_obj)
+
+
+def _part_fpath(local_path_obj, etag, suffix=".part"):
+    """The path of the partial download of an object with the passed `etag`"""
+    return f"{local_path_obj}.{_strip_etag(etag).replace('-', '_')}{suffix}"
+
+
+def _range_start(response):
+    """The offset of the first byte of a `get_object` response"""
+    if "ContentRange" not in response:
+        return 0
+    return int(response["ContentRange"].split(" ")[-1].split("-")[0])
+
+
+def _response_head(response):
+    """
+    The `head_object` fields of an object (its "ContentLength", "ETag" and
+    "Metadata"), read from the headers of a (possibly ranged) `get_object` response
+    """
+
+    size = response["ContentLength"]
+    if "ContentRange" in response:
+        size = int(response["ContentRange"].split("/")[-1])
+
+    return {
+        "ContentLength": size,
+        "ETag": response["ETag"],
+        "Metadata": response.get("Metadata", {}),
+    }
+
+
+def _get_object(s3_client, s3_bucket, path_obj, local_path_obj, first_bytes=None):
+    """
+    Start the GET of an object, whose response headers replace a separate HEAD
+    request. If an interrupted download of the object (see `_download_resumable`)
+    is found next to `local_path_obj`, only its missing bytes are requested,
+    provided the object didn't change since. Otherwise, if `first_bytes` is passed,
+    only the first `first_bytes` bytes are requested, so a response which isn't
+    read doesn't start an unbounded transfer.
+
+    Returns:
+        response: dictionary. The `get_object` response, whose body is not read yet
+        head: dictionary. The "ContentLength" (of the whole object), "ETag"
+            and "Metadata" of the object
+    """
+
+    kwargs = {"Bucket": s3_bucket, "Key": path_obj}
+
+    partial_fpaths = [
+        fpath
+        for fpath in _glob.glob(_glob.escape(local_path_obj) + ".*.part")
+        if "." not in fpath[len(local_path_obj) + 1 : -len(".part")]
+    ]
+    if len(partial_fpaths) > 0:
+        partial_fpath = max(partial_fpaths, key=_os.path.getmtime)
+        etag = partial_fpath[len(local_path_obj) + 1 : -len(".part")].replace("_", "-")
+        kwargs["IfMatch"] = f'"{etag}"'
+        kwargs["Range"] = f"bytes={_os.path.getsize(partial_fpath)}-"
+    elif first_bytes is not None:
+        kwargs["Range"] = f"bytes=0-{first_bytes - 1}"
+
+    try:
+        response = s3_client.get_object(**kwargs)
+    except _botocore_exceptions.ClientError as e:
+        if "Range" not in kwargs or _error_code(e) not in [
+            "412",
+            "416",
+            "PreconditionFailed",
+            "InvalidRange",
+        ]:
+            raise
+        # the object changed, the partial download is already complete, or the
+        # object is empty
+        response = s3_client.get_object(Bucket=s3_bucket, Key=path_obj)
+
+    return response, _response_head(response)
+
+
+def _with_retries(fxn, retry_policy):
+    """Call `fxn()`, retrying transient errors according to the `retry_policy`"""
+
+    attempt = 0
+    while True:
+        try:
+            return fxn()
+        except Exception as e:
+            attempt += 1
+            if not retry_policy.is_retryable(e) or attempt >= retry_policy.max_attempts:
+                raise
+            _note_error(e)
+            _time.sleep(retry_policy.delay(attempt - 1))
+
+
+def pick_codec(fpath, codec="auto"):
+    """
+    Pick the codec used to store a file compressed in s3, based on its file type.
+    Already compressed media (see COMPRESSED_EXTENSIONS) is never re-compressed.
+
+    Args:
+        fpath: string. The path to the file of interest.
+        codec: None or string. "gzip", "zstd", or "auto" to use zstd when the
+            `zstandard` package is installed and gzip otherwise. If None, the
+            file is not compressed.
+
+    Returns:
+        codec: None or string. The codec, or None if the file is stored as is
+    """
+
+    if codec is None:
+        return None
+
+    if _os.path.splitext(fpath)[1].lower() in COMPRESSED_EXTENSIONS:
+        return None
+
+    if codec == "auto":
+        codec = "zstd" if _zstd is not None else "gzip"
+
+    assert codec in CODECS, f"Unknown codec {codec}. Expected one of {CODECS}"
+    _require_codec(codec)
+
+    return codec
+
+
+def object_codec(head):
+    """
+    The codec of a stored object.
+
+    Args:
+        head: dictionary. The `head_object` (or `get_object`) response for the object.
+
+    Returns:
+        codec: None or string. The codec, or None if the object is not compressed
+    """
+    codec = head.get("Metadata", {}).get(CODEC_METADATA_KEY)
+    return codec if codec in CODECS else None
+
+
+def _require_codec(codec):
+    """Raise an ImportError if the package needed by the `codec` is missing"""
+    if codec == "zstd" and _zstd is None:
+        raise ImportError("The zstd codec requires the `zstandard` package")
+
+
+def _compress_file(fpath, fileobj, codec):
+    """
+    Stream the compressed content of `fpath` into the `fileobj`, and return the
+    md5 (single part ETag) of the uncompressed content
+    """
+
+    md5 = _hashlib.md5()
+    with open(fpath, "rb") as src:
+        if codec == "gzip":
+            # a fixed mtime keeps the output (and so the ETag) deterministic
+            with _gzip.GzipFile(fileobj=fileobj, mode="wb", compresslevel=6, mtime=0) as dst:
+                for chunk in iter(lambda: src.read(MB), b""):
+                    md5.update(chunk)
+                    dst.write(chunk)
+        else:
+            compressor = _zstd.ZstdCompressor(level=3).compressobj()
+            for chunk in iter(lambda: src.read(MB), b""):
+                md5.update(chunk)
+                fileobj.write(compressor.compress(chunk))
+            fileobj.write(compressor.flush())
+
+    return md5.hexdigest()
+
+
+def _decompressor(codec):
+    """A streaming decompressor with `decompress(data)` and `flush()` methods"""
+
+    _require_codec(codec)
+    if codec == "gzip":
+        return _zlib.decompressobj(wbits=16 + _zlib.MAX_WBITS)
+
+    return _zstd.ZstdDecompressor().decompressobj()
+
+
+def _download_decoded(
+    s3_client,
+    s3_bucket,
+    path_obj,
+    local_path_obj,
+    codec,
+    retry_policy,
+    head,
+    response=None,
+):
+    """
+    Download a compressed object to `local_path_obj`, decompressing the response
+    stream as it arrives. Compressed streams can't be resumed mid-way, so a failed
+    attempt starts over. `response`, if passed, is the already started GET which
+    is read by the first attempt, and continued if it only covers the first bytes.
+    """
+
+    size = head["ContentLength"]
+
+    part_fpath = _part_fpath(local_path_obj, head["ETag"], suffix=".decoded.part")
+
+    if response is not None and _range_start(response) != 0:
+        response["Body"].close()
+        response = None
+
+    def fetch():
+        nonlocal response
+        decompressor = _decompressor(codec)
+        offset = 0
+        with open(part_fpath, "wb") as f:
+            while offset < size:
+                if response is None:
+                    kwargs = {"Bucket": s3_bucket, "Key": path_obj}
+                    kwargs["IfMatch"] = head["ETag"]
+                    if offset > 0:
+                        kwargs["Range"] = f"bytes={offset}-"
+                    response = s3_client.get_object(**kwargs)
+                body, response = response["Body"], None
+
+                start = offset
+                for chunk in body.iter_chunks(MB):
+                    RATE_LIMITER.consume_bytes(len(chunk))
+                    f.write(decompressor.decompress(chunk))
+                    offset += len(chunk)
+                if offset == start:
+                    raise _botocore_exceptions.IncompleteReadError(
+                        actual_bytes=offset, expected_bytes=size
+                    )
+            f.write(decompressor.flush())
+
+    try:
+        _with_retries(fetch, retry_policy)
+    except BaseException:
+        if _os.path.exists(part_fpath):
+            _os.remove(part_fpath)
+        raise
+
+    _os.replace(part_fpath, local_path_obj)
+
+
+def download_ranged(
+    s3_client,
+    s3_bucket,
+    path_obj,
+    local_path_obj,
+    chunk_size=MULTIPART_CHUNKSIZE,
+    max_workers=MAX_FILE_CONCURRENCY,
+    verify=True,
+    retry_policy=None,
+    head=None,
+    response=None,
+):
+    """
+    Download a single (large) object over several connections. The object is split
+    into `chunk_size` byte ranges which are fetched concurrently and written with
+    positional writes into a preallocated `.part` file, which is renamed once
+    the download completes. Each range is retried (and resumed) on its own, and
+    the completed ranges are recorded in a `.ranges` file next to the `.part`
+    file, so a failed download resumes with the missing ranges. Both files are
+    named after the object's ETag.
+    
+    Args:
+        s3_client: botocore.client.S3. The s3_client to be called.
+        s3_bucket: string. The s3 bucket of interest.
+        path_obj: string. The path to the object in the s3 bucket.
+        local_path_obj: string. The local path the object is downloaded to.
+        chunk_size: int. The size (bytes) of each range.
+        max_workers: int. The number of ranges fetched concurrently.
+        verify: boolean. Whether or not to verify the downloaded file against
+            the object's ETag.
+        retry_policy: None or RetryPolicy. If None, DEFAULT_RETRY_POLICY is used.
+        head: None or dictionary. The `head_object` response for the object,
+            if it was already fetched.
+        response: None or dictionary. An already started GET of the object (see
+            `_get_object`), which is read as the first range if it covers
+            exactly that range, and closed otherwise.
+    
+    Returns:
+        local_path_obj: string. The local path to the downloaded obj
+    """
+
+    if retry_policy is None:
+        retry_policy = DEFAULT_RETRY_POLICY
+
+    if head is None:
+        head = _with_retries(
+            lambda: s3_client.head_object(Bucket=s3_bucket, Key=path_obj), retry_policy
+        )
+    size = head["ContentLength"]
+    etag = head["ETag"]
+
+    part_fpath = _part_fpath(local_path_obj, etag, suffix=".ranges.part")
+    ranges_fpath = _part_fpath(local_path_obj, etag, suffix=".ranges")
+
+    # clean up the ranged downloads of other versions of the object
+    for suffix in [".*.ranges.part", ".*.ranges"]:
+        for stale_fpath in _glob.glob(_glob.escape(local_path_obj) + suffix):
+            if stale_fpath not in [part_fpath, ranges_fpath]:
+                _os.remove(stale_fpath)
+
+    # the ranges completed by an earlier attempt, which are not fetched again
+    done_ranges = set()
+    if _os.path.isfile(part_fpath) and _os.path.isfile(ranges_fpath):
+        with open(ranges_fpath, "r") as f:
+            for line in f:
+                if line.endswith("\n"):
+                    start, end = line.split("-")
+                    done_ranges.add((int(start), int(end)))
+    ranges_lock = _threading.Lock()
+
+    # the ranges are fetched in their own threads, so hand them the controller
+    # of the calling transfer for the errors they retry
+    controller = _active_controller()
+
+    def fetch_range(byte_range):
+        previous = getattr(_CONTROLLER_LOCAL, "controller", None)
+        _CONTROLLER_LOCAL.controller = controller
+        try:
+            fetch_byte_range(byte_range)
+        finally:
+            _CONTROLLER_LOCAL.controller = previous
+
+    def fetch_byte_range(byte_range):
+        start, end = byte_range
+        offset = start
+
+        def fetch():
+            nonlocal offset, response
+            if start == 0 and response is not None:
+                started, response = response, None
+            else:
+                started = s3_client.get_object(
+                    Bucket=s3_bucket,
+                    Key=path_obj,
+                    Range=f"bytes={offset}-{end}",
+                    IfMatch=etag,
+                )
+            for chunk in started["Body"].iter_chunks(MB):
+                RATE_LIMITER.consume_bytes(len(chunk))
+                _os.pwrite(fd, chunk, offset)
+                offset += len(chunk)
+            if offset != end + 1:
+                raise _botocore_exceptions.IncompleteReadError(
+                    actual_bytes=offset - start, expected_bytes=end + 1 - start
+                )
+
+        _with_retries(fetch, retry_policy)
+
+        with ranges_lock:
+            ranges_file.write(f"{start}-{end}\n")
+            ranges_file.flush()
+
+    byte_ranges = [
+        (start, min(start + chunk_size, size) - 1) for start in range(0, size, chunk_size)
+    ]
+    byte_ranges = [
+        byte_range for byte_range in byte_ranges if byte_range not in done_ranges
+    ]
+
+    # the started GET is only read by the first range, if it covers exactly that one
+    if response is not None and not (
+        len(byte_ranges) > 0
+        and byte_ranges[0][0] == 0
+        and _range_start(response) == 0
+        and response["ContentLength"] == byte_ranges[0][1] + 1
+    ):
+        response["Body"].close()
+        response = None
+
+    # the `.part` file and its record of completed ranges are kept when a range
+    # fails, so the next attempt only fetches the missing ranges
+    fd = _os.open(part_fpath, _os.O_RDWR | _os.O_CREAT)
+    try:
+        with open(ranges_fpath, "a" if len(done_ranges) > 0 else "w") as ranges_file:
+            if size > 0 and _os.fstat(fd).st_size != size:
+                if hasattr(_os, "posix_fallocate"):
+                    _os.posix_fallocate(fd, 0, size)
+                else:
+                    _os.ftruncate(fd, size)
+
+            thread_map(fetch_range, byte_ranges, max_workers)
+    finally:
+        _os.close(fd)
+        if response is not None:
+            response["Body"].close()
+
+    if verify:
+        part_size = None
+        if "-" in _strip_etag(etag):
+            part_size = _with_retries(
+                lambda: s3_client.head_object(
+                    Bucket=s3_bucket, Key=path_obj, PartNumber=1
+                ),
+                retry_policy,
+            )["ContentLength"]
+
+        if file_etag(part_fpath, part_size) != _strip_etag(etag):
+            _os.remove(part_fpath)
+            _os.remove(ranges_fpath)
+            raise ValueError(
+                f"The download of {path_obj} does not match its ETag {etag}"
+            )
+
+    _os.replace(part_fpath, local_path_obj)
+    _os.remove(ranges_fpath)
+
+    return local_path_obj
+
+
+def _range_workers(max_workers, controller=None):
+    """
+    The number of ranges fetched concurrently per object by `download_ranged`
+    when `max_workers` objects are downloaded at once, so all of their ranges
+    fit in the connection pool of the client (DEFAULT_MAX_POOL_CONNECTIONS)
+    """
+
+    if controller is not None:
+        max_workers = controller.max_concurrency
+    if max_workers is None or max_workers <= 1:
+        return MAX_FILE_CONCURRENCY
+
+    per_object = DEFAULT_MAX_POOL_CONNECTIONS // max_workers
+
+    return max(1, min(MAX_FILE_CONCURRENCY, per_object))
+
+
+def download_single_object(
+    s3_resource,
+    s3_bucket,
+    path_obj,
+    local_bucket,
+    verbose=0,
+    unzip=True,
+    ignore_missing=False,
+    retry_policy=None,
+    range_threshold=MULTIPART_THRESHOLD,
+    range_chunksize=MULTIPART_CHUNKSIZE,
+    range_workers=MAX_FILE_CONCURRENCY,
+    cache=None,
+):
+    """
+    Download a single object. The object is written to a `.part` file which is
+    renamed once the download completes. Transient failures are retried according
+    to the `retry_policy`, resuming from the bytes already downloaded.
+
+    The download starts with a GET of the first `range_chunksize` bytes (only the
+    first byte when a `cache` is passed, as hits don't need the data), whose
+    headers replace a separate HEAD request. Smaller objects are fetched by this
+    single GET. The rest of larger objects is fetched from where it ends, and
+    objects of at least `range_threshold` bytes are fetched as concurrent byte
+    ranges via `download_ranged`, with the started GET as their first range.
+
+    Args:
+        s3_resource: The s3_resource object to be called.
+        s3_bucket: string. The s3 bucket of interest.
+        path_obj: string. The path to the object in the s3 bucket.
+        local_bucket: string. The path to where object will be downloaded.
+        verbose: int. print-out verbosity.
+        unzip: boolean. Whether or not to unzip the object (if it is a zip file)
+            after downloading
+        ignore_missing: boolean. Whether or not to ignore missing files which
+            are not found (True), or throw an error if a missing file is
+            encountered (False)
+        retry_policy: None or RetryPolicy. If None, DEFAULT_RETRY_POLICY is used.
+        range_threshold: None or int. The object size (bytes) at which the object
+            is downloaded as concurrent byte ranges. If None, ranged downloads are
+            disabled.
+        range_chunksize: int. The size (bytes) of each range.
+        range_workers: int. The number of ranges fetched concurrently.
+        cache: None or s3cache.DownloadCache. If passed, the object is materialized
+            from the cache when its (bucket, key, ETag) was downloaded before, and
+            is added to the cache otherwise.
+
+    Objects stored compressed (see `upload_single_object`) are decompressed
+    while they are downloaded.
+
+    Returns:
+        local_path_obj: str. The local path to the downloaded obj
+    """
+
+    local_bucket = str(local_bucket)
+
+    if retry_policy is None:
+        retry_policy = DEFAULT_RETRY_POLICY
+
+    local_subfolder = _os.path.join(local_bucket, _os.path.dirname(path_obj))
+    if verbose >= 2:
+        print("local_subfolder:", local_subfolder)
+
+    local_path_obj = _os.path.join(local_subfolder, _os.path.basename(path_obj))
+    if verbose >= 3:
+        print("local_path_obj:", local_path_obj)
+
+    _os.makedirs(local_subfolder, exist_ok=True)
+
+    if verbose >= 1:
+        print("\t", path_obj, end="\r")
+
+    # the low-level client is thread-safe, unlike the resource objects
+    s3_client = s3_resource.meta.client
+
+    try:
+        with _timed("download") as record:
+            # the object is requested right away, and its size and ETag are read
+            # from the response headers instead of a separate HEAD request
+            first_bytes = None
+            if cache is not None:
+                first_bytes = 1
+            elif range_threshold is not None:
+                first_bytes = range_chunksize
+            response, head = _with_retries(
+                lambda: _get_object(
+                    s3_client, s3_bucket, path_obj, local_path_obj, first_bytes
+                ),
+                retry_policy,
+            )
+
+            record["bytes"] = head["ContentLength"]
+
+            cache_hit = cache is not None and cache.fetch(
+                s3_bucket, path_obj, head["ETag"], local_path_obj
+            )
+
+            codec = object_codec(head)
+            ranged = (
+                range_threshold is not None and head["ContentLength"] >= range_threshold
+            )
+
+            if cache_hit:
+                response["Body"].close()
+
+            if cache_hit:
+                record["op"] = "cache_hit"
+            elif codec is not None:
+                _download_decoded(
+                    s3_client,
+                    s3_bucket,
+                    path_obj,
+                    local_path_obj,
+                    codec,
+                    retry_policy,
+                    head,
+                    response=response,
+                )
+            elif ranged:
+                download_ranged(
+                    s3_client,
+                    s3_bucket,
+                    path_obj,
+                    local_path_obj,
+                    chunk_size=range_chunksize,
+                    max_workers=range_workers,
+                    retry_policy=retry_policy,
+                    head=head,
+                    response=response,
+                )
+            else:
+                _download_resumable(
+                    s3_client,
+                    s3_bucket,
+                    path_obj,
+                    local_path_obj,
+                    retry_policy,
+                    head=head,
+                    response=response,
+                )
+
+            if cache is not None and not cache_hit:
+                cache.store(s3_bucket, path_obj, head["ETag"], local_path_obj)
+
+            controller = _active_controller()
+            if controller is not None and not cache_hit:
+                controller.add_bytes(head["ContentLength"])
+    except Exception as e:
+        if _is_not_found(e) and ignore_missing:
+            _warnings.warn(path_obj + " Not Found")
+            return None
+        raise
+
+    if unzip and ".zip" in local_path_obj:
+        with _timed("unzip"):
+            local_path_obj = _zipper.unzip_file(local_path_obj)
+
+    return local_path_obj
+
+
+def download_objs(
+    s3_resource,
+    s3_bucket,
+    objs,
+    local_bucket,
+    unzip=True,
+    overwrite=False,
+    ignore_missing=False,
+    max_workers=DEFAULT_MAX_WORKERS,
+    verbose=1,
+    cache=None,
+    controller=None,
+    journal=None,
+    sizes=None,
+):
+    """
+    Download a multiple objects (`objs`). The downloads are run on a bounded
+    thread pool which shares the client of the `s3_resource`.
+
+    Args:
+        s3_resource: The s3_resource object to be called.
+        s3_bucket: string. The s3 bucket of interest.
+        obj: list of strings. The paths to the objects in the s3 bucket.
+        local_bucket: string. The path to where objects will be downloaded.
+        verbose: int. print-out verbosity.
+        unzip: boolean. Whether or not to unzip the object (if it is a zip file)
+            after downloading
+        overwrite: boolean. Whether or not to overwrite the existing objects if
+            they are already present locally
+        ignore_missing: boolean. Whether or not to ignore missing files which
+            are not found (True), or throw an error if a missing file is
+            encountered (False)
+        max_workers: int. The number of objects downloaded concurrently.
+            If None or 1, the objects are downloaded serially.
+        verbose: int. print-out verbosity. If >=1, a progress bar will be added.
+        cache: None or s3cache.DownloadCache. The shared download cache to
+            materialize the objects from (see `download_single_object`).
+        controller: None or ConcurrencyController. If passed, the number of
+            concurrent downloads follows the controller's adaptive limit instead
+            of `max_workers`.
+        journal: None or TransferJournal. If passed, the start and end of each
+            download are recorded in the journal.
+        sizes: None or dictionary mapping the `objs` to their size (bytes), i.e.
+            from `list_objects(..., meta=True)`. If passed, the largest objects are
+            started first, so a few large objects don't finish the batch on their
+            own. Objects missing from `sizes` are started last.
+
+    Returns:
+        fpaths: str. The local filepaths paths to the downloaded objs, in the
+            same order as `objs`
+    """
+
+    objs = list(objs)
+    range_workers = _range_workers(max_workers, controller)
+
+    def download(obj):
+        # Check if the track is already in ACI object store, otherwise download the obj
+        fpath = _os.path.join(local_bucket, obj)
+        if overwrite or _os.path.exists(fpath) == False:
+
+            fpath = download_single_object(
+                s3_resource,
+                s3_bucket,
+                obj,
+                local_bucket,
+                verbose=0,
+                unzip=unzip,
+                ignore_missing=ignore_missing,
+                range_workers=range_workers,
+                cache=cache,
+            )
+
+        return fpath
+
+    pbar = None
+    if verbose >= 1:
+        try:
+            _tqdm.tqdm._instances.clear()
+        except:
+            pass
+        pbar = _tqdm.tqdm(total=len(objs))
+
+    if sizes is not None:
+        sizes = [sizes.get(obj, 0) for obj in objs]
+
+    try:
+        fpaths = thread_map(
+            _journaled(download, journal), objs, max_workers, pbar, controller, sizes
+        )
+    finally:
+        if pbar is not None:
+            pbar.close()
+
+    fpaths = [fpath for fpath in fpaths if not fpath == None]
+
+    return fpaths
+
+
+def iter_download_objs(
+    s3_resource,
+    s3_bucket,
+    objs,
+    local_bucket,
+    unzip=True,
+    overwrite=False,
+    ignore_missing=False,
+    max_workers=DEFAULT_MAX_WORKERS,
+    unzip_workers=None,
+    max_pending=None,
+    cache=None,
+    controller=None,
+):
+    """
+    Download multiple objects (`objs`), yielding the local path of each object as
+    soon as it is downloaded (and unzipped), so it can be processed while the
+    other objects are still being transferred. The zip files are unzipped on a
+    process pool, so the downloads are not held up by decompression.
+
+    Objects are only pulled from `objs` as the consumer keeps up: at most
+    `max_pending` downloads which have not been yielded (or handed to an unzip)
+    and, separately, `max_pending` unzips are outstanding at once. The extracted
+    files are not counted against the downloads, and an unzip holds both the zip
+    file and its extracted files until it deletes the zip file. So the disk usage
+    ahead of the consumer is bounded by 2 * `max_pending` objects plus the
+    extracted files of `max_pending` of them, not by `max_pending` objects.
+
+    Args:
+        s3_resource: The s3_resource object to be called.
+        s3_bucket: string. The s3 bucket of interest.
+        objs: iterable of strings. The paths to the objects in the s3 bucket.
+            May be a generator.
+        local_bucket: string. The path to where objects will be downloaded.
+        unzip: boolean. Whether or not to unzip the objects which are zip files.
+        overwrite: boolean. Whether or not to overwrite the existing objects if
+            they are already present locally
+        ignore_missing: boolean. Whether or not to skip missing objects (True),
+            or throw an error if a missing object is encountered (False)
+        max_workers: int. The number of objects downloaded concurrently.
+        unzip_workers: None or int. The number of unzip processes. If None,
+            the number of CPUs is used.
+        max_pending: None or int. The maximum number of downloads, and separately
+            of unzips, which have not been yielded yet (see above for the
+            resulting disk usage). Defaults to 2 * max_workers.
+        cache: None or s3cache.DownloadCache. The shared download cache to
+            materialize the objects from (see `download_single_object`).
+        controller: None or ConcurrencyController. If passed, the number of
+            concurrent downloads follows the controller's adaptive limit instead
+            of `max_workers`.
+
+    Yields:
+        fpath: str. The local path to each downloaded (and unzipped) obj, in
+            completion order. Missing objects are skipped when `ignore_missing`.
+            Zip files which were already present (and not overwritten) are
+            yielded without being unzipped.
+    """
+
+    if max_pending is None:
+        max_pending = 2 * (
+            max_workers if controller is None else controller.max_concurrency
+        )
+
+    range_workers = _range_workers(max_workers, controller)
+
+    def download(obj):
+        """The local path of the object, and whether or not it was downloaded"""
+        fpath = _os.path.join(local_bucket, obj)
+        if not overwrite and _os.path.exists(fpath):
+            return fpath, False
+
+        fpath = download_single_object(
+            s3_resource,
+            s3_bucket,
+            obj,
+            local_bucket,
+            verbose=0,
+            unzip=False,
+            ignore_missing=ignore_missing,
+            range_workers=range_workers,
+            cache=cache,
+        )
+        return fpath, True
+
+    downloads = thread_imap(
+        download, objs, max_workers, max_pending=max_pending, controller=controller
+    )
+
+    if not unzip:
+        for fpath, downloaded in downloads:
+            if fpath is not None:
+                yield fpath
+        return
+
+    with _ProcessPoolExecutor(max_workers=unzip_workers) as executor:
+        pending = set()
+        try:
+            for fpath, downloaded in downloads:
+                if fpath is None:
+                    continue
+
+                # files which were already present are left as they are
+                if ".zip" not in fpath or not downloaded:
+                    yield fpath
+                else:
+                    pending.add(executor.submit(_timed_unzip, fpath))
+
+                # hand over the finished unzips, and wait for one once the
+                # limit is reached, which stops pulling further downloads
+                if len(pending) >= max_pending:
+                    done, pending = _wait(pending, return_when=_FIRST_COMPLETED)
+                else:
+                    done = set(future for future in pending if future.done())
+                    pending -= done
+                for future in done:
+                    yield _unzipped(future)
+
+            while pending:
+                done, pending = _wait(pending, return_when=_FIRST_COMPLETED)
+                for future in done:
+                    yield _unzipped(future)
+
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            raise
+
+
+def _fill_range(s3_client, s3_bucket, path_obj, etag, view, start, retry_policy):
+    """
+    Fill `view` with the object's bytes starting at offset `start`. After a
+    transient failure the read resumes from the last byte which was received.
+    """
+
+    filled = 0
+
+    def fetch():
+        nonlocal filled
+        end = start + len(view) - 1
+        kwargs = {
+            "Bucket": s3_bucket,
+            "Key": path_obj,
+            "Range": f"bytes={start + filled}-{end}",
+        }
+        if etag is not None:
+            kwargs["IfMatch"] = etag
+        response = s3_client.get_object(**kwargs)
+        for chunk in response["Body"].iter_chunks(MB):
+            RATE_LIMITER.consume_bytes(len(chunk))
+            view[filled : filled + len(chunk)] = chunk
+            filled += len(chunk)
+        if filled != len(view):
+            raise _botocore_exceptions.IncompleteReadError(
+                actual_bytes=filled, expected_bytes=len(view)
+            )
+
+    _with_retries(fetch, retry_policy)
+
+
+def _fill_from_response(
+    s3_client, s3_bucket, path_obj, etag, response, view, start, retry_policy
+):
+    """
+    Fill `view` with the body of an already started `get_object` response, which
+    starts at offset `start`. The response is closed once `view` is full, and
+    after a transient failure the rest is read with `_fill_range`.
+    """
+
+    filled = 0
+    try:
+        for chunk in response["Body"].iter_chunks(MB):
+            chunk = chunk[: len(view) - filled]
+            RATE_LIMITER.consume_bytes(len(chunk))
+            view[filled : filled + len(chunk)] = chunk
+            filled += len(chunk)
+            if filled == len(view):
+                break
+    except Exception as e:
+        if not retry_policy.is_retryable(e):
+            raise
+        _note_error(e)
+    finally:
+        response["Body"].close()
+
+    if filled < len(view):
+        _fill_range(
+            s3_client,
+            s3_bucket,
+            path_obj,
+            etag,
+            view[filled:],
+            start + filled,
+            retry_policy,
+        )
+
+
+def get_bytes(
+    s3_client,
+    s3_bucket,
+    path_obj,
+    byte_range=None,
+    parser=None,
+    range_threshold=MULTIPART_THRESHOLD,
+    range_chunksize=MULTIPART_CHUNKSIZE,
+    range_workers=MAX_FILE_CONCURRENCY,
+    retry_policy=None,
+    head=None,
+):
+    """
+    Read an object (or a byte range of it) into memory, without going through
+    the file system. The read starts with a single GET, whose headers give the
+    size and ETag of the object, so small objects take one request. The bytes
+    are received straight into a preallocated buffer, and reads larger than
+    `range_threshold` continue as concurrent byte ranges.
+
+    Args:
+        s3_client: botocore.client.S3. The s3_client to be called.
+        s3_bucket: string. The s3 bucket of interest.
+        path_obj: string. The path to the object in the s3 bucket.
+        byte_range: None or tuple of ints. The (first, last) byte offsets to be
+            read (inclusive, like the http Range header). If None, the whole
+            object is read.
+        parser: None or function. If passed, called as `parser(data, path_obj)`
+            and its output is returned instead of the buffer (i.e. `files.loads`).
+        range_threshold: None or int. The size (bytes) from which objects are read
+            as concurrent byte ranges. If None, objects are read with a single request.
+        range_chunksize: int. The size (bytes) of each range.
+        range_workers: int. The number of ranges read concurrently.
+        retry_policy: None or RetryPolicy. If None, DEFAULT_RETRY_POLICY is used.
+        head: None or dictionary. The `head_object` response for the object,
+            if it was already fetched. The read then starts with byte ranges.
+
+    Returns:
+        data: memoryview over a bytearray holding the bytes, or the output of `parser`.
+            Objects stored compressed are decompressed into a bytes object,
+            unless a `byte_range` is read.
+    """
+
+    if retry_policy is None:
+        retry_policy = DEFAULT_RETRY_POLICY
+
+    # the started GET, whose body holds the bytes of interest
+    response = None
+    if head is None:
+        kwargs = {"Bucket": s3_bucket, "Key": path_obj}
+        if byte_range is not None:
+            kwargs["Range"] = f"bytes={byte_range[0]}-{byte_range[1]}"
+        try:
+            response = _with_retries(
+                lambda: s3_client.get_object(**kwargs), retry_policy
+            )
+        except _botocore_exceptions.ClientError as e:
+            if byte_range is None or _error_code(e) not in ["416", "InvalidRange"]:
+                raise
+            # the range starts past the end of the object, so nothing is read
+            head = _with_retries(
+                lambda: s3_client.head_object(Bucket=s3_bucket, Key=path_obj),
+                retry_policy,
+            )
+        else:
+            head = _response_head(response)
+
+    if byte_range is None:
+        start, end = 0, head["ContentLength"] - 1
+    else:
+        start, end = byte_range[0], min(byte_range[1], head["ContentLength"] - 1)
+
+    buffer = bytearray(max(0, end + 1 - start))
+    data = memoryview(buffer)
+
+    def fill(offset, size):
+        view = data[offset : offset + size]
+        if offset == 0 and response is not None:
+            _fill_from_response(
+                s3_client,
+                s3_bucket,
+                path_obj,
+                head["ETag"],
+                response,
+                view,
+                start,
+                retry_policy,
+            )
+        else:
+            _fill_range(
+                s3_client,
+                s3_bucket,
+                path_obj,
+                head["ETag"],
+                view,
+                start + offset,
+                retry_policy,
+            )
+
+    with _timed("get", nbytes=len(data)):
+        if len(data) == 0:
+            if response is not None:
+                response["Body"].close()
+        elif range_threshold is None or len(data) < range_threshold:
+            fill(0, len(data))
+        else:
+            # the started GET fills the first range, and the others are
+            # fetched concurrently
+            thread_map(
+                lambda offset: fill(offset, range_chunksize),
+                range(0, len(data), range_chunksize),
+                range_workers,
+            )
+
+    controller = _active_controller()
+    if controller is not None:
+        controller.add_bytes(len(data))
+
+    codec = object_codec(head)
+    if codec is not None and byte_range is None:
+        decompressor = _decompressor(codec)
+        data = memoryview(decompressor.decompress(data) + decompressor.flush())
+
+    if parser is not None:
+        return parser(data, path_obj)
+
+    return data
+
+
+def get_many_bytes(
+    s3_client,
+    s3_bucket,
+    objs,
+    parser=None,
+    ignore_missing=False,
+    max_workers=DEFAULT_MAX_WORKERS,
+    retry_policy=None,
+    controller=None,
+):
+    """
+    Read multiple objects into memory concurrently (see `get_bytes`).
+
+    Args:
+        s3_client: botocore.client.S3. The s3_client to be called.
+        s3_bucket: string. The s3 bucket of interest.
+        objs: list of strings. The paths to the objects in the s3 bucket.
+        parser: None or function. If passed, called as `parser(data, path_obj)`
+            for each object, and its outputs are returned (i.e. `files.loads`).
+        ignore_missing: boolean. Whether to return None for missing objects (True),
+            or throw an error if a missing object is encountered (False)
+        max_workers: int. The number of objects read concurrently.
+        retry_policy: None or RetryPolicy. If None, DEFAULT_RETRY_POLICY is used.
+        controller: None or ConcurrencyController. If passed, the number of
+            concurrent reads follows the controller's adaptive limit instead
+            of `max_workers`.
+
+    Returns:
+        datas: list of memoryviews (or `parser` outputs), in the same order as `objs`
+    """
+
+    def get(obj):
+        try:
+            return get_bytes(
+                s3_client, s3_bucket, obj, parser=parser, retry_policy=retry_policy
+            )
+        except Exception as e:
+            if _is_not_found(e) and ignore_missing:
+                _warnings.warn(obj + " Not Found")
+                return None
+            raise
+
+    return thread_map(get, list(objs), max_workers, controller=controller)
+
+
+def transfer_config(
+    file_size,
+    multipart_threshold=MULTIPART_THRESHOLD,
+    multipart_chunksize=MULTIPART_CHUNKSIZE,
+    max_concurrency=MAX_FILE_CONCURRENCY,
+):
+    """
+    Pick the transfer settings for a single file based on its size. Small files
+    are sent in a single request without spinning up any transfer threads,
+    while large files are split into parts which are transferred concurrently.
+    
+    Args:
+        file_size: int. The size of the file in bytes.
+        multipart_threshold: int. The file size (bytes) at which multipart
+            transfers are used.
+        multipart_chunksize: int. The minimum part size (bytes). The part size is
+            increased as needed to stay within the MAX_PARTS limit.
+        max_concurrency: int. The maximum number of parts transferred
+            concurrently for the file.
+    
+    Returns:
+        config: boto3.s3.transfer.TransferConfig. The transfer settings for the file
+    """
+
+    if file_size < multipart_threshold:
+        return _TransferConfig(multipart_threshold=multipart_threshold, use_threads=False)
+
+    # round the part size up to a whole number of MB
+    chunksize = max(multipart_chunksize, _math.ceil(file_size / MAX_PARTS))
+    chunksize = _math.ceil(chunksize / MB) * MB
+    n_parts = _math.ceil(file_size / chunksize)
+
+    config = _TransferConfig(
+        multipart_threshold=multipart_threshold,
+        multipart_chunksize=chunksize,
+        max_concurrency=max(1, min(max_concurrency, n_parts)),
+        use_threads=True,
+    )
+
+    return config
+
+
+def upload_single_object(
+    s3_client, s3_bucket, local_fpath, bucket_subdir, verbose=0, config=None, codec=None
+):
+    """
+    Upload a single object.
+
+    Args:
+        s3_client: The s3_client object to be called.
+        s3_bucket: string. The s3 bucket of interest.
+        local_fpath: The path to where the file of interest is stored.
+        bucket_subdir: string. The subdirectory in the bucket where the file will be saved.
+        verbose: int. print-out verbosity.
+        config: None or boto3.s3.transfer.TransferConfig. The transfer settings.
+            If None, the settings are picked from the file size via `transfer_config`
+        codec: None or string. If passed, the file is stored compressed with the
+            codec picked by `pick_codec` (i.e. "auto"), under the same key. The
+            codec is recorded in the ContentEncoding and metadata of the object,
+            and the download helpers decompress it transparently. The size and
+            md5 of the file are recorded in the metadata too, so the sync helpers
+            can compare the object with local files.
+
+    Returns:
+        obj: str. The s3 objects paths for the uploaded files
+
+    """
+    obj = _os.path.join(bucket_subdir, _os.path.basename(local_fpath))
+
+    if verbose >= 1:
+        print("\t", obj, end="\r")
+
+    codec = pick_codec(local_fpath, codec)
+
+    with _timed("upload") as record:
+        if codec is None:
+            size = _os.path.getsize(local_fpath)
+            record["bytes"] = size
+            if config is None:
+                config = transfer_config(size)
+
+            s3_client.upload_file(
+                Filename=local_fpath,
+                Bucket=s3_bucket,
+                Key=obj,
+                Config=config,
+                Callback=RATE_LIMITER.consume_bytes,
+            )
+        else:
+            source_size = _os.path.getsize(local_fpath)
+            with _tempfile.TemporaryFile() as f:
+                source_etag = _compress_file(local_fpath, f, codec)
+                size = f.tell()
+                record["bytes"] = size
+                f.seek(0)
+                if config is None:
+                    config = transfer_config(size)
+
+                s3_client.upload_fileobj(
+                    Fileobj=f,
+                    Bucket=s3_bucket,
+                    Key=obj,
+                    Config=config,
+                    ExtraArgs={
+                        "ContentEncoding": codec,
+                        "Metadata": {
+                            CODEC_METADATA_KEY: codec,
+                            SOURCE_SIZE_METADATA_KEY: str(source_size),
+                            SOURCE_ETAG_METADATA_KEY: source_etag,
+                        },
+                    },
+                    Callback=RATE_LIMITER.consume_bytes,
+                )
+
+    controller = _active_controller()
+    if controller is not None:
+        controller.add_bytes(size)
+
+    return obj
+
+
+def upload_objs(
+    s3_client,
+    s3_bucket,
+    fpaths,
+    max_workers=DEFAULT_MAX_WORKERS,
+    skip_unchanged=False,
+    hash_processes=False,
+    controller=None,
+    codec=None,
+    sizes=None,
+):
+    """
+    Upload multiple files to the specified `s3_bucket`. Note that each
+    filepath should be in a directory or subdirectory matching the `s3_bucket`
+    name. The files are uploaded concurrently on a bounded thread pool and
+    each file uses the transfer settings picked by `transfer_config`.
+
+    Args:
+        s3_client: The s3_client object to be called.
+        s3_bucket: string. The s3 bucket of interest.
+        fpaths: list of strings. The paths to where the files of interest are stored.
+            Note that each filepath should be in a directory or subdirectory 
+            matching the `s3_bucket` name.
+        max_workers: int. The number of files uploaded (and hashed) concurrently.
+            If None or 1, the files are uploaded serially.
+        skip_unchanged: boolean. Whether or not to skip the files whose content
+            matches the ETag of their existing s3 object. The verified ETags are
+            kept in the sync manifest of the local bucket (see `load_manifest`),
+            which is the directory matching the `s3_bucket` name, so a file is
+            only hashed again once its size or mtime changes.
+        hash_processes: boolean. Whether to hash the files on a process pool
+            instead of a thread pool.
+        controller: None or ConcurrencyController. If passed, the number of
+            concurrent uploads follows the controller's adaptive limit instead
+            of `max_workers`.
+        codec: None or string. The codec of the compressed object storage. See
+            `upload_single_object`. Compressed objects are compared with their
+            local files by the size and md5 recorded in their metadata.
+        sizes: None or dictionary mapping the `fpaths` to their size (bytes), i.e.
+            from `os.path.getsize`. If passed, the largest files are started
+            first, so a few large files don't finish the batch on their own.
+            Files missing from `sizes` are started last.
+
+    Returns:
+        objs: list of strings. The s3 objects paths for the uploaded files. Files
+            skipped via `skip_unchanged` are not included.
+    """
+
+    fpaths = list(fpaths)
+
+    for fpath in fpaths:
+        assert s3_bucket in fpath, " ".join(
+            [
+                f"Failed to find the `s3_bucket`: {s3_bucket}",
+                f"in the `fpath`:{fpath}.",
+                "The obj path in the `s3_bucket` cannot be interpreted",
+                "without this information",
+            ]
+        )
+
+    def upload(fpath):
+        bucket_subdir = _os.path.dirname(fpath.split(s3_bucket + "/")[-1])
+        return upload_single_object(
+            s3_client, s3_bucket, fpath, bucket_subdir, verbose=0, codec=codec
+        )
+
+    if skip_unchanged and len(fpaths) > 0:
+        local_bucket = fpaths[0].split(s3_bucket + "/")[0] + s3_bucket
+        objs = [fpath.split(s3_bucket + "/")[-1] for fpath in fpaths]
+        remote = {
+            obj["Key"]: (obj["Size"], _strip_etag(obj["ETag"]))
+            for obj in iter_objects(
+                s3_client, s3_bucket, prefix=_os.path.commonprefix(objs), meta=True
+            )
+        }
+
+        manifest = load_manifest(local_bucket)
+        changed = _changed_files(
+            local_bucket,
+            objs,
+            remote,
+            manifest,
+            max_workers,
+            use_processes=hash_processes,
+            s3_client=s3_client,
+            s3_bucket=s3_bucket,
+        )
+        save_manifest(local_bucket, manifest)
+        fpaths = [fpath for fpath, is_changed in zip(fpaths, changed) if is_changed]
+
+    try:
+        _tqdm.tqdm._instances.clear()
+    except:
+        pass
+    pbar = _tqdm.tqdm(total=len(fpaths))
+
+    if sizes is not None:
+        sizes = [sizes.get(fpath, 0) for fpath in fpaths]
+
+    try:
+        objs = thread_map(upload, fpaths, max_workers, pbar, controller, sizes)
+    finally:
+        pbar.close()
+
+    return objs
+
+
+def copy_single_object(
+    s3_client,
+    src_bucket,
+    src_obj,
+    dst_bucket,
+    dst_obj,
+    size=None,
+    multipart_threshold=COPY_MULTIPART_THRESHOLD,
+    part_size=COPY_PART_SIZE,
+    max_workers=MAX_FILE_CONCURRENCY,
+    retry_policy=None,
+):
+    """
+    Copy a single object server-side, so no data passes through this host.
+    Objects smaller than `multipart_threshold` are copied with a single
+    CopyObject request. Larger objects are copied as a multipart upload whose
+    parts are copied concurrently with UploadPartCopy.
+
+    Args:
+        s3_client: botocore.client.S3. The s3_client to be called.
+        src_bucket: string. The s3 bucket of the source object.
+        src_obj: string. The path to the source object.
+        dst_bucket: string. The s3 bucket of the copy.
+        dst_obj: string. The path to the copy.
+        size: None or int. The size of the source object in bytes, if known
+            from the listing.
+        multipart_threshold: int. The object size (bytes) at which multipart
+            copies are used. At most MAX_COPY_SIZE.
+        part_size: int. The minimum part size (bytes). The part size is increased
+            as needed to stay within the MAX_PARTS limit.
+        max_workers: int. The number of parts copied concurrently.
+        retry_policy: None or RetryPolicy. If None, DEFAULT_RETRY_POLICY is used.
+
+    Returns:
+        dst_obj: string. The path to the copy
+    """
+
+    if retry_policy is None:
+        retry_policy = DEFAULT_RETRY_POLICY
+
+    multipart_threshold = min(multipart_threshold, MAX_COPY_SIZE)
+    copy_source = {"Bucket": src_bucket, "Key": src_obj}
+
+    head = None
+    if size is None or size >= multipart_threshold:
+        head = _with_retries(
+            lambda: s3_client.head_object(Bucket=src_bucket, Key=src_obj), retry_policy
+        )
+        size = head["ContentLength"]
+
+    if size < multipart_threshold:
+        with _timed("copy", nbytes=size):
+            _with_retries(
+                lambda: s3_client.copy_object(
+                    Bucket=dst_bucket, Key=dst_obj, CopySource=copy_source
+                ),
+                retry_policy,
+            )
+    else:
+        part_size = max(part_size, _math.ceil(size / MAX_PARTS))
+        part_size = _math.ceil(part_size / MB) * MB
+        byte_ranges = [
+            (start, min(start + part_size, size) - 1)
+            for start in range(0, size, part_size)
+        ]
+
+        # unlike CopyObject, the multipart upload does not carry over the metadata
+        kwargs = {"Metadata": head.get("Metadata", {})}
+        if "ContentType" in head:
+            kwargs["ContentType"] = head["ContentType"]
+        upload_id = s3_client.create_multipart_upload(
+            Bucket=dst_bucket, Key=dst_obj, **kwargs
+        )["UploadId"]
+
+        def copy_part(part_number):
+            start, end = byte_ranges[part_number - 1]
+            response = _with_retries(
+                lambda: s3_client.upload_part_copy(
+                    Bucket=dst_bucket,
+                    Key=dst_obj,
+                    UploadId=upload_id,
+                    PartNumber=part_number,
+                    CopySource=copy_source,
+                    CopySourceRange=f"bytes={start}-{end}",
+                    CopySourceIfMatch=head["ETag"],
+                ),
+                retry_policy,
+            )
+            return {"ETag": response["CopyPartResult"]["ETag"], "PartNumber": part_number}
+
+        try:
+            with _timed("copy", nbytes=size):
+                parts = thread_map(
+                    copy_part, list(range(1, len(byte_ranges) + 1)), max_workers
+                )
+                s3_client.complete_multipart_upload(
+                    Bucket=dst_bucket,
+                    Key=dst_obj,
+                    UploadId=upload_id,
+                    MultipartUpload={"Parts": parts},
+                )
+        except BaseException:
+            s3_client.abort_multipart_upload(
+                Bucket=dst_bucket, Key=dst_obj, UploadId=upload_id
+            )
+            raise
+
+    controller = _active_controller()
+    if controller is not None:
+        controller.add_bytes(size)
+
+    return dst_obj
+
+
+def copy_objs(
+    s3_client,
+    src_bucket,
+    objs,
+    dst_bucket,
+    dst_objs=None,
+    delete_source=False,
+    max_workers=DEFAULT_MAX_WORKERS,
+    verbose=1,
+    controller=None,
+):
+    """
+    Copy multiple objects server-side (see `copy_single_object`). The objects
+    are copied concurrently on a bounded thread pool.
+
+    Args:
+        s3_client: botocore.client.S3. The s3_client to be called.
+        src_bucket: string. The s3 bucket of the source objects.
+        objs: list of strings, or of the listing dictionaries returned by
+            `iter_objects(meta=True)`. The source objects.
+        dst_bucket: string. The s3 bucket of the copies.
+        dst_objs: None or list of strings. The paths to the copies, in the same
+            order as `objs`. If None, the source paths are used.
+        delete_source: boolean. Whether or not to delete the source objects, with
+            batched DeleteObjects requests, once all of them have been copied.
+            A DeleteError is raised if any of them failed to be deleted.
+        max_workers: int. The number of objects copied concurrently.
+        verbose: int. print-out verbosity. If >=1, a progress bar will be added.
+        controller: None or ConcurrencyController. If passed, the number of
+            concurrent copies follows the controller's adaptive limit instead
+            of `max_workers`.
+
+    Returns:
+        dst_objs: list of strings. The paths to the copies
+    """
+
+    objs = [obj if isinstance(obj, dict) else {"Key": obj} for obj in objs]
+    if dst_objs is None:
+        dst_objs = [obj["Key"] for obj in objs]
+    assert len(dst_objs) == len(objs)
+
+    if delete_source and src_bucket == dst_bucket:
+        overlap = set(obj["Key"] for obj in objs) & set(dst_objs)
+        assert len(overlap) == 0, f"Cannot move objects onto themselves: {list(overlap)[:10]}"
+
+    def copy(args):
+        obj, dst_obj = args
+        return copy_single_object(
+            s3_client, src_bucket, obj["Key"], dst_bucket, dst_obj, size=obj.get("Size")
+        )
+
+    pbar = None
+    if verbose >= 1:
+        try:
+            _tqdm.tqdm._instances.clear()
+        except:
+            pass
+        pbar = _tqdm.tqdm(total=len(objs))
+
+    try:
+        dst_objs = thread_map(
+            copy, list(zip(objs, dst_objs)), max_workers, pbar, controller
+        )
+    finally:
+        if pbar is not None:
+            pbar.close()
+
+    if delete_source and len(objs) > 0:
+        n_deleted, errors = delete_objs(
+            s3_client,
+            src_bucket,
+            [obj["Key"] for obj in objs],
+            max_workers=max_workers,
+            controller=controller,
+        )
+        if len(errors) > 0:
+            raise DeleteError(errors, n_deleted)
+
+    return dst_objs
+
+
+def copy_endpoint(
+    namespace=None,
+    aws_credentials_fpath=None,
+    src_bucket=None,
+    src_endpoint=None,
+    dst_bucket=None,
+    dst_endpoint=None,
+    overwrite=True,
+    delete_source=False,
+    verbose=1,
+    max_workers=DEFAULT_MAX_WORKERS,
+    sharded=False,
+    controller=None,
+):
+    """
+    Copy an endpoint (bucket subfolder) to another bucket and/or endpoint
+    server-side, i.e. to promote data from a staging bucket to a training
+    bucket without downloading and re-uploading it.
+
+    Args:
+        namespace: string. The namespace of interest. call `fetch_credentials` to
+            see the namespaces
+        aws_credentials_fpath: None or string. The file path to where the aws
+           credentials file are stored. If None, the default path is resolved on first use
+        src_bucket: string. The s3 bucket of the source endpoint.
+        src_endpoint: string. The key prefix of the source endpoint.
+        dst_bucket: string. The s3 bucket of the copy. If None, `src_bucket` is used.
+        dst_endpoint: None or string. The key prefix of the copy. If None,
+            `src_endpoint` is used.
+        overwrite: boolean. Whether or not to overwrite the objects which
+            already exist at the destination.
+        delete_source: boolean. Whether or not to delete the source objects once
+            they have been copied.
+        verbose: int. print-out verbosity.
+        max_workers: int. The number of objects copied concurrently.
+        sharded: boolean. Whether to list the first level of prefixes under the
+            endpoint concurrently (see `iter_objects_sharded`).
+        controller: None or ConcurrencyController. If passed, the number of
+            concurrent copies follows the controller's adaptive limit instead
+            of `max_workers`.
+
+    Returns:
+        dst_objs: list of strings. The paths to the copies
+    """
+
+    if dst_bucket is None:
+        dst_bucket = src_bucket
+    src_endpoint = src_endpoint.lstrip("/")
+    if dst_endpoint is None:
+        dst_endpoint = src_endpoint
+    dst_endpoint = dst_endpoint.lstrip("/")
+
+    s3_client, s3_resource = ClientResource(
+        namespace=namespace, aws_credentials_fpath=aws_credentials_fpath
+    )
+
+    if verbose >= 1:
+        print(
+            f"copying {src_bucket}/{src_endpoint} to {dst_bucket}/{dst_endpoint}"
+        )
+
+    if sharded:
+        objs = iter_objects_sharded(
+            s3_client, src_bucket, prefix=src_endpoint, max_workers=max_workers, meta=True
+        )
+    else:
+        objs = iter_objects(s3_client, src_bucket, prefix=src_endpoint, meta=True)
+    objs = [obj for obj in objs if len(_os.path.basename(obj["Key"])) > 0]
+
+    if len(objs) == 0:
+        raise ValueError(f"No endpoint_objs found at {src_endpoint}")
+
+    dst_objs = [dst_endpoint + obj["Key"][len(src_endpoint) :] for obj in objs]
+
+    if not overwrite:
+        existing = set(iter_objects(s3_client, dst_bucket, prefix=dst_endpoint))
+        todo = [i for i, dst_obj in enumerate(dst_objs) if dst_obj not in existing]
+        objs = [objs[i] for i in todo]
+        dst_objs = [dst_objs[i] for i in todo]
+
+    dst_objs = copy_objs(
+        s3_client,
+        src_bucket,
+        objs,
+        dst_bucket,
+        dst_objs,
+        delete_source=delete_source,
+        max_workers=max_workers,
+        verbose=verbose - 1,
+        controller=controller,
+    )
+
+    if verbose >= 1:
+        print(f"\t...copy complete")
+
+    return dst_objs
+
+
+def move_endpoint(
+    namespace=None,
+    aws_credentials_fpath=None,
+    src_bucket=None,
+    src_endpoint=None,
+    dst_bucket=None,
+    dst_endpoint=None,
+    verbose=1,
+    max_workers=DEFAULT_MAX_WORKERS,
+    sharded=False,
+    controller=None,
+):
+    """
+    Move an endpoint (bucket subfolder) to another bucket and/or endpoint
+    server-side. The source objects are deleted in batches once all of them
+    have been copied. See `copy_endpoint` for the arguments.
+
+    Returns:
+        dst_objs: list of strings. The paths to the moved objects
+    """
+
+    return copy_endpoint(
+        namespace=namespace,
+        aws_credentials_fpath=aws_credentials_fpath,
+        src_bucket=src_bucket,
+        src_endpoint=src_endpoint,
+        dst_bucket=dst_bucket,
+        dst_endpoint=dst_endpoint,
+        overwrite=True,
+        delete_source=True,
+        verbose=verbose,
+        max_workers=max_workers,
+        sharded=sharded,
+        controller=controller,
+    )
+
+
+def _strip_etag(etag):
+    """Remove the quotes which s3 wraps ETags in"""
+    return etag.strip('"')
+
+
+def file_etag(fpath, part_size=None):
+    """
+    Compute the s3 ETag of a local file.
+    
     Args:
-        s3_client: The s3_client object to be called.
+        fpath: string. The path to the file of interest.
+        part_size: None or int. The multipart part size (bytes). If None, the ETag
+            of a single part upload (the md5 of the file) is returned. Otherwise,
+            the multipart ETag (the md5 of the concatenated part md5 digests,
+            followed by `-{n_parts}`) is returned.
+    
+    Returns:
+        etag: string. The ETag, without quotes
+    """
+
+    with open(fpath, "rb") as f:
+
+        if part_size is None:
+            md5 = _hashlib.md5()
+            for chunk in iter(lambda: f.read(MB), b""):
+                md5.update(chunk)
+            return md5.hexdigest()
+
+        digests = []
+        while True:
+            md5 = _hashlib.md5()
+            remaining = part_size
+            while remaining > 0:
+                chunk = f.read(min(MB, remaining))
+                if len(chunk) == 0:
+                    break
+                md5.update(chunk)
+                remaining -= len(chunk)
+
+            if remaining == part_size:
+                break
+            digests.append(md5.digest())
+
+            if remaining > 0:
+                break
+
+    etag = _hashlib.md5(b"".join(digests)).hexdigest() + f"-{len(digests)}"
+
+    return etag
+
+
+def _etag_part_sizes(size, n_parts):
+    """
+    The candidate part sizes which split a `size` byte object into `n_parts`,
+    starting with the part sizes used by `transfer_config` and the boto3 default
+    """
+
+    candidates = [
+        transfer_config(size).multipart_chunksize,
+        MULTIPART_CHUNKSIZE,
+        8 * MB,
+        5 * MB,
+        _math.ceil(size / n_parts / MB) * MB,
+    ]
+
+    part_sizes = []
+    for part_size in candidates:
+        if _math.ceil(size / part_size) == n_parts and part_size not in part_sizes:
+            part_sizes.append(part_size)
+
+    return part_sizes
+
+
+def etag_matches(fpath, etag):
+    """
+    Check whether a local file matches an s3 ETag. For multipart ETags, the
+    part size is inferred from the file size and the number of parts.
+    
+    Args:
+        fpath: string. The path to the file of interest.
+        etag: string. The ETag of the object in s3.
+    
+    Returns:
+        matches: boolean. Whether or not the file content matches the ETag
+    """
+
+    etag = _strip_etag(etag)
+
+    if "-" not in etag:
+        return file_etag(fpath) == etag
+
+    n_parts = int(etag.split("-")[-1])
+    for part_size in _etag_part_sizes(_os.path.getsize(fpath), n_parts):
+        if file_etag(fpath, part_size) == etag:
+            return True
+
+    return False
+
+
+def _load_sidecar(fpath):
+    """Load a json sidecar file, or an empty dictionary if it doesn't exist"""
+
+    if not _os.path.isfile(fpath):
+        return {}
+
+    with open(fpath, "r") as f:
+        data = _json.load(f)
+
+    return data
+
+
+def _save_sidecar(fpath, data):
+    """
+    Save a json sidecar file. The file is replaced atomically, so a killed
+    process never leaves a truncated file behind.
+    """
+
+    tmp_fpath = f"{fpath}.{_os.getpid()}.tmp"
+    with open(tmp_fpath, "w") as f:
+        _json.dump(data, f)
+    _os.replace(tmp_fpath, fpath)
+
+
+def load_manifest(local_bucket):
+    """
+    Load the sync manifest of a local bucket. The manifest maps each synced key
+    to the {"size", "mtime_ns", "etag"} of the local file when it was last
+    verified to match the s3 object.
+    
+    Args:
+        local_bucket: string. The path to the local bucket directory.
+    
+    Returns:
+        manifest: dictionary. An empty dictionary if there is no manifest yet
+    """
+    return _load_sidecar(_os.path.join(str(local_bucket), MANIFEST_FNAME))
+
+
+def save_manifest(local_bucket, manifest):
+    """
+    Save the sync manifest of a local bucket.
+    
+    Args:
+        local_bucket: string. The path to the local bucket directory.
+        manifest: dictionary. The manifest to be saved.
+    
+    Returns:
+        None
+    """
+    _save_sidecar(_os.path.join(str(local_bucket), MANIFEST_FNAME), manifest)
+
+
+def journal_fpath(local_bucket, direction, s3_bucket, endpoint):
+    """
+    The path of the transfer journal of an endpoint job, which is kept as a
+    sidecar file in the local bucket directory.
+
+    Args:
+        local_bucket: string. The path to the local bucket directory.
+        direction: string. "download" or "upload".
         s3_bucket: string. The s3 bucket of interest.
-        local_fpath: The path to where the file of interest is stored.
-        bucket_subdir: string. The subdirectory in the bucket where the file will be saved.
+        endpoint: string. The key prefix of the endpoint.
 
     Returns:
-        obj: str. The s3 objects paths for the uploaded files
+        fpath: string. The path to the journal
+    """
+
+    job = f"{s3_bucket}/{endpoint.strip('/')}".encode("utf-8")
+    digest = _hashlib.sha1(job).hexdigest()[:12]
 
+    return _os.path.join(
+        str(local_bucket), f"{JOURNAL_PREFIX}{direction}-{digest}.jsonl"
+    )
+
+
+class TransferJournal:
     """
-    obj = _os.path.join(bucket_subdir, _os.path.basename(local_fpath))
+    Append-only JSONL journal of an endpoint job, so a killed job can be resumed
+    without listing and checking every key again. The journal starts with a
+    "plan" record followed by one "planned" record per key (with its size and
+    ETag), and the transfers append "started" and "done" records as they run.
+    A final "complete" record marks the end of the job.
 
-    if verbose >= 1:
-        print("\t", obj, end="\r")
+    Each record is flushed as it is written. A line torn by a crash is ignored
+    when the journal is loaded, so the key it refers to is transferred again.
 
-    s3_client.upload_file(Filename=local_fpath, Bucket=s3_bucket, Key=obj)
+    Args:
+        fpath: string. The path to the journal file (see `journal_fpath`).
+    """
 
-    return obj
+    def __init__(self, fpath):
+        self.fpath = str(fpath)
+        self._lock = _threading.Lock()
+        self._file = None
+        self._planned = {}
+
+    def load(self):
+        """
+        Load the state of the journaled job.
+
+        Returns:
+            state: None if there is no journal, else a dictionary with the
+                "plan" record, the "planned" and "done" records keyed by key,
+                the set of keys "in_flight" (started but not done), and whether
+                the job is "complete"
+        """
+
+        if not _os.path.isfile(self.fpath):
+            return None
+
+        state = {
+            "plan": None,
+            "planned": {},
+            "done": {},
+            "in_flight": set(),
+            "complete": False,
+        }
+        with open(self.fpath, "r") as f:
+            for line in f:
+                try:
+                    record = _json.loads(line)
+                except ValueError:
+                    continue
+
+                event = record.get("event")
+                if event == "plan":
+                    state["plan"] = record
+                elif event == "planned":
+                    state["planned"][record["key"]] = record
+                elif event == "started":
+                    state["in_flight"].add(record["key"])
+                elif event == "done":
+                    state["done"][record["key"]] = record
+                    state["in_flight"].discard(record["key"])
+                elif event == "complete":
+                    state["complete"] = True
+
+        if state["plan"] is None:
+            return None
+
+        self._planned = state["planned"]
+
+        return state
+
+    def plan(self, entries, **fields):
+        """
+        Start a new journal, replacing any existing one.
+
+        Args:
+            entries: list of dictionaries with the "key" of each planned
+                transfer, plus any fields to record (i.e. "size" and "etag").
+            fields: additional fields of the "plan" record.
+
+        Returns:
+            None
+        """
+
+        self.close()
+
+        records = [dict(event="plan", created=_time.time(), **fields)]
+        records += [dict(entry, event="planned") for entry in entries]
+
+        tmp_fpath = f"{self.fpath}.{_os.getpid()}.tmp"
+        with open(tmp_fpath, "w") as f:
+            for record in records:
+                f.write(_json.dumps(record) + "\n")
+            f.flush()
+            _os.fsync(f.fileno())
+        _os.replace(tmp_fpath, self.fpath)
+
+        self._planned = {entry["key"]: entry for entry in entries}
+
+    def _append(self, record):
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.fpath, "a")
+            self._file.write(_json.dumps(record) + "\n")
+            self._file.flush()
+
+    def start(self, key):
+        """Record that the transfer of `key` started"""
+        self._append({"event": "started", "key": key})
+
+    def done(self, key, **fields):
+        """
+        Record that the transfer of `key` finished. The size and ETag of the
+        planned record are included unless they are passed in `fields`.
+        """
+        planned = self._planned.get(key, {})
+        record = {"event": "done", "key": key}
+        for name in ["size", "etag"]:
+            if name in planned:
+                record[name] = planned[name]
+        record.update(fields)
+        self._append(record)
+
+    def complete(self):
+        """Record that the whole job finished"""
+        self._append({"event": "complete", "finished": _time.time()})
+        with self._lock:
+            _os.fsync(self._file.fileno())
+        self.close()
+
+    def close(self):
+        """Close the journal file"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def _journaled(fxn, journal, key_fxn=lambda item: item, fields_fxn=None):
+    """
+    Wrap `fxn(item)` so the start and end of each call are recorded in the
+    `journal` under the key `key_fxn(item)`. `fields_fxn(item)`, if passed, is
+    called before `fxn` and returns additional fields of the "done" record, so
+    they describe the source as it was when its transfer started.
+    """
 
+    if journal is None:
+        return fxn
 
-def upload_objs(
-    s3_client, s3_bucket, fpaths,
+    def journaled_fxn(item):
+        key = key_fxn(item)
+        journal.start(key)
+        fields = {} if fields_fxn is None else fields_fxn(item)
+        output = fxn(item)
+        journal.done(key, **fields)
+        return output
+
+    return journaled_fxn
+
+
+def hash_files(
+    fpaths,
+    part_sizes=None,
+    max_workers=DEFAULT_MAX_WORKERS,
+    use_processes=False,
 ):
     """
-    Upload multiple files to the specified `s3_bucket`. Note that each
-    filepath should be in a directory or subdirectory matching the `s3_bucket`
-    name.
+    Compute the s3 ETags of local files concurrently (see `file_etag`).
+    
+    Args:
+        fpaths: list of strings. The paths to the files of interest.
+        part_sizes: None or list of None/int. The multipart part size for each file.
+            If None, the single part ETag (md5) is computed for every file.
+        max_workers: int. The number of files hashed concurrently.
+        use_processes: boolean. Whether to hash on a process pool instead of a
+            thread pool. hashlib releases the GIL, so threads usually suffice.
+    
+    Returns:
+        etags: list of strings. The ETag of each file, without quotes
+    """
+
+    fpaths = list(fpaths)
+    if part_sizes is None:
+        part_sizes = [None] * len(fpaths)
+
+    if len(fpaths) == 0:
+        return []
+
+    if use_processes and max_workers is not None and max_workers > 1:
+        with _ProcessPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(file_etag, fpaths, part_sizes, chunksize=16))
+
+    return thread_map(
+        lambda args: file_etag(*args), list(zip(fpaths, part_sizes)), max_workers
+    )
+
 
+def _source_matches(fpath, head):
+    """
+    Whether a local file matches the uncompressed content of a compressed object,
+    per the size and md5 recorded in its metadata (see `upload_single_object`)
+    """
+
+    metadata = head.get("Metadata", {})
+    if object_codec(head) is None or SOURCE_ETAG_METADATA_KEY not in metadata:
+        return False
+
+    if int(metadata.get(SOURCE_SIZE_METADATA_KEY, -1)) != _os.path.getsize(fpath):
+        return False
+
+    return file_etag(fpath) == metadata[SOURCE_ETAG_METADATA_KEY]
+
+
+def _changed_files(
+    local_bucket,
+    keys,
+    remote,
+    manifest,
+    max_workers=None,
+    use_processes=False,
+    s3_client=None,
+    s3_bucket=None,
+):
+    """
+    Find the local files which differ from their s3 objects. A file is unchanged
+    if its object exists with the same size, and the file's ETag matches the
+    object's ETag. If the file's size and mtime match its manifest entry, the
+    object ETag cached in the manifest is used instead of hashing the file. The
+    other files are hashed concurrently.
+
+    Compressed objects differ from their local files as stored, so when an
+    `s3_client` is passed, the objects which don't match are fetched with
+    `head_object`, and compared by the size and md5 of their uncompressed content.
+    The matches are added to the `manifest` under the ETag of the object, so they
+    are neither hashed nor fetched again while the file is unchanged.
+    
     Args:
-        s3_client: The s3_client object to be called.
-        s3_bucket: string. The s3 bucket of interest.
-        fpaths: list of strings. The paths to where the files of interest are stored.
-            Note that each filepath should be in a directory or subdirectory 
-            matching the `s3_bucket` name.
+        local_bucket: string. The path to the local bucket directory.
+        keys: list of strings. The keys of the local files of interest.
+        remote: dictionary of key: (size, etag) for the s3 objects.
+        manifest: dictionary. The sync manifest (see `load_manifest`).
+        max_workers: int. The number of files hashed (and objects fetched)
+            concurrently.
+        use_processes: boolean. Whether to hash on a process pool (see `hash_files`).
+        s3_client: None or botocore.client.S3. The s3_client used to compare
+            compressed objects. If None, they are always reported as changed.
+        s3_bucket: None or string. The s3 bucket of the objects.
+        
+    Returns:
+        changed: list of booleans. Whether or not each file differs from s3
+    """
+
+    changed = [True] * len(keys)
+    stats = {}
+
+    def record(i, etag):
+        stat = stats[keys[i]]
+        manifest[keys[i]] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "etag": etag,
+        }
+        changed[i] = False
+
+    # the files which differ from their object as stored, which may be compressed
+    mismatched = []
+
+    candidates = []
+    part_sizes = []
+    for i, key in enumerate(keys):
+        if key not in remote:
+            continue
+
+        size, etag = remote[key]
+        stat = _os.stat(_os.path.join(local_bucket, key))
+        stats[key] = stat
+
+        entry = manifest.get(key)
+        if (
+            entry is not None
+            and entry["size"] == stat.st_size
+            and entry["mtime_ns"] == stat.st_mtime_ns
+        ):
+            changed[i] = entry["etag"] != etag
+            if changed[i]:
+                mismatched.append(i)
+            continue
+
+        if stat.st_size != size:
+            mismatched.append(i)
+            continue
+
+        part_size = None
+        if "-" in etag:
+            candidate_part_sizes = _etag_part_sizes(size, int(etag.split("-")[-1]))
+            if len(candidate_part_sizes) == 0:
+                continue
+            part_size = candidate_part_sizes[0]
+
+        candidates.append(i)
+        part_sizes.append(part_size)
+
+    etags = hash_files(
+        [_os.path.join(local_bucket, keys[i]) for i in candidates],
+        part_sizes,
+        max_workers=max_workers,
+        use_processes=use_processes,
+    )
+
+    for i, local_etag in zip(candidates, etags):
+        etag = remote[keys[i]][1]
+        fpath = _os.path.join(local_bucket, keys[i])
+
+        # multipart ETags with an ambiguous part size are checked one by one
+        if local_etag == etag or ("-" in etag and etag_matches(fpath, etag)):
+            record(i, etag)
+        else:
+            mismatched.append(i)
 
+    if s3_client is None:
+        return changed
+
+    # already compressed file types are never stored compressed (see `pick_codec`)
+    mismatched = [
+        i
+        for i in mismatched
+        if _os.path.splitext(keys[i])[1].lower() not in COMPRESSED_EXTENSIONS
+    ]
+
+    def compare(i):
+        head = s3_client.head_object(Bucket=s3_bucket, Key=keys[i])
+        if _source_matches(_os.path.join(local_bucket, keys[i]), head):
+            return _strip_etag(head["ETag"])
+        return None
+
+    for i, etag in zip(mismatched, thread_map(compare, mismatched, max_workers)):
+        if etag is not None:
+            record(i, etag)
+
+    return changed
+
+
+def _is_transfer_file(fpath):
+    """
+    Whether a local file is one of the sidecar or partial files kept by the
+    transfer helpers, which are never uploaded
+    """
+    fname = _os.path.basename(fpath)
+    return fname.startswith(SIDECAR_PREFIX) or fname.endswith(tuple(PARTIAL_SUFFIXES))
+
+
+def _list_local_keys(local_bucket, prefix=""):
+    """
+    List the keys (paths relative to `local_bucket`) of the local files
+    starting with `prefix`, excluding the sidecar and partial files
+    """
+
+    search_dir = _os.path.join(local_bucket, _os.path.dirname(prefix))
+
+    keys = []
+    for fpath in _files.list_files(search_dir):
+        key = _os.path.relpath(fpath, local_bucket)
+        if key.startswith(prefix) and not _is_transfer_file(key):
+            keys.append(key)
+
+    return keys
+
+
+def plan_sync(s3_client, s3_bucket, local_bucket, prefix="", direction="download"):
+    """
+    Compare the objects under a prefix in s3 with the local files under the same
+    prefix, and plan the transfers needed to bring the destination up to date.
+    s3 objects are compared by size + ETag, local files by size + mtime + the
+    ETag cached in the manifest (the file is only hashed if its size or mtime changed).
+    Compressed objects (see `upload_single_object`) are compared by the size and
+    md5 of their uncompressed content, which are read with `head_object`.
+    
+    Args:
+        s3_client: botocore.client.S3. The s3_client to be called.
+        s3_bucket: string. The s3 bucket of interest.
+        local_bucket: string. The path to the local bucket directory.
+        prefix: string. The key prefix of interest.
+        direction: string. "download" (s3 -> local) or "upload" (local -> s3).
+    
     Returns:
-        objs: list of strings. The s3 objects paths for the uploaded files
+        plan: dictionary with the keys:
+            - "direction": the direction of the sync
+            - "add": list of keys missing at the destination
+            - "update": list of keys whose content differs
+            - "delete": list of keys which only exist at the destination
+            - "remote": dictionary of key: (size, etag) for the s3 objects
     """
 
-    try:
-        _tqdm.tqdm._instances.clear()
-    except:
-        pass
-    pbar = _tqdm.tqdm(fpaths)
+    assert direction in ["download", "upload"], f"invalid direction: {direction}"
 
-    objs = []
-    for fpath in fpaths:
+    local_bucket = str(local_bucket)
+    manifest = load_manifest(local_bucket)
+
+    remote = {}
+    for obj in iter_objects(s3_client, s3_bucket, prefix=prefix, meta=True):
+        if len(_os.path.basename(obj["Key"])) > 0:
+            remote[obj["Key"]] = (obj["Size"], _strip_etag(obj["ETag"]))
+
+    local_keys = set(_list_local_keys(local_bucket, prefix))
+
+    remote_only = sorted(key for key in remote if key not in local_keys)
+    local_only = sorted(key for key in local_keys if key not in remote)
+
+    common_keys = sorted(local_keys.intersection(remote))
+    changed = _changed_files(
+        local_bucket,
+        common_keys,
+        remote,
+        manifest,
+        DEFAULT_MAX_WORKERS,
+        s3_client=s3_client,
+        s3_bucket=s3_bucket,
+    )
+    update = [key for key, is_changed in zip(common_keys, changed) if is_changed]
+
+    # keep the ETags which were verified while planning
+    if _os.path.isdir(local_bucket):
+        save_manifest(local_bucket, manifest)
+
+    plan = {
+        "direction": direction,
+        "add": remote_only if direction == "download" else local_only,
+        "update": update,
+        "delete": local_only if direction == "download" else remote_only,
+        "remote": remote,
+    }
+
+    return plan
+
+
+def _print_plan(plan):
+    """print-out a summary of a sync plan"""
+    print(
+        f"{plan['direction']} plan:",
+        f"{len(plan['add'])} to add,",
+        f"{len(plan['update'])} to update,",
+        f"{len(plan['delete'])} to delete",
+    )
 
-        pbar.update()
 
-        assert s3_bucket in fpath, " ".join(
-            [
-                f"Failed to find the `s3_bucket`: {s3_bucket}",
-                f"in the `fpath`:{fpath}.",
-                "The obj path in the `s3_bucket` cannot be interpreted",
-                "without this information",
-            ]
+def execute_sync(
+    s3_resource,
+    s3_client,
+    s3_bucket,
+    local_bucket,
+    plan,
+    delete=False,
+    max_workers=DEFAULT_MAX_WORKERS,
+    verbose=1,
+    controller=None,
+    codec=None,
+):
+    """
+    Execute a plan built by `plan_sync`, transferring only the added and updated
+    keys, largest first. Downloaded objects are not unzipped, so the local bucket
+    mirrors s3.
+    
+    Args:
+        s3_resource: The s3_resource object to be called.
+        s3_client: botocore.client.S3. The s3_client to be called.
+        s3_bucket: string. The s3 bucket of interest.
+        local_bucket: string. The path to the local bucket directory.
+        plan: dictionary. The plan returned by `plan_sync`.
+        delete: boolean. Whether or not to delete the keys which only exist at
+            the destination. A DeleteError is raised if any of the s3 objects
+            failed to be deleted.
+        max_workers: int. The number of concurrent transfers.
+        verbose: int. print-out verbosity. If >=1, a progress bar will be added.
+        controller: None or ConcurrencyController. If passed, the number of
+            concurrent transfers follows the controller's adaptive limit instead
+            of `max_workers`.
+        codec: None or string. The codec of the compressed object storage of
+            the uploads. See `upload_single_object`.
+    
+    Returns:
+        keys: list of strings. The keys which were transferred
+    """
+
+    local_bucket = str(local_bucket)
+    manifest = load_manifest(local_bucket)
+    manifest_lock = _threading.Lock()
+
+    keys = plan["add"] + plan["update"]
+
+    range_workers = _range_workers(max_workers, controller)
+
+    def download(key):
+        fpath = download_single_object(
+            s3_resource,
+            s3_bucket,
+            key,
+            local_bucket,
+            verbose=0,
+            unzip=False,
+            range_workers=range_workers,
+        )
+        stat = _os.stat(fpath)
+        with manifest_lock:
+            manifest[key] = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "etag": plan["remote"][key][1],
+            }
+        return key
+
+    def upload(key):
+        fpath = _os.path.join(local_bucket, key)
+        stat = _os.stat(fpath)
+        upload_single_object(
+            s3_client, s3_bucket, fpath, _os.path.dirname(key), verbose=0, codec=codec
         )
+        etag = s3_client.head_object(Bucket=s3_bucket, Key=key)["ETag"]
+
+        # the uploaded content is only known if the file didn't change meanwhile
+        uploaded_stat = _os.stat(fpath)
+        with manifest_lock:
+            if (uploaded_stat.st_size, uploaded_stat.st_mtime_ns) == (
+                stat.st_size,
+                stat.st_mtime_ns,
+            ):
+                manifest[key] = {
+                    "size": stat.st_size,
+                    "mtime_ns": stat.st_mtime_ns,
+                    "etag": _strip_etag(etag),
+                }
+            else:
+                manifest.pop(key, None)
+        return key
 
-        bucket_subdir = _os.path.dirname(fpath.split(s3_bucket + "/")[-1])
+    pbar = None
+    if verbose >= 1:
+        try:
+            _tqdm.tqdm._instances.clear()
+        except:
+            pass
+        pbar = _tqdm.tqdm(total=len(keys))
 
-        obj = upload_single_object(
-            s3_client, s3_bucket, fpath, bucket_subdir, verbose=0
-        )
-        objs.append(obj)
+    if plan["direction"] == "download":
+        sizes = [plan["remote"][key][0] for key in keys]
+    else:
+        sizes = [_os.path.getsize(_os.path.join(local_bucket, key)) for key in keys]
 
-    pbar.close()
+    try:
+        if plan["direction"] == "download":
+            thread_map(download, keys, max_workers, pbar, controller, sizes)
+        else:
+            thread_map(upload, keys, max_workers, pbar, controller, sizes)
+    finally:
+        if pbar is not None:
+            pbar.close()
+        save_manifest(local_bucket, manifest)
+
+    if delete and len(plan["delete"]) > 0:
+        if plan["direction"] == "download":
+            for key in plan["delete"]:
+                _os.remove(_os.path.join(local_bucket, key))
+                manifest.pop(key, None)
+            save_manifest(local_bucket, manifest)
+        else:
+            n_deleted, errors = delete_objs(
+                s3_client,
+                s3_bucket,
+                plan["delete"],
+                max_workers=max_workers,
+                controller=controller,
+            )
+            if len(errors) > 0:
+                raise DeleteError(errors, n_deleted)
 
-    return objs
+    return keys
 
 
 def download_endpoint(
     namespace,
-    aws_credentials_fpath=fetch_aws_credentials_fpath(),
+    aws_credentials_fpath=None,
     s3_bucket=None,
     local_bucket=None,
     endpoint=None,
     overwrite=False,
     verbose=1,
+    max_workers=DEFAULT_MAX_WORKERS,
+    sync=False,
+    delete=False,
+    dry_run=False,
+    sharded=False,
+    controller=None,
+    resume=False,
 ):
     """
     Download an endpoint (bucket subfolder) to the local_bucket directory.
 
     Args:
         namespace: string. The namespace of interest. call `fetch_credentials` to see the namespaces
-        aws_credentials_fpath: string. The file path to where the aws credentials
-           file are stored.
+        aws_credentials_fpath: None or string. The file path to where the aws
+           credentials file are stored. If None, the default path is resolved on first use
+        s3_bucket: string. The s3 bucket of interest.
+        local_bucket: string. The path to where objects will be downloaded.
+        endpoint: string. The key prefix of the endpoint in the s3 bucket.
+            Only the objects under this prefix are listed and downloaded.
+        overwrite: boolean. Whether or not to overwrite the existing objects if
+            they are already present locally
+        verbose: int. print-out verbosity.
+        max_workers: int. The number of objects downloaded concurrently.
+        sync: boolean. Whether to only download the objects which are missing or
+            whose content changed (see `plan_sync`), instead of using `overwrite`.
+        delete: boolean. In sync mode, whether or not to delete the local files
+            which no longer exist in s3.
+        dry_run: boolean. In sync mode, whether to only build and print the plan.
+        sharded: boolean. Whether to list the first level of prefixes under the
+            endpoint concurrently (see `iter_objects_sharded`).
+        controller: None or ConcurrencyController. If passed, the number of
+            concurrent downloads follows the controller's adaptive limit instead
+            of `max_workers`.
+        resume: boolean. Whether to record the job in a journal sidecar file
+            (see `TransferJournal`), and continue an unfinished job from its
+            journal without listing the endpoint again. Not used in sync mode.
 
-    Returns: None.
+    Returns:
+        plan: None, or in sync mode, the dictionary returned by `plan_sync`
     
     """
 
     if not _os.path.isdir(local_bucket):
         _os.makedirs(local_bucket)
 
-    s3_client, s3_resource = ClientResource(namespace=namespace,)
+    s3_client, s3_resource = ClientResource(
+        namespace=namespace, aws_credentials_fpath=aws_credentials_fpath
+    )
 
     if verbose >= 1:
         print(
             f"downloading bucket: {s3_bucket}, endpoint: {endpoint} to local_bucket: {local_bucket}"
         )
 
-    local_files = _files.list_files(local_bucket)
-    local_files = [file.replace(local_bucket, "")[1:] for file in local_files]
-    s3_objs = list_objects(s3_resource, s3_bucket)
-    endpoint_objs = [obj for obj in s3_objs if endpoint in obj]
+    if sync:
+        plan = plan_sync(
+            s3_resource.meta.client,
+            s3_bucket,
+            local_bucket,
+            prefix=endpoint.lstrip("/"),
+            direction="download",
+        )
+        if verbose >= 1:
+            _print_plan(plan)
+        if not dry_run:
+            execute_sync(
+                s3_resource,
+                s3_client,
+                s3_bucket,
+                local_bucket,
+                plan,
+                delete=delete,
+                max_workers=max_workers,
+                verbose=verbose - 1,
+                controller=controller,
+            )
+        return plan
+
+    journal = None
+    state = None
+    if resume:
+        journal = TransferJournal(
+            journal_fpath(local_bucket, "download", s3_bucket, endpoint)
+        )
+        state = journal.load()
+        if state is not None and state["complete"]:
+            state = None
 
-    if len(endpoint_objs) is 0:
-        raise ValueError(f"No endpoint_objs found at {endpoint}")
+    if state is not None:
+        endpoint_objs = [key for key in state["planned"] if key not in state["done"]]
+        sizes = {key: state["planned"][key].get("size", 0) for key in endpoint_objs}
+        if verbose >= 1:
+            print(
+                f"resuming from journal: {len(state['done'])}/{len(state['planned'])} objs done"
+            )
+    else:
+        endpoint_objs = list_objects(
+            s3_resource,
+            s3_bucket,
+            prefix=endpoint.lstrip("/"),
+            sharded=sharded,
+            max_workers=max_workers,
+            meta=True,
+        )
 
-    if verbose >= 2:
-        pbar = _tf.keras.utils.Progbar(len(s3_objs))
+        if len(endpoint_objs) == 0:
+            raise ValueError(f"No endpoint_objs found at {endpoint}")
 
-    for p, obj in enumerate(endpoint_objs):
+        if journal is not None:
+            journal.plan(
+                [
+                    {"key": obj["Key"], "size": obj["Size"], "etag": obj["ETag"]}
+                    for obj in endpoint_objs
+                ],
+                direction="download",
+                bucket=s3_bucket,
+                endpoint=endpoint,
+            )
 
-        if overwrite:
-            download_single_object(s3_resource, s3_bucket, obj, local_bucket, verbose=0)
-        elif overwrite is False:
-            if obj not in local_files:
-                download_single_object(
-                    s3_resource, s3_bucket, obj, local_bucket, verbose=0
-                )
+        sizes = {obj["Key"]: obj["Size"] for obj in endpoint_objs}
+        endpoint_objs = [obj["Key"] for obj in endpoint_objs]
 
-        if verbose >= 2:
-            pbar.update(p + 1)
+    try:
+        download_objs(
+            s3_resource,
+            s3_bucket,
+            endpoint_objs,
+            local_bucket,
+            overwrite=overwrite,
+            max_workers=max_workers,
+            verbose=verbose - 1,
+            controller=controller,
+            journal=journal,
+            sizes=sizes,
+        )
+    finally:
+        if journal is not None:
+            journal.close()
+
+    if journal is not None:
+        journal.complete()
 
     if verbose == 1:
         print(f"\t...download complete")
@@ -587,12 +4960,19 @@ def download_endpoint(
 
 def upload_endpoint(
     namespace=None,
-    aws_credentials_fpath=fetch_aws_credentials_fpath(),
+    aws_credentials_fpath=None,
     s3_bucket=None,
     local_bucket=None,
     local_endpoint_dir=None,
     overwrite=True,
     verbose=2,
+    max_workers=DEFAULT_MAX_WORKERS,
+    sync=False,
+    delete=False,
+    dry_run=False,
+    controller=None,
+    resume=False,
+    codec=None,
 ):
     """
     
@@ -601,8 +4981,8 @@ def upload_endpoint(
     Args:
         namespace: string. The namespace of interest. call `fetch_credentials` to 
             see the namespaces
-        aws_credentials_fpath: string. The file path to where the aws credentials
-           file are stored.
+        aws_credentials_fpath: None or string. The file path to where the aws
+           credentials file are stored. If None, the default path is resolved on first use
         s3_bucket: string. The s3 bucket of interest.
         local_bucket: string. The path to where objects will be downloaded to and 
             uploaded from.
@@ -610,16 +4990,35 @@ def upload_endpoint(
             will be uploaded.
         overwrite: boolean. Whether or not to overwrite the mcqueen data with the local data.
         verbose: int. print-out verbosity.
+        max_workers: int. The number of files uploaded concurrently.
+        sync: boolean. Whether to only upload the files which are missing or
+            whose content changed (see `plan_sync`), instead of using `overwrite`.
+            The local ETags are cached in the sync manifest, so unchanged files
+            are only hashed once.
+        delete: boolean. In sync mode, whether or not to delete the s3 objects
+            which no longer exist locally.
+        dry_run: boolean. In sync mode, whether to only build and print the plan.
+        controller: None or ConcurrencyController. If passed, the number of
+            concurrent uploads follows the controller's adaptive limit instead
+            of `max_workers`.
+        resume: boolean. Whether to record the job in a journal sidecar file
+            (see `TransferJournal`), and continue an unfinished job from its
+            journal without listing the endpoint again. Files which changed since
+            their journaled upload are uploaded again. Not used in sync mode.
+        codec: None or string. The codec of the compressed object storage. See
+            `upload_single_object`.
 
     Returns: 
-        None
+        plan: None, or in sync mode, the dictionary returned by `plan_sync`
             
     """
 
     if not _os.path.isdir(local_bucket):
         _os.makedirs(local_bucket)
 
-    s3_client, s3_resource = ClientResource(namespace=namespace,)
+    s3_client, s3_resource = ClientResource(
+        namespace=namespace, aws_credentials_fpath=aws_credentials_fpath
+    )
 
     s3_endpoint = local_endpoint_dir.replace(local_bucket, "")
     if s3_endpoint[0] == "/":
@@ -637,35 +5036,145 @@ def upload_endpoint(
             )
         )
 
-    local_files = _files.list_files(local_endpoint_dir)
-    s3_objs = list_objects(s3_resource, s3_bucket)
-    endpoint_objs = [obj for obj in s3_objs if s3_endpoint in obj]
+    if sync:
+        plan = plan_sync(
+            s3_resource.meta.client,
+            s3_bucket,
+            local_bucket,
+            prefix=s3_endpoint.rstrip("/") + "/",
+            direction="upload",
+        )
+        if verbose >= 1:
+            _print_plan(plan)
+        if not dry_run:
+            execute_sync(
+                s3_resource,
+                s3_client,
+                s3_bucket,
+                local_bucket,
+                plan,
+                delete=delete,
+                max_workers=max_workers,
+                verbose=verbose - 1,
+                controller=controller,
+                codec=codec,
+            )
+        return plan
 
-    if len(local_files) is 0:
-        raise ValueError(f"No local_files found at {endpoint}")
+    journal = None
+    state = None
+    if resume:
+        journal = TransferJournal(
+            journal_fpath(local_bucket, "upload", s3_bucket, s3_endpoint)
+        )
+        state = journal.load()
+        if state is not None and state["complete"]:
+            state = None
+
+    if state is not None:
+        uploads = []
+        for key in state["planned"]:
+            local_file = _os.path.join(local_bucket, key)
+            if not _os.path.isfile(local_file):
+                continue
+            done = state["done"].get(key)
+            if done is not None:
+                stat = _os.stat(local_file)
+                if (stat.st_size, stat.st_mtime_ns) == (done["size"], done["mtime_ns"]):
+                    continue
+            uploads.append((local_file, _os.path.dirname(key)))
+        if verbose >= 1:
+            print(
+                f"resuming from journal: {len(uploads)}/{len(state['planned'])} files left"
+            )
+    else:
+        local_files = [
+            local_file
+            for local_file in _files.list_files(local_endpoint_dir)
+            if not _is_transfer_file(local_file)
+        ]
 
-    if verbose >= 2:
-        pbar = _tf.keras.utils.Progbar(len(local_files))
+        if len(local_files) == 0:
+            raise ValueError(f"No local_files found at {local_endpoint_dir}")
 
-    for p, local_file in enumerate(local_files):
+        # the existing objects are only needed to skip them
+        remote = {}
+        if not overwrite:
+            remote = {
+                obj["Key"]: obj
+                for obj in iter_objects(
+                    s3_resource.meta.client, s3_bucket, prefix=s3_endpoint, meta=True
+                )
+            }
+
+        uploads = []
+        for local_file in local_files:
+
+            bucket_subdir = _os.path.dirname(local_file.replace(local_bucket, ""))
+            if bucket_subdir[0] == "/":
+                bucket_subdir = bucket_subdir[1:]
+            obj = _os.path.join(bucket_subdir, _os.path.basename(local_file))
+
+            if overwrite or obj not in remote:
+                uploads.append((local_file, bucket_subdir))
+
+        if journal is not None:
+            entries = []
+            for local_file, bucket_subdir in uploads:
+                stat = _os.stat(local_file)
+                entries.append(
+                    {
+                        "key": _os.path.join(bucket_subdir, _os.path.basename(local_file)),
+                        "size": stat.st_size,
+                        "mtime_ns": stat.st_mtime_ns,
+                    }
+                )
+            journal.plan(
+                entries, direction="upload", bucket=s3_bucket, endpoint=s3_endpoint
+            )
 
-        bucket_subdir = _os.path.dirname(local_file.replace(local_bucket, ""))
-        if bucket_subdir[0] == "/":
-            bucket_subdir = bucket_subdir[1:]
-        obj = _os.path.join(bucket_subdir, _os.path.basename(local_file))
+    def upload(upload_args):
+        local_file, bucket_subdir = upload_args
+        return upload_single_object(
+            s3_client, s3_bucket, local_file, bucket_subdir, verbose=0, codec=codec
+        )
 
-        if overwrite:
-            upload_single_object(
-                s3_client, s3_bucket, local_file, bucket_subdir, verbose=0
-            )
-        elif overwrite is False:
-            if obj not in s3_objs:
-                upload_single_object(
-                    s3_client, s3_bucket, local_file, bucket_subdir, verbose=0
-                )
+    pbar = None
+    if verbose >= 2:
+        try:
+            _tqdm.tqdm._instances.clear()
+        except:
+            pass
+        pbar = _tqdm.tqdm(total=len(uploads))
 
-        if verbose >= 2:
-            pbar.update(p + 1)
+    def upload_key(upload_args):
+        local_file, bucket_subdir = upload_args
+        return _os.path.join(bucket_subdir, _os.path.basename(local_file))
+
+    def upload_stat(upload_args):
+        # taken before the upload (the planned stat, unless the file changed since
+        # the plan), so a file rewritten during its upload doesn't match its
+        # "done" record, and is uploaded again on resume
+        stat = _os.stat(upload_args[0])
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    try:
+        thread_map(
+            _journaled(upload, journal, upload_key, upload_stat),
+            uploads,
+            max_workers,
+            pbar,
+            controller,
+            [_os.path.getsize(local_file) for local_file, bucket_subdir in uploads],
+        )
+    finally:
+        if pbar is not None:
+            pbar.close()
+        if journal is not None:
+            journal.close()
+
+    if journal is not None:
+        journal.complete()
 
     if verbose >= 1:
         print(f"\t...upload complete")
@@ -82,6 +82,46 @@ def load(fpath):
     return output
 
 
+def loads(data, filename):
+    """
+    Dynamic function for decoding the content of a file held in memory, i.e.
+    the buffers returned by `boto3.get_bytes`. The format is picked from the
+    filename, like `load`.
+    
+    Args:
+        data: bytes, bytearray or memoryview. The content of the file
+        filename: string. The name (or path) of the file
+        
+    Returns:
+        output: The file content decoded in the appropriate format
+    """
+
+    filename = _os.path.basename(str(filename))
+
+    if "yaml" in filename or "yml" in filename:
+
+        output = _yaml.load(str(data, "utf-8"), Loader=_yaml.FullLoader)
+
+    elif "json" in filename:
+
+        output = _json.loads(str(data, "utf-8"))
+
+    else:
+        raise (
+            NotImplementedError(
+                " ".join(
+                    [
+                        "The loads function could not interpret the necessary method",
+                        f"to decode the file based on the filename {filename}. Consider",
+                        "updating the function to handle files of this type",
+                    ]
+                )
+            )
+        )
+
+    return output
+
+
 def save(data, fpath, verbose=1):
     """
     Dynamic function for saving an arbitrary set of data
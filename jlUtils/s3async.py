@@ -0,0 +1,531 @@
+"""
+asyncio counterparts of the boto3 transfer helpers, built on aiobotocore.
+Many concurrent requests share one event loop instead of a thread each.
+aiobotocore is an optional dependency, only needed once these functions are called.
+"""
+import asyncio as _asyncio
+import contextlib as _contextlib
+import math as _math
+import os as _os
+import warnings as _warnings
+
+try:
+    from aiobotocore.config import AioConfig as _AioConfig
+    from aiobotocore.session import get_session as _get_session
+except ImportError:
+    _get_session = None
+
+from fuegodata.utils import boto3 as _s3
+from fuegodata.utils import zipper as _zipper
+
+# default number of requests in flight at once
+DEFAULT_MAX_IN_FLIGHT = 64
+
+# the request bodies of the uploads are read into memory, so files are sent as
+# multipart uploads from a lower size than the threaded helpers use, and the
+# bytes buffered by all the uploads of a call are capped by DEFAULT_MAX_BUFFER_BYTES
+MULTIPART_THRESHOLD = 16 * _s3.MB
+MULTIPART_CHUNKSIZE = 8 * _s3.MB
+DEFAULT_MAX_BUFFER_BYTES = 256 * _s3.MB
+
+
+def _require_aiobotocore():
+    """Raise an ImportError if aiobotocore is missing"""
+    if _get_session is None:
+        raise ImportError("The asyncio s3 helpers require the `aiobotocore` package")
+
+
+@_contextlib.asynccontextmanager
+async def aclient(
+    region_names=_s3.REGION_NAMES,
+    namespace=None,
+    aws_credentials_fpath=None,
+    port="443",
+    endpoint_url=None,
+    max_pool_connections=_s3.DEFAULT_MAX_POOL_CONNECTIONS,
+):
+    """
+    Async context manager which opens an aiobotocore s3 client on the first
+    region in `region_names` which can be connected to.
+
+        async with aclient(namespace="default") as s3_client:
+            fpaths = await adownload_objs(s3_client, s3_bucket, objs, local_bucket)
+
+    Args:
+        region_names: list of strings. The region names for which the connection
+            will be attempted.
+        namespace: string. The namespace of interest. call `boto3.fetch_credentials`
+            to see the namespaces
+        aws_credentials_fpath: None or string. The file path to where the aws
+           credentials file are stored. If None, the default path is resolved on first use
+        port: str. The port to be used for the connection
+        endpoint_url: None or string. If passed, used instead of the region
+            endpoints (i.e. a local moto server), and only the first region
+            is attempted.
+        max_pool_connections: int. The maximum number of http connections kept
+            open by the client. Should be at least the in-flight window.
+
+    Yields:
+        s3_client: aiobotocore s3 client
+    """
+
+    _require_aiobotocore()
+
+    aws_access_key_id, aws_secret_access_key = _s3.fetch_keys(
+        namespace, aws_credentials_fpath
+    )
+    session = _get_session()
+    config = _AioConfig(max_pool_connections=max_pool_connections)
+
+    # every region would connect to the same url
+    if endpoint_url is not None:
+        region_names = region_names[:1]
+
+    for i, region_name in enumerate(region_names):
+        url = endpoint_url
+        if url is None:
+            url = _s3.ENDPOINT_URLS["client"].format(region_name=region_name, port=port)
+
+        async with session.create_client(
+            "s3",
+            region_name=region_name,
+            endpoint_url=url,
+            aws_access_key_id=aws_access_key_id,
+            aws_secret_access_key=aws_secret_access_key,
+            config=config,
+        ) as s3_client:
+            s3_client.meta.events.register(
+                "before-call.s3.ListObjects", _s3._add_xml_header
+            )
+            s3_client.meta.events.register(
+                "before-send.s3", _alimit_request, unique_id=_s3._LIMIT_REQUESTS_ID
+            )
+
+            # Make sure the connection is established
+            try:
+                await s3_client.list_buckets()
+            except Exception:
+                if i + 1 == len(region_names):
+                    raise
+                continue
+
+            yield s3_client
+            return
+
+
+async def _alimit_request(**kwargs):
+    """
+    aiobotocore `before-send` handler which takes a token of the request limit
+    of `boto3.RATE_LIMITER`, without blocking the event loop
+    """
+    await _s3.RATE_LIMITER.aconsume("requests")
+
+
+async def _with_retries(afxn, retry_policy):
+    """Await `afxn()`, retrying transient errors according to the `retry_policy`"""
+
+    attempt = 0
+    while True:
+        try:
+            return await afxn()
+        except Exception as e:
+            attempt += 1
+            if not retry_policy.is_retryable(e) or attempt >= retry_policy.max_attempts:
+                raise
+            await _asyncio.sleep(retry_policy.delay(attempt - 1))
+
+
+async def _bounded_map(afxn, items, max_in_flight):
+    """
+    Await `afxn(item)` for each item with at most `max_in_flight` calls running
+    at once. Items are only started as the window frees up, and no new items are
+    started once one of them failed.
+
+    Returns:
+        outputs: list. The outputs of `afxn`, in the same order as `items`
+    """
+
+    semaphore = _asyncio.Semaphore(max_in_flight)
+    outputs = []
+    tasks = []
+    failed = []
+
+    async def run(i, item):
+        try:
+            outputs[i] = await afxn(item)
+        except BaseException:
+            failed.append(i)
+            raise
+        finally:
+            semaphore.release()
+
+    try:
+        for i, item in enumerate(items):
+            await semaphore.acquire()
+            if len(failed) > 0:
+                semaphore.release()
+                break
+            outputs.append(None)
+            tasks.append(_asyncio.ensure_future(run(i, item)))
+
+        await _asyncio.gather(*tasks)
+
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await _asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+    return outputs
+
+
+async def alist_objects(
+    s3_client, s3_bucket, prefix="", delimiter=None, page_size=1000, meta=False
+):
+    """
+    Async iterator over the objects in a bucket, like `boto3.iter_objects`.
+
+        async for key in alist_objects(s3_client, s3_bucket, prefix="R216/"):
+            ...
+
+    Args:
+        s3_client: aiobotocore s3 client (see `aclient`).
+        s3_bucket: string. The bucket of interest.
+        prefix: string. Only keys starting with this prefix are listed.
+        delimiter: None or string. If passed, the keys below the delimiter
+            after the prefix are not listed.
+        page_size: int. The number of keys requested per page.
+        meta: boolean. Whether to yield the listing metadata for each object
+            instead of the key.
+
+    Yields:
+        obj: string key of each object, or if `meta`, the listing dictionary
+    """
+
+    kwargs = {
+        "Bucket": s3_bucket,
+        "Prefix": prefix,
+        "PaginationConfig": {"PageSize": page_size},
+    }
+    if delimiter is not None:
+        kwargs["Delimiter"] = delimiter
+
+    paginator = s3_client.get_paginator("list_objects")
+    async for page in paginator.paginate(**kwargs):
+        for obj in page.get("Contents", []):
+            if meta:
+                yield obj
+            else:
+                yield obj["Key"]
+
+
+async def adownload_single_object(
+    s3_client,
+    s3_bucket,
+    path_obj,
+    local_bucket,
+    unzip=True,
+    ignore_missing=False,
+    retry_policy=None,
+):
+    """
+    Download a single object. The object is written to a `.part` file which is
+    renamed once the download completes, and zip files are unzipped in a thread.
+    See `boto3.download_single_object` for the arguments.
+
+    Returns:
+        local_path_obj: str. The local path to the downloaded obj
+    """
+
+    if retry_policy is None:
+        retry_policy = _s3.DEFAULT_RETRY_POLICY
+
+    local_path_obj = _os.path.join(str(local_bucket), path_obj)
+    _os.makedirs(_os.path.dirname(local_path_obj), exist_ok=True)
+    part_fpath = local_path_obj + ".part"
+
+    async def fetch():
+        response = await s3_client.get_object(Bucket=s3_bucket, Key=path_obj)
+        codec = _s3.object_codec(response)
+        decompressor = None if codec is None else _s3._decompressor(codec)
+        async with response["Body"] as stream:
+            with open(part_fpath, "wb") as f:
+                while True:
+                    chunk = await stream.read(_s3.MB)
+                    if len(chunk) == 0:
+                        break
+                    await _s3.RATE_LIMITER.aconsume("bytes", len(chunk))
+                    if decompressor is not None:
+                        chunk = decompressor.decompress(chunk)
+                    f.write(chunk)
+                if decompressor is not None:
+                    f.write(decompressor.flush())
+
+    try:
+        await _with_retries(fetch, retry_policy)
+    except Exception as e:
+        if _os.path.exists(part_fpath):
+            _os.remove(part_fpath)
+        if _s3._is_not_found(e) and ignore_missing:
+            _warnings.warn(path_obj + " Not Found")
+            return None
+        raise
+
+    _os.replace(part_fpath, local_path_obj)
+
+    if unzip and ".zip" in local_path_obj:
+        loop = _asyncio.get_running_loop()
+        local_path_obj = await loop.run_in_executor(
+            None, _zipper.unzip_file, local_path_obj
+        )
+
+    return local_path_obj
+
+
+async def adownload_objs(
+    s3_client,
+    s3_bucket,
+    objs,
+    local_bucket,
+    unzip=True,
+    overwrite=False,
+    ignore_missing=False,
+    max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+    retry_policy=None,
+):
+    """
+    Download multiple objects concurrently on the event loop, with at most
+    `max_in_flight` downloads running at once.
+
+    Args:
+        s3_client: aiobotocore s3 client (see `aclient`).
+        s3_bucket: string. The s3 bucket of interest.
+        objs: iterable of strings. The paths to the objects in the s3 bucket.
+        local_bucket: string. The path to where objects will be downloaded.
+        unzip: boolean. Whether or not to unzip the objects which are zip files.
+        overwrite: boolean. Whether or not to overwrite the existing objects if
+            they are already present locally
+        ignore_missing: boolean. Whether or not to skip missing objects (True),
+            or throw an error if a missing object is encountered (False)
+        max_in_flight: int. The number of downloads running at once.
+        retry_policy: None or boto3.RetryPolicy. If None, DEFAULT_RETRY_POLICY is used.
+
+    Returns:
+        fpaths: list of strings. The local paths to the downloaded objs, in the
+            same order as `objs`
+    """
+
+    async def download(obj):
+        fpath = _os.path.join(str(local_bucket), obj)
+        if overwrite or not _os.path.exists(fpath):
+            fpath = await adownload_single_object(
+                s3_client,
+                s3_bucket,
+                obj,
+                local_bucket,
+                unzip=unzip,
+                ignore_missing=ignore_missing,
+                retry_policy=retry_policy,
+            )
+        return fpath
+
+    fpaths = await _bounded_map(download, objs, max_in_flight)
+
+    return [fpath for fpath in fpaths if fpath is not None]
+
+
+@_contextlib.asynccontextmanager
+async def _unbudgeted(nbytes):
+    """No-op counterpart of `_ByteBudget.hold`, for the uploads without a budget"""
+    yield
+
+
+class _ByteBudget:
+    """
+    Cap on the bytes buffered in memory by concurrent requests. A request larger
+    than the whole budget waits for all the others, instead of forever.
+
+    Args:
+        max_bytes: int. The number of bytes which may be buffered at once.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.used = 0
+        self._cond = _asyncio.Condition()
+
+    @_contextlib.asynccontextmanager
+    async def hold(self, nbytes):
+        """Async context manager which holds `nbytes` of the budget"""
+
+        nbytes = min(nbytes, self.max_bytes)
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.used + nbytes <= self.max_bytes)
+            self.used += nbytes
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self.used -= nbytes
+                self._cond.notify_all()
+
+
+async def aupload_single_object(
+    s3_client,
+    s3_bucket,
+    local_fpath,
+    bucket_subdir,
+    retry_policy=None,
+    multipart_threshold=MULTIPART_THRESHOLD,
+    multipart_chunksize=MULTIPART_CHUNKSIZE,
+    max_concurrency=_s3.MAX_FILE_CONCURRENCY,
+    budget=None,
+):
+    """
+    Upload a single file. Files smaller than `multipart_threshold` are sent with
+    a single PutObject request, larger files as a multipart upload whose parts
+    are sent concurrently. Each request body is read into memory right before
+    it is sent, so at most `max_concurrency` parts of a file are held at once.
+
+    Args:
+        s3_client: aiobotocore s3 client (see `aclient`).
+        s3_bucket: string. The s3 bucket of interest.
+        local_fpath: string. The path to the file of interest.
+        bucket_subdir: string. The subdirectory in the bucket where the file will be saved.
+        retry_policy: None or boto3.RetryPolicy. If None, DEFAULT_RETRY_POLICY is used.
+        multipart_threshold: int. The file size (bytes) at which multipart
+            uploads are used.
+        multipart_chunksize: int. The minimum part size (bytes).
+        max_concurrency: int. The number of parts sent concurrently.
+        budget: None or _ByteBudget. The cap on the bytes buffered by the
+            uploads running at once (see `aupload_objs`). If None, the buffered
+            bytes are only bounded by the part size and `max_concurrency`.
+
+    Returns:
+        obj: str. The s3 object path of the uploaded file
+    """
+
+    if retry_policy is None:
+        retry_policy = _s3.DEFAULT_RETRY_POLICY
+
+    obj = _os.path.join(bucket_subdir, _os.path.basename(local_fpath))
+    size = _os.path.getsize(local_fpath)
+    loop = _asyncio.get_running_loop()
+
+    def read(offset, length):
+        with open(local_fpath, "rb") as f:
+            return _os.pread(f.fileno(), length, offset)
+
+    def held(nbytes):
+        if budget is None:
+            return _unbudgeted(nbytes)
+        return budget.hold(nbytes)
+
+    if size < multipart_threshold:
+        async with held(size):
+            data = await loop.run_in_executor(None, read, 0, size)
+            await _s3.RATE_LIMITER.aconsume("bytes", size)
+            await _with_retries(
+                lambda: s3_client.put_object(Bucket=s3_bucket, Key=obj, Body=data),
+                retry_policy,
+            )
+        return obj
+
+    part_size = max(multipart_chunksize, _math.ceil(size / _s3.MAX_PARTS))
+    part_size = _math.ceil(part_size / _s3.MB) * _s3.MB
+    offsets = list(range(0, size, part_size))
+
+    upload_id = (
+        await s3_client.create_multipart_upload(Bucket=s3_bucket, Key=obj)
+    )["UploadId"]
+
+    async def upload_part(part_number):
+        offset = offsets[part_number - 1]
+        length = min(part_size, size - offset)
+        async with held(length):
+            data = await loop.run_in_executor(None, read, offset, length)
+            await _s3.RATE_LIMITER.aconsume("bytes", length)
+            response = await _with_retries(
+                lambda: s3_client.upload_part(
+                    Bucket=s3_bucket,
+                    Key=obj,
+                    UploadId=upload_id,
+                    PartNumber=part_number,
+                    Body=data,
+                ),
+                retry_policy,
+            )
+        return {"ETag": response["ETag"], "PartNumber": part_number}
+
+    try:
+        parts = await _bounded_map(
+            upload_part, range(1, len(offsets) + 1), max_concurrency
+        )
+        await s3_client.complete_multipart_upload(
+            Bucket=s3_bucket,
+            Key=obj,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+    except BaseException:
+        await s3_client.abort_multipart_upload(
+            Bucket=s3_bucket, Key=obj, UploadId=upload_id
+        )
+        raise
+
+    return obj
+
+
+async def aupload_objs(
+    s3_client,
+    s3_bucket,
+    fpaths,
+    max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+    retry_policy=None,
+    max_buffer_bytes=DEFAULT_MAX_BUFFER_BYTES,
+):
+    """
+    Upload multiple files concurrently on the event loop, with at most
+    `max_in_flight` uploads running at once. Like `boto3.upload_objs`, each
+    filepath should be in a directory or subdirectory matching the `s3_bucket` name.
+    The request bodies are read into memory, and at most `max_buffer_bytes` are
+    held by all the uploads at once.
+
+    Args:
+        s3_client: aiobotocore s3 client (see `aclient`).
+        s3_bucket: string. The s3 bucket of interest.
+        fpaths: list of strings. The paths to the files of interest.
+        max_in_flight: int. The number of uploads running at once.
+        retry_policy: None or boto3.RetryPolicy. If None, DEFAULT_RETRY_POLICY is used.
+        max_buffer_bytes: int. The number of bytes which may be buffered at once.
+
+    Returns:
+        objs: list of strings. The s3 objects paths for the uploaded files
+    """
+
+    fpaths = list(fpaths)
+
+    for fpath in fpaths:
+        assert s3_bucket in fpath, " ".join(
+            [
+                f"Failed to find the `s3_bucket`: {s3_bucket}",
+                f"in the `fpath`:{fpath}.",
+                "The obj path in the `s3_bucket` cannot be interpreted",
+                "without this information",
+            ]
+        )
+
+    budget = _ByteBudget(max_buffer_bytes)
+
+    async def upload(fpath):
+        bucket_subdir = _os.path.dirname(fpath.split(s3_bucket + "/")[-1])
+        return await aupload_single_object(
+            s3_client,
+            s3_bucket,
+            fpath,
+            bucket_subdir,
+            retry_policy=retry_policy,
+            budget=budget,
+        )
+
+    return await _bounded_map(upload, fpaths, max_in_flight)
@@ -0,0 +1,326 @@
+"""
+Shared on-disk cache of downloaded s3 objects, so jobs on the same host
+don't download the same object more than once.
+"""
+import contextlib as _contextlib
+import errno as _errno
+import hashlib as _hashlib
+import os as _os
+import shutil as _shutil
+import sqlite3 as _sqlite3
+import threading as _threading
+import time as _time
+
+try:
+    import fcntl as _fcntl
+except ImportError:
+    # i.e. on windows, where there are no reflinks and the cache is only
+    # locked within the process
+    _fcntl = None
+
+# default byte budget of the cache
+DEFAULT_MAX_BYTES = 50 * 1024 ** 3
+
+# linux ioctl request which clones (reflinks) a file on copy-on-write file systems
+_FICLONE = 0x40049409
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    digest TEXT PRIMARY KEY,
+    bucket TEXT,
+    key TEXT,
+    etag TEXT,
+    size INTEGER,
+    last_access REAL
+);
+"""
+
+
+def reflink(src_fpath, dst_fpath):
+    """
+    Create a copy-on-write clone of `src_fpath` at `dst_fpath`. This only
+    succeeds on file systems with reflink support (i.e. btrfs, xfs).
+
+    Args:
+        src_fpath: string. The path to the source file.
+        dst_fpath: string. The path to the clone.
+
+    Returns:
+        None. An OSError is raised if the file system does not support reflinks
+    """
+
+    if _fcntl is None:
+        raise OSError(_errno.EOPNOTSUPP, "reflinks are not supported on this platform")
+
+    with open(src_fpath, "rb") as src:
+        with open(dst_fpath, "wb") as dst:
+            try:
+                _fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+            except OSError:
+                dst.close()
+                _os.remove(dst_fpath)
+                raise
+
+
+def materialize(src_fpath, dst_fpath, link="auto"):
+    """
+    Make the content of `src_fpath` available at `dst_fpath` without copying
+    the data where possible.
+
+    Args:
+        src_fpath: string. The path to the source file.
+        dst_fpath: string. The path where the file will be made available.
+        link: string. "reflink", "hardlink", "copy", or "auto" to try a
+            reflink, then fall back to a copy. Only reflinks and hardlinks avoid
+            copying the data: on file systems without reflinks (i.e. ext4), "auto"
+            makes a full copy, which costs as much disk I/O and space as the file.
+            A hardlink shares the inode (and so its permissions and any later
+            writes) with `src_fpath`, so it is only used when requested explicitly.
+
+    Returns:
+        method: string. The method which was used
+    """
+
+    methods = [link] if link != "auto" else ["reflink", "copy"]
+
+    # link to a temporary path first so `dst_fpath` is replaced atomically
+    tmp_fpath = f"{dst_fpath}.{_os.getpid()}.{_threading.get_ident()}.tmp"
+
+    for i, method in enumerate(methods):
+        try:
+            if method == "reflink":
+                reflink(src_fpath, tmp_fpath)
+            elif method == "hardlink":
+                _os.link(src_fpath, tmp_fpath)
+            else:
+                _shutil.copyfile(src_fpath, tmp_fpath)
+            break
+
+        except OSError:
+            if i + 1 == len(methods):
+                raise
+
+    _os.replace(tmp_fpath, dst_fpath)
+
+    return method
+
+
+class DownloadCache:
+    """
+    Content-addressed cache of downloaded objects, keyed by (bucket, key, ETag).
+    By default (link="auto"), hits are materialized at the download path with a
+    reflink where the file system supports it (i.e. btrfs, or xfs with reflink=1),
+    so no data is copied. On other file systems (i.e. ext4) every hit is a full
+    local copy of the cached file: no network transfer, but as much disk I/O and
+    space as the file itself. Once the cached bytes exceed `max_bytes`, the least
+    recently used entries are evicted. The cache directory may be shared by
+    several threads and processes: the bookkeeping lives in a SQLite database and
+    stores and evictions are serialized with a file lock (a lock within the
+    process on platforms without `fcntl`).
+
+    Objects are stored as their own copy (or reflink) of the downloaded file, which
+    is made read-only. Pass link="hardlink" for hits which copy no data on any
+    file system: the materialized files share the cached inode, so they are
+    read-only too, and must be on the same file system as the cache.
+
+    Args:
+        cache_dir: string. The path to the cache directory.
+        max_bytes: int. The byte budget of the cache.
+        link: string. How hits are materialized. See `materialize`.
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES, link="auto"):
+
+        self.cache_dir = str(cache_dir)
+        self.max_bytes = max_bytes
+        self.link = link
+
+        self.objects_dir = _os.path.join(self.cache_dir, "objects")
+        _os.makedirs(self.objects_dir, exist_ok=True)
+
+        self._lock = _threading.Lock()
+        self._store_lock = _threading.Lock()
+        self._lock_fpath = _os.path.join(self.cache_dir, "cache.lock")
+        self._conn = _sqlite3.connect(
+            _os.path.join(self.cache_dir, "cache.db"),
+            timeout=60,
+            check_same_thread=False,
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    @_contextlib.contextmanager
+    def _file_lock(self):
+        """Hold the lock which serializes stores and evictions across processes"""
+        if _fcntl is None:
+            with self._store_lock:
+                yield
+            return
+
+        with open(self._lock_fpath, "a") as lock_file:
+            _fcntl.flock(lock_file, _fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                _fcntl.flock(lock_file, _fcntl.LOCK_UN)
+
+    def _fpath(self, digest):
+        """The path of the cached file for a digest"""
+        return _os.path.join(self.objects_dir, digest[:2], digest)
+
+    @staticmethod
+    def digest(bucket, key, etag):
+        """The content address of an object"""
+        etag = etag.strip('"')
+        return _hashlib.sha256(f"{bucket}\0{key}\0{etag}".encode("utf-8")).hexdigest()
+
+    def fetch(self, bucket, key, etag, local_fpath):
+        """
+        Materialize a cached object at `local_fpath`, if it is in the cache.
+
+        Args:
+            bucket: string. The s3 bucket of the object.
+            key: string. The key of the object.
+            etag: string. The ETag of the object.
+            local_fpath: string. The path where the object will be made available.
+
+        Returns:
+            hit: boolean. Whether or not the object was found in the cache
+        """
+
+        digest = self.digest(bucket, key, etag)
+        cached_fpath = self._fpath(digest)
+
+        try:
+            materialize(cached_fpath, local_fpath, self.link)
+        except OSError as e:
+            if e.errno != _errno.ENOENT:
+                raise
+            with self._lock:
+                self.misses += 1
+            return False
+
+        size = _os.path.getsize(local_fpath)
+        with self._lock:
+            self._conn.execute(
+                "UPDATE entries SET last_access = ? WHERE digest = ?",
+                (_time.time(), digest),
+            )
+            self._conn.commit()
+            self.hits += 1
+            self.bytes_saved += size
+
+        return True
+
+    def store(self, bucket, key, etag, fpath):
+        """
+        Add a downloaded object to the cache, and evict the least recently used
+        entries if the cache is over its byte budget.
+
+        Args:
+            bucket: string. The s3 bucket of the object.
+            key: string. The key of the object.
+            etag: string. The ETag of the object.
+            fpath: string. The path to the downloaded file.
+
+        Returns:
+            None
+        """
+
+        digest = self.digest(bucket, key, etag)
+        cached_fpath = self._fpath(digest)
+        _os.makedirs(_os.path.dirname(cached_fpath), exist_ok=True)
+
+        size = _os.path.getsize(fpath)
+        if size > self.max_bytes:
+            return
+
+        # never hardlink: the cache must own its inode, so making it read-only
+        # doesn't change the permissions of the downloaded file
+        with self._file_lock():
+            materialize(fpath, cached_fpath, "auto")
+            _os.chmod(cached_fpath, 0o444)
+
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                    (digest, bucket, key, etag.strip('"'), size, _time.time()),
+                )
+                self._conn.commit()
+
+        self.evict()
+
+    def size(self):
+        """The total number of bytes in the cache"""
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def evict(self, max_bytes=None):
+        """
+        Evict the least recently used entries until the cache is within its
+        byte budget.
+
+        Args:
+            max_bytes: None or int. The byte budget. Defaults to `self.max_bytes`.
+
+        Returns:
+            evicted_bytes: int. The number of bytes which were evicted
+        """
+
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+
+        if self.size() <= max_bytes:
+            return 0
+
+        evicted_bytes = 0
+        with self._file_lock():
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT digest, size FROM entries ORDER BY last_access"
+                ).fetchall()
+                total = sum(size for digest, size in rows)
+
+                for digest, size in rows:
+                    if total <= max_bytes:
+                        break
+                    try:
+                        _os.remove(self._fpath(digest))
+                    except FileNotFoundError:
+                        pass
+                    self._conn.execute(
+                        "DELETE FROM entries WHERE digest = ?", (digest,)
+                    )
+                    total -= size
+                    evicted_bytes += size
+
+                self._conn.commit()
+
+        return evicted_bytes
+
+    def stats(self):
+        """
+        The cache statistics of this process.
+
+        Returns:
+            stats: dictionary with the number of "hits" and "misses", the
+                "bytes_saved" by hits, and the current "size" of the cache
+        """
+        with self._lock:
+            stats = {
+                "hits": self.hits,
+                "misses": self.misses,
+                "bytes_saved": self.bytes_saved,
+            }
+        stats["size"] = self.size()
+        return stats
+
+    def close(self):
+        """Close the connection to the cache database"""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,328 @@
+"""
+Persistent local (SQLite) index of s3 bucket listings, so repeated
+key lookups can be answered without listing the bucket again.
+"""
+import datetime as _datetime
+import itertools as _itertools
+import json as _json
+import os as _os
+import sqlite3 as _sqlite3
+import threading as _threading
+import time as _time
+
+from fuegodata.utils import boto3 as _s3
+from fuegodata.utils import parse as _parse
+
+# number of listed objects written to the index per transaction. Kept below
+# the 999 host parameter limit of older SQLite builds
+_BATCH_SIZE = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    bucket TEXT NOT NULL,
+    key TEXT NOT NULL,
+    size INTEGER,
+    etag TEXT,
+    last_modified REAL,
+    fields TEXT,
+    generation INTEGER,
+    PRIMARY KEY (bucket, key)
+);
+CREATE TABLE IF NOT EXISTS refreshes (
+    bucket TEXT NOT NULL,
+    prefix TEXT NOT NULL,
+    generation INTEGER,
+    watermark_modified REAL,
+    refreshed_at REAL,
+    PRIMARY KEY (bucket, prefix)
+);
+CREATE TABLE IF NOT EXISTS sequence (
+    name TEXT PRIMARY KEY,
+    value INTEGER
+);
+INSERT OR IGNORE INTO sequence
+    SELECT 'refresh', COALESCE(MAX(generation), 0) FROM objects;
+"""
+
+
+def fname_fields(key):
+    """
+    Parse the storeID and cameraID from keys with a standard filename such as
+    'R216_1578240_01302020_15-45-07UTC.mp4'
+
+    Args:
+        key: str. The key of the object of interest
+
+    Returns:
+        fields: dictionary of the parsed fields. Empty if the filename does not
+            follow the standard format
+    """
+
+    fname = _os.path.basename(key)
+    if fname.count("_") < 2:
+        return {}
+
+    storeID, cameraID = _parse.storeID_cameraID_from_fname(fname)
+
+    return {"storeID": storeID, "cameraID": cameraID}
+
+
+class ObjectIndex:
+    """
+    On-disk SQLite index of the keys, sizes, ETags and last-modified times of the
+    objects in s3 buckets. The index is populated from the bucket listing via
+    `refresh` and can then be queried by prefix, glob or parsed filename fields
+    without any requests to the store.
+
+    Args:
+        db_fpath: string. The path to the SQLite database file.
+        fields_parser: None or function. Called as `fields_parser(key)` for each
+            indexed key, returning a dictionary of fields which can be queried
+            via `query(fields=...)`. Defaults to `fname_fields`.
+    """
+
+    def __init__(self, db_fpath, fields_parser=fname_fields):
+
+        db_dir = _os.path.dirname(str(db_fpath))
+        if len(db_dir) > 0 and not _os.path.isdir(db_dir):
+            _os.makedirs(db_dir)
+
+        self.db_fpath = str(db_fpath)
+        self.fields_parser = fields_parser
+        self._lock = _threading.Lock()
+
+        self._conn = _sqlite3.connect(
+            self.db_fpath, timeout=60, check_same_thread=False
+        )
+        # WAL lets other processes read the index while it is being refreshed
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def close(self):
+        """Close the connection to the database"""
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def refresh(
+        self, s3_client, s3_bucket, prefix="", full=False, page_size=1000, verbose=0
+    ):
+        """
+        Update the index from the bucket listing under `prefix`. Each refresh
+        stamps the rows it lists with a new refresh id, unique across all the
+        buckets and prefixes of the index, so a full refresh removes exactly
+        the rows it didn't list, even when the prefixes of refreshes overlap.
+
+        An incremental refresh only lists the keys which sort after the last
+        indexed key under `prefix` (via `start_after`), which picks up new objects
+        for the usual time-stamped key names in a fraction of the requests. A
+        full refresh re-lists the prefix, updates changed objects, and removes
+        the keys which no longer exist. The first refresh of a prefix is always full.
+
+        Args:
+            s3_client: botocore.client.S3. The s3_client to be called.
+            s3_bucket: string. The s3 bucket of interest.
+            prefix: string. The key prefix to be (re-)indexed.
+            full: boolean. Whether to re-list the whole prefix.
+            page_size: int. The number of keys requested per page.
+            verbose: int. print-out verbosity.
+
+        Returns:
+            counts: dictionary with the number of "listed", "added", "updated"
+                and "removed" keys, and the number of keys "modified" since the
+                last-modified watermark of the previous refresh
+        """
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT watermark_modified FROM refreshes "
+                "WHERE bucket = ? AND prefix = ?",
+                (s3_bucket, prefix),
+            ).fetchone()
+
+            if row is None:
+                full = True
+                watermark = None
+            else:
+                watermark = row[0]
+
+            self._conn.execute(
+                "UPDATE sequence SET value = value + 1 WHERE name = 'refresh'"
+            )
+            generation = self._conn.execute(
+                "SELECT value FROM sequence WHERE name = 'refresh'"
+            ).fetchone()[0]
+            self._conn.commit()
+
+            start_after = None
+            if not full:
+                start_after = self._conn.execute(
+                    "SELECT MAX(key) FROM objects WHERE bucket = ? AND key >= ? AND key < ?",
+                    (s3_bucket, prefix, _prefix_upper_bound(prefix)),
+                ).fetchone()[0]
+
+        objs = _s3.iter_objects(
+            s3_client,
+            s3_bucket,
+            prefix=prefix,
+            start_after=start_after,
+            page_size=page_size,
+            meta=True,
+        )
+
+        counts = {"listed": 0, "added": 0, "updated": 0, "removed": 0, "modified": 0}
+        new_watermark = watermark
+
+        while True:
+            batch = list(_itertools.islice(objs, _BATCH_SIZE))
+            if len(batch) == 0:
+                break
+
+            rows = []
+            for obj in batch:
+                last_modified = obj["LastModified"].timestamp()
+                fields = {}
+                if self.fields_parser is not None:
+                    fields = self.fields_parser(obj["Key"])
+                rows.append(
+                    (
+                        s3_bucket,
+                        obj["Key"],
+                        obj["Size"],
+                        obj["ETag"].strip('"'),
+                        last_modified,
+                        _json.dumps(fields),
+                        generation,
+                    )
+                )
+                if watermark is not None and last_modified > watermark:
+                    counts["modified"] += 1
+                if new_watermark is None or last_modified > new_watermark:
+                    new_watermark = last_modified
+
+            with self._lock:
+                existing = dict(
+                    self._conn.execute(
+                        "SELECT key, etag FROM objects WHERE bucket = ? AND key IN (%s)"
+                        % ",".join("?" * len(rows)),
+                        [s3_bucket] + [row[1] for row in rows],
+                    ).fetchall()
+                )
+                for row in rows:
+                    if row[1] not in existing:
+                        counts["added"] += 1
+                    elif existing[row[1]] != row[3]:
+                        counts["updated"] += 1
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+                )
+                self._conn.commit()
+
+            counts["listed"] += len(rows)
+
+        with self._lock:
+            if full:
+                cursor = self._conn.execute(
+                    "DELETE FROM objects WHERE bucket = ? AND key >= ? AND key < ? "
+                    "AND generation != ?",
+                    (s3_bucket, prefix, _prefix_upper_bound(prefix), generation),
+                )
+                counts["removed"] = cursor.rowcount
+
+            self._conn.execute(
+                "INSERT OR REPLACE INTO refreshes VALUES (?, ?, ?, ?, ?)",
+                (s3_bucket, prefix, generation, new_watermark, _time.time()),
+            )
+            self._conn.commit()
+
+        if verbose >= 1:
+            print(f"refreshed index of {s3_bucket}/{prefix}: {counts}")
+
+        return counts
+
+    def query(
+        self, s3_bucket, prefix="", glob=None, fields=None, modified_after=None
+    ):
+        """
+        Query the indexed objects.
+
+        Args:
+            s3_bucket: string. The s3 bucket of interest.
+            prefix: string. Only keys starting with this prefix are returned.
+            glob: None or string. A unix-style pattern (i.e. "*/R216_*.mp4")
+                which the keys must match.
+            fields: None or dictionary. The parsed filename fields which the
+                objects must match (i.e. {"storeID": "R216"}).
+            modified_after: None or datetime.datetime. Only objects modified
+                after this time are returned.
+
+        Returns:
+            objs: list of dictionaries with the "Key", "Size", "ETag" and
+                "LastModified" of each object, sorted by key
+        """
+
+        where = ["bucket = ?", "key >= ?", "key < ?"]
+        params = [s3_bucket, prefix, _prefix_upper_bound(prefix)]
+
+        if glob is not None:
+            where.append("key GLOB ?")
+            params.append(glob)
+
+        if fields is not None:
+            for name, value in fields.items():
+                where.append("json_extract(fields, ?) = ?")
+                params += ["$." + name, value]
+
+        if modified_after is not None:
+            where.append("last_modified > ?")
+            params.append(modified_after.timestamp())
+
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, size, etag, last_modified FROM objects WHERE "
+                + " AND ".join(where)
+                + " ORDER BY key",
+                params,
+            ).fetchall()
+
+        objs = [
+            {
+                "Key": key,
+                "Size": size,
+                "ETag": etag,
+                "LastModified": _datetime.datetime.fromtimestamp(
+                    last_modified, tz=_datetime.timezone.utc
+                ),
+            }
+            for key, size, etag, last_modified in rows
+        ]
+
+        return objs
+
+    def keys(self, s3_bucket, prefix="", glob=None, fields=None):
+        """
+        Query the indexed keys. See `query` for the arguments.
+
+        Returns:
+            keys: list of strings, sorted
+        """
+        return [
+            obj["Key"]
+            for obj in self.query(s3_bucket, prefix=prefix, glob=glob, fields=fields)
+        ]
+
+
+def _prefix_upper_bound(prefix):
+    """
+    The smallest string which sorts after every string starting with `prefix`,
+    so prefix queries can use the primary key index instead of LIKE
+    """
+    if len(prefix) == 0:
+        return "\U0010ffff"
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
@@ -0,0 +1,321 @@
+"""
+Pack many small files into large tar shards stored in s3, with an offset
+index so single files can be read back with ranged GETs.
+"""
+import json as _json
+import os as _os
+import shutil as _shutil
+import tarfile as _tarfile
+import tempfile as _tempfile
+import threading as _threading
+
+from fuegodata.utils import boto3 as _s3
+
+# target size of each shard
+DEFAULT_SHARD_SIZE = 256 * _s3.MB
+
+# name of the index stored next to the shards
+INDEX_FNAME = "index.json"
+
+# members closer than this (bytes) in a shard are fetched with a single request
+DEFAULT_MAX_GAP = _s3.MB
+
+
+def _shard_groups(fpaths, shard_size):
+    """Group the `fpaths` into lists whose total size stays around `shard_size`"""
+
+    group = []
+    group_size = 0
+    for fpath in fpaths:
+        size = _os.path.getsize(fpath)
+        if len(group) > 0 and group_size + size > shard_size:
+            yield group
+            group = []
+            group_size = 0
+        group.append(fpath)
+        group_size += size
+
+    if len(group) > 0:
+        yield group
+
+
+def pack_shard(fpaths, shard_fpath, root):
+    """
+    Write the files to an (uncompressed) tar shard.
+
+    Args:
+        fpaths: list of strings. The paths to the files to be packed.
+        shard_fpath: string. The path to the tar file.
+        root: string. The directory the member names are relative to.
+
+    Returns:
+        members: dictionary mapping each member name to the (offset, size) of
+            its data in the shard
+    """
+
+    with _tarfile.open(shard_fpath, "w", format=_tarfile.PAX_FORMAT) as tar:
+        for fpath in fpaths:
+            tar.add(fpath, arcname=_os.path.relpath(fpath, root), recursive=False)
+
+    with _tarfile.open(shard_fpath, "r") as tar:
+        members = {
+            member.name: (member.offset_data, member.size)
+            for member in tar.getmembers()
+            if member.isfile()
+        }
+
+    return members
+
+
+def upload_shards(
+    s3_client,
+    s3_bucket,
+    fpaths,
+    s3_prefix,
+    root=None,
+    shard_size=DEFAULT_SHARD_SIZE,
+    max_workers=4,
+    tmp_dir=None,
+    verbose=1,
+):
+    """
+    Pack small files into tar shards of about `shard_size` bytes and upload them,
+    along with an index of the offset of each file, under `s3_prefix`. The shards
+    are packed one after the other and uploaded concurrently as they are closed,
+    and each local shard is deleted once uploaded, so at most about
+    `2 * max_workers` shards are held on disk at once.
+
+    Args:
+        s3_client: botocore.client.S3. The s3_client to be called.
+        s3_bucket: string. The s3 bucket of interest.
+        fpaths: list of strings. The paths to the files to be packed.
+        s3_prefix: string. The key prefix of the shards and the index.
+        root: None or string. The directory the member names are relative to.
+            If None, the common directory of the `fpaths` is used.
+        shard_size: int. The target size (bytes) of each shard.
+        max_workers: int. The number of shards uploaded concurrently.
+        tmp_dir: None or string. The directory where the shards are packed. If
+            None, the system temporary directory is used.
+        verbose: int. print-out verbosity.
+
+    Returns:
+        index: dictionary. The index which was uploaded (see `ShardReader`). If
+            there are no `fpaths`, nothing is uploaded and the index is empty.
+    """
+
+    fpaths = sorted(str(fpath) for fpath in fpaths)
+    if len(fpaths) == 0:
+        return {"shards": [], "members": {}}
+
+    if root is None:
+        root = _os.path.commonpath([_os.path.dirname(fpath) for fpath in fpaths])
+    s3_prefix = s3_prefix.strip("/")
+
+    groups = list(_shard_groups(fpaths, shard_size))
+    work_dir = _tempfile.mkdtemp(dir=tmp_dir)
+
+    def pack(i):
+        shard_fpath = _os.path.join(work_dir, f"shard-{i:05d}.tar")
+        members = pack_shard(groups[i], shard_fpath, root)
+        return i, shard_fpath, members
+
+    def upload(shard):
+        i, shard_fpath, members = shard
+        try:
+            _s3.upload_single_object(s3_client, s3_bucket, shard_fpath, s3_prefix)
+        finally:
+            _os.remove(shard_fpath)
+        return i, _os.path.basename(shard_fpath), members
+
+    index = {"shards": [None] * len(groups), "members": {}}
+    try:
+        # packing is lazy, so packed shards wait for an upload slot instead of
+        # filling up the disk
+        shards = (pack(i) for i in range(len(groups)))
+        for i, shard_name, members in _s3.thread_imap(upload, shards, max_workers):
+            index["shards"][i] = shard_name
+            for name, (offset, size) in members.items():
+                index["members"][name] = [i, offset, size]
+            if verbose >= 1:
+                print(f"\tuploaded shard {i + 1}/{len(groups)}", end="\r")
+    finally:
+        # a failed upload leaves the shards which were packed ahead of it
+        _shutil.rmtree(work_dir, ignore_errors=True)
+
+    s3_client.put_object(
+        Bucket=s3_bucket,
+        Key=f"{s3_prefix}/{INDEX_FNAME}",
+        Body=_json.dumps(index).encode("utf-8"),
+        ContentType="application/json",
+    )
+
+    if verbose >= 1:
+        print(f"\n\t...uploaded {len(index['members'])} files in {len(groups)} shards")
+
+    return index
+
+
+def _coalesce(locations, max_gap):
+    """
+    Group the (name, shard, offset, size) member locations into byte ranges of
+    the shards, merging members which are less than `max_gap` bytes apart.
+
+    Returns:
+        ranges: list of (shard, start, end, [(name, offset, size), ...]) tuples
+    """
+
+    ranges = []
+    for name, shard, offset, size in sorted(locations, key=lambda loc: loc[1:3]):
+        if (
+            len(ranges) > 0
+            and ranges[-1][0] == shard
+            and offset - ranges[-1][2] <= max_gap
+        ):
+            ranges[-1][2] = max(ranges[-1][2], offset + size)
+            ranges[-1][3].append((name, offset, size))
+        else:
+            ranges.append([shard, offset, offset + size, [(name, offset, size)]])
+
+    return [tuple(byte_range) for byte_range in ranges]
+
+
+class ShardReader:
+    """
+    Random access to the files packed by `upload_shards`. The index is fetched
+    once, and each file is read with a ranged GET of its bytes in the shard.
+
+    Args:
+        s3_client: botocore.client.S3. The s3_client to be called.
+        s3_bucket: string. The s3 bucket of interest.
+        s3_prefix: string. The key prefix of the shards and the index.
+    """
+
+    def __init__(self, s3_client, s3_bucket, s3_prefix):
+
+        self.s3_client = s3_client
+        self.s3_bucket = s3_bucket
+        self.s3_prefix = s3_prefix.strip("/")
+
+        self.index = _s3.get_bytes(
+            s3_client,
+            s3_bucket,
+            f"{self.s3_prefix}/{INDEX_FNAME}",
+            parser=lambda data, key: _json.loads(str(data, "utf-8")),
+        )
+
+        self._heads = {}
+        self._lock = _threading.Lock()
+
+    def names(self):
+        """The sorted names of the packed files"""
+        return sorted(self.index["members"])
+
+    def __contains__(self, name):
+        return name in self.index["members"]
+
+    def __len__(self):
+        return len(self.index["members"])
+
+    def _head(self, shard):
+        """The cached `head_object` response of a shard"""
+
+        with self._lock:
+            head = self._heads.get(shard)
+        if head is None:
+            head = self.s3_client.head_object(
+                Bucket=self.s3_bucket, Key=self._key(shard)
+            )
+            with self._lock:
+                self._heads[shard] = head
+        return head
+
+    def _key(self, shard):
+        """The key of a shard"""
+        return f"{self.s3_prefix}/{self.index['shards'][shard]}"
+
+    def get(self, name, parser=None):
+        """
+        Read a single packed file.
+
+        Args:
+            name: string. The name of the file (see `names`).
+            parser: None or function. If passed, called as `parser(data, name)`
+                and its output is returned instead of the buffer (i.e. `files.loads`).
+
+        Returns:
+            data: memoryview holding the bytes of the file, or the output of `parser`
+        """
+
+        shard, offset, size = self.index["members"][name]
+        if size == 0:
+            data = memoryview(bytearray())
+        else:
+            data = _s3.get_bytes(
+                self.s3_client,
+                self.s3_bucket,
+                self._key(shard),
+                byte_range=(offset, offset + size - 1),
+                head=self._head(shard),
+            )
+
+        if parser is not None:
+            return parser(data, name)
+
+        return data
+
+    def get_many(
+        self,
+        names,
+        parser=None,
+        max_gap=DEFAULT_MAX_GAP,
+        max_workers=_s3.DEFAULT_MAX_WORKERS,
+    ):
+        """
+        Read multiple packed files. Files which are stored close together in a
+        shard are read with a single ranged GET, and the ranges are read concurrently.
+
+        Args:
+            names: list of strings. The names of the files (see `names`).
+            parser: None or function. If passed, called as `parser(data, name)`
+                for each file, and its outputs are returned (i.e. `files.loads`).
+            max_gap: int. Files less than `max_gap` bytes apart are read with
+                the same request.
+            max_workers: int. The number of ranges read concurrently.
+
+        Returns:
+            datas: list of memoryviews (or `parser` outputs), in the same order as `names`
+        """
+
+        names = list(names)
+        locations = [(name,) + tuple(self.index["members"][name]) for name in names]
+
+        def fetch(byte_range):
+            shard, start, end, members = byte_range
+            data = _s3.get_bytes(
+                self.s3_client,
+                self.s3_bucket,
+                self._key(shard),
+                byte_range=(start, end - 1),
+                head=self._head(shard),
+            )
+            return {
+                name: data[offset - start : offset - start + size]
+                for name, offset, size in members
+            }
+
+        datas = {}
+        # empty files need no request
+        byte_ranges = [
+            byte_range
+            for byte_range in _coalesce(locations, max_gap)
+            if byte_range[2] > byte_range[1]
+        ]
+        for range_datas in _s3.thread_map(fetch, byte_ranges, max_workers):
+            datas.update(range_datas)
+
+        outputs = []
+        for name in names:
+            data = datas.get(name, memoryview(bytearray()))
+            outputs.append(data if parser is None else parser(data, name))
+
+        return outputs
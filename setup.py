@@ -488,7 +488,12 @@ setuptools.setup(
     classifiers=["Development Status :: 4 - Beta",],
     install_requires=get_requirements(),
     setup_requires=['setuptools', "pytest", 'pylint', 'xmltodict'],
-    tests_require=["pytest", 'pylint', 'xmltodict'],
+    tests_require=["pytest", 'pylint', 'xmltodict', "moto[s3,server]>=5"],
+    extras_require={
+        "async": ["aiobotocore>=2.5"],
+        "zstd": ["zstandard"],
+        "test": ["pytest", "moto[s3,server]>=5"],
+    },
     cmdclass={"test": PyTest_PyLint_Tests},
     zip_safe=False,
 )
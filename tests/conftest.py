@@ -0,0 +1,56 @@
+"""
+Fixtures of the s3 tests, which run against the in-memory s3 of moto, so no
+credentials or network access are needed.
+"""
+import os
+
+import pytest
+
+moto = pytest.importorskip("moto")
+boto3 = pytest.importorskip("boto3")
+
+BUCKET = "test-bucket"
+
+
+@pytest.fixture
+def aws_env(monkeypatch):
+    """Fake credentials, so no request can reach a real account"""
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+
+
+@pytest.fixture
+def s3_resource(aws_env):
+    """An s3 resource on the moto s3, with an empty BUCKET"""
+    with moto.mock_aws():
+        s3_resource = boto3.resource("s3", region_name="us-east-1")
+        s3_resource.meta.client.create_bucket(Bucket=BUCKET)
+        yield s3_resource
+
+
+@pytest.fixture
+def s3_client(s3_resource):
+    return s3_resource.meta.client
+
+
+@pytest.fixture
+def local_bucket(tmp_path):
+    """The local directory mirroring BUCKET"""
+    local_bucket = tmp_path / BUCKET
+    local_bucket.mkdir()
+    return str(local_bucket)
+
+
+def write_files(local_bucket, files):
+    """Write the `files` (dictionary of key: bytes) under the `local_bucket`"""
+
+    fpaths = []
+    for key, data in files.items():
+        fpath = os.path.join(local_bucket, key)
+        os.makedirs(os.path.dirname(fpath), exist_ok=True)
+        with open(fpath, "wb") as f:
+            f.write(data)
+        fpaths.append(fpath)
+
+    return fpaths
@@ -0,0 +1,960 @@
+"""
+Tests of the transfer helpers of `boto3`, against the moto s3 (see `conftest.py`).
+"""
+import asyncio
+import io
+import json
+import os
+import threading
+import time
+import zipfile
+
+import pytest
+from botocore import exceptions as botocore_exceptions
+from botocore.awsrequest import AWSResponse
+
+from fuegodata.utils import boto3 as _s3
+
+from tests.conftest import BUCKET, write_files
+
+
+def record_requests(s3_client):
+    """Record the (operation, Range) of each request sent by the `s3_client`"""
+
+    requests = []
+
+    def record(params, model, **kwargs):
+        requests.append((model.name, params.get("Range")))
+
+    s3_client.meta.events.register("before-parameter-build.s3", record)
+
+    return requests
+
+
+def test_sync_upload_only_sends_changed_files(s3_client, local_bucket):
+    write_files(local_bucket, {f"e/{i}.txt": b"x" * i for i in range(3)})
+
+    plan = _s3.plan_sync(s3_client, BUCKET, local_bucket, "e/", direction="upload")
+    assert plan["add"] == ["e/0.txt", "e/1.txt", "e/2.txt"]
+    _s3.execute_sync(None, s3_client, BUCKET, local_bucket, plan, verbose=0)
+
+    plan = _s3.plan_sync(s3_client, BUCKET, local_bucket, "e/", direction="upload")
+    assert plan["add"] == plan["update"] == plan["delete"] == []
+
+    write_files(local_bucket, {"e/1.txt": b"changed"})
+    os.remove(os.path.join(local_bucket, "e/2.txt"))
+    plan = _s3.plan_sync(s3_client, BUCKET, local_bucket, "e/", direction="upload")
+    assert plan["update"] == ["e/1.txt"]
+    assert plan["delete"] == ["e/2.txt"]
+
+
+def test_sync_matches_compressed_objects(
+    s3_resource, s3_client, local_bucket, tmp_path
+):
+    codec = "gzip"
+    files = {f"e/{i}.json": b'{"frame": %d}' % i * 1000 for i in range(3)}
+    write_files(local_bucket, files)
+
+    plan = _s3.plan_sync(s3_client, BUCKET, local_bucket, "e/", direction="upload")
+    _s3.execute_sync(
+        None, s3_client, BUCKET, local_bucket, plan, verbose=0, codec=codec
+    )
+    head = s3_client.head_object(Bucket=BUCKET, Key="e/0.json")
+    assert _s3.object_codec(head) == codec
+    assert head["ContentLength"] < len(files["e/0.json"])
+
+    # without the manifest, the files are compared with the source metadata
+    os.remove(os.path.join(local_bucket, _s3.MANIFEST_FNAME))
+    plan = _s3.plan_sync(s3_client, BUCKET, local_bucket, "e/", direction="upload")
+    assert plan["update"] == []
+
+    download_bucket = str(tmp_path / "download" / BUCKET)
+    plan = _s3.plan_sync(s3_client, BUCKET, download_bucket, "e/")
+    _s3.execute_sync(s3_resource, s3_client, BUCKET, download_bucket, plan, verbose=0)
+    for key, data in files.items():
+        with open(os.path.join(download_bucket, key), "rb") as f:
+            assert f.read() == data
+    assert _s3.plan_sync(s3_client, BUCKET, download_bucket, "e/")["update"] == []
+
+
+def test_download_resumes_partial_file(s3_resource, s3_client, local_bucket):
+    data = os.urandom(100_000)
+    etag = s3_client.put_object(Bucket=BUCKET, Key="a/obj.bin", Body=data)["ETag"]
+
+    # an interrupted download of the same version of the object
+    local_fpath = os.path.join(local_bucket, "a/obj.bin")
+    write_files(local_bucket, {"a/obj.bin" + _s3._part_fpath("", etag): data[:40_000]})
+
+    requests = record_requests(s3_client)
+    fpath = _s3.download_single_object(s3_resource, BUCKET, "a/obj.bin", local_bucket)
+
+    assert fpath == local_fpath
+    with open(fpath, "rb") as f:
+        assert f.read() == data
+    assert requests == [("GetObject", "bytes=40000-")]
+    assert os.listdir(os.path.dirname(local_fpath)) == ["obj.bin"]
+
+
+def test_download_ignores_partial_file_of_old_version(
+    s3_resource, s3_client, local_bucket
+):
+    old = s3_client.put_object(Bucket=BUCKET, Key="a/obj.bin", Body=b"old" * 100)
+    data = os.urandom(10_000)
+    s3_client.put_object(Bucket=BUCKET, Key="a/obj.bin", Body=data)
+    write_files(local_bucket, {"a/obj.bin" + _s3._part_fpath("", old["ETag"]): b"old"})
+
+    fpath = _s3.download_single_object(s3_resource, BUCKET, "a/obj.bin", local_bucket)
+
+    with open(fpath, "rb") as f:
+        assert f.read() == data
+
+
+def test_download_ranged_resumes_missing_ranges(s3_client, tmp_path, monkeypatch):
+    data = os.urandom(5 * _s3.MB)
+    s3_client.put_object(Bucket=BUCKET, Key="big.bin", Body=data)
+    local_fpath = str(tmp_path / "big.bin")
+
+    get_object = s3_client.get_object
+    failing = {"Range": f"bytes={3 * _s3.MB}-{4 * _s3.MB - 1}"}
+
+    def flaky_get_object(**kwargs):
+        if kwargs.get("Range") == failing.get("Range"):
+            raise botocore_exceptions.ClientError(
+                {"Error": {"Code": "AccessDenied"}}, "GetObject"
+            )
+        return get_object(**kwargs)
+
+    monkeypatch.setattr(s3_client, "get_object", flaky_get_object)
+    with pytest.raises(botocore_exceptions.ClientError):
+        _s3.download_ranged(
+            s3_client, BUCKET, "big.bin", local_fpath, chunk_size=_s3.MB
+        )
+
+    # the completed ranges are kept next to the partial file
+    partial_fnames = sorted(os.listdir(tmp_path))
+    assert [fname.split(".")[-1] for fname in partial_fnames] == ["ranges", "part"]
+    with open(tmp_path / partial_fnames[0], "r") as f:
+        done = set(f"bytes={line.strip()}" for line in f)
+    assert failing["Range"] not in done
+
+    failing.clear()
+    requests = record_requests(s3_client)
+    _s3.download_ranged(s3_client, BUCKET, "big.bin", local_fpath, chunk_size=_s3.MB)
+
+    with open(local_fpath, "rb") as f:
+        assert f.read() == data
+    byte_ranges = [
+        f"bytes={start}-{start + _s3.MB - 1}" for start in range(0, len(data), _s3.MB)
+    ]
+    fetched = [byte_range for name, byte_range in requests if name == "GetObject"]
+    assert sorted(fetched) == sorted(set(byte_ranges) - done)
+    assert os.listdir(tmp_path) == ["big.bin"]
+
+
+def test_download_single_object_ranged(s3_resource, s3_client, local_bucket):
+    data = os.urandom(3 * _s3.MB + 123)
+    s3_client.put_object(Bucket=BUCKET, Key="a/big.bin", Body=data)
+
+    requests = record_requests(s3_client)
+    fpath = _s3.download_single_object(
+        s3_resource,
+        BUCKET,
+        "a/big.bin",
+        local_bucket,
+        range_threshold=_s3.MB,
+        range_chunksize=_s3.MB,
+    )
+
+    with open(fpath, "rb") as f:
+        assert f.read() == data
+    ranges = [byte_range for name, byte_range in requests if byte_range is not None]
+    assert len(ranges) == 4
+
+
+def test_get_bytes(s3_client):
+    data = os.urandom(3 * _s3.MB)
+    s3_client.put_object(Bucket=BUCKET, Key="obj.bin", Body=data)
+
+    requests = record_requests(s3_client)
+    assert _s3.get_bytes(s3_client, BUCKET, "obj.bin").tobytes() == data
+    assert requests == [("GetObject", None)]
+
+    ranged = _s3.get_bytes(
+        s3_client, BUCKET, "obj.bin", range_threshold=_s3.MB, range_chunksize=_s3.MB
+    )
+    assert ranged.tobytes() == data
+
+    byte_range = _s3.get_bytes(s3_client, BUCKET, "obj.bin", byte_range=(10, 19))
+    assert byte_range.tobytes() == data[10:20]
+    past_end = (2 ** 40, 2 ** 41)
+    assert len(_s3.get_bytes(s3_client, BUCKET, "obj.bin", byte_range=past_end)) == 0
+
+
+def test_delete_objs_batches(s3_client):
+    keys = [f"d/{i:03d}" for i in range(25)]
+    for key in keys:
+        s3_client.put_object(Bucket=BUCKET, Key=key, Body=b"x")
+
+    requests = record_requests(s3_client)
+    deleted = []
+    n_deleted, errors = _s3.delete_objs(
+        s3_client, BUCKET, iter(keys), batch_size=10, callback=deleted.extend
+    )
+
+    assert (n_deleted, errors) == (25, [])
+    assert sorted(deleted) == keys
+    assert [name for name, byte_range in requests] == ["DeleteObjects"] * 3
+    assert list(_s3.iter_objects(s3_client, BUCKET)) == []
+
+
+def test_delete_all_objs_reports_every_failure(s3_resource, s3_client, monkeypatch):
+    keys = [f"d/{i:03d}" for i in range(30)]
+    for key in keys:
+        s3_client.put_object(Bucket=BUCKET, Key=key, Body=b"x")
+    protected = set(keys[::2])
+
+    delete_objects = s3_client.delete_objects
+
+    def partial_delete_objects(Bucket, Delete):
+        objects = [obj for obj in Delete["Objects"] if obj["Key"] not in protected]
+        response = delete_objects(Bucket=Bucket, Delete={"Objects": objects})
+        response["Errors"] = [
+            {"Key": obj["Key"], "Code": "AccessDenied", "Message": "Access Denied"}
+            for obj in Delete["Objects"]
+            if obj["Key"] in protected
+        ]
+        return response
+
+    monkeypatch.setattr(s3_client, "delete_objects", partial_delete_objects)
+    with pytest.raises(_s3.DeleteError) as raised:
+        _s3.delete_all_objs(s3_resource, s3_client, BUCKET, verbose=0)
+
+    assert raised.value.n_deleted == 15
+    assert sorted(error["Key"] for error in raised.value.errors) == sorted(protected)
+    assert set(error["Code"] for error in raised.value.errors) == {"AccessDenied"}
+    assert sorted(_s3.iter_objects(s3_client, BUCKET)) == sorted(protected)
+
+
+def test_upload_endpoint_only_lists_without_overwrite(
+    s3_resource, s3_client, local_bucket, monkeypatch
+):
+    monkeypatch.setattr(
+        _s3, "ClientResource", lambda **kwargs: (s3_client, s3_resource)
+    )
+    write_files(local_bucket, {"e/a.txt": b"a", "e/b.txt": b"b"})
+    s3_client.put_object(Bucket=BUCKET, Key="e/a.txt", Body=b"old")
+    kwargs = dict(
+        s3_bucket=BUCKET,
+        local_bucket=local_bucket,
+        local_endpoint_dir=os.path.join(local_bucket, "e"),
+        verbose=0,
+    )
+
+    requests = record_requests(s3_client)
+    _s3.upload_endpoint(overwrite=False, **kwargs)
+    assert ("ListObjects", None) in requests
+    assert s3_client.get_object(Bucket=BUCKET, Key="e/a.txt")["Body"].read() == b"old"
+
+    requests.clear()
+    _s3.upload_endpoint(overwrite=True, **kwargs)
+    assert [name for name, byte_range in requests if name == "ListObjects"] == []
+    assert s3_client.get_object(Bucket=BUCKET, Key="e/a.txt")["Body"].read() == b"a"
+
+
+@pytest.mark.parametrize(
+    "size, expected",
+    [
+        (1000, [("GetObject", "bytes=0-4095")]),
+        (10_000, [("GetObject", "bytes=0-4095"), ("GetObject", "bytes=4096-")]),
+    ],
+)
+def test_download_starts_with_bounded_get(
+    s3_resource, s3_client, local_bucket, size, expected
+):
+    data = os.urandom(size)
+    s3_client.put_object(Bucket=BUCKET, Key="a/obj.bin", Body=data)
+
+    requests = record_requests(s3_client)
+    fpath = _s3.download_single_object(
+        s3_resource,
+        BUCKET,
+        "a/obj.bin",
+        local_bucket,
+        range_threshold=_s3.MB,
+        range_chunksize=4096,
+    )
+
+    with open(fpath, "rb") as f:
+        assert f.read() == data
+    assert requests == expected
+
+
+def test_download_decodes_from_bounded_get(s3_resource, s3_client, local_bucket):
+    data = os.urandom(20_000) * 5
+    fpath = write_files(local_bucket, {"c/obj.bin": data})[0]
+    _s3.upload_single_object(s3_client, BUCKET, fpath, "c", verbose=0, codec="gzip")
+    os.remove(fpath)
+
+    requests = record_requests(s3_client)
+    fpath = _s3.download_single_object(
+        s3_resource, BUCKET, "c/obj.bin", local_bucket, range_chunksize=4096
+    )
+
+    with open(fpath, "rb") as f:
+        assert f.read() == data
+    assert requests == [("GetObject", "bytes=0-4095"), ("GetObject", "bytes=4096-")]
+
+
+def test_download_ranged_discards_corrupt_download(s3_client, tmp_path, monkeypatch):
+    data = os.urandom(3 * _s3.MB)
+    s3_client.put_object(Bucket=BUCKET, Key="big.bin", Body=data)
+    local_fpath = str(tmp_path / "big.bin")
+
+    # a stale ranged download of an older version of the object
+    stale = {"big.bin.0ld.ranges.part": b"old", "big.bin.0ld.ranges": b"0-2\n"}
+    write_files(str(tmp_path), stale)
+
+    monkeypatch.setattr(_s3, "file_etag", lambda *args: "corrupt")
+    with pytest.raises(ValueError):
+        _s3.download_ranged(
+            s3_client, BUCKET, "big.bin", local_fpath, chunk_size=_s3.MB
+        )
+
+    # neither the corrupt download nor the stale one is resumed from
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize(
+    "max_workers, range_workers", [(None, 8), (1, 8), (10, 6), (32, 2), (100, 1)]
+)
+def test_range_workers_fit_the_connection_pool(max_workers, range_workers):
+    assert _s3._range_workers(max_workers) == range_workers
+    # each object gets at least one connection, even when they don't all fit
+    if max_workers is not None and 1 < max_workers <= _s3.DEFAULT_MAX_POOL_CONNECTIONS:
+        assert max_workers * range_workers <= _s3.DEFAULT_MAX_POOL_CONNECTIONS
+
+
+def put_sharded_keys(s3_client, n_shards, n_keys):
+    keys = ["top.txt"]
+    keys += [f"s{i}/{j:03d}" for i in range(n_shards) for j in range(n_keys)]
+    for key in keys:
+        s3_client.put_object(Bucket=BUCKET, Key=key, Body=b"x")
+    return sorted(keys)
+
+
+@pytest.mark.parametrize("sort", [True, False])
+def test_iter_objects_sharded_merges_the_shards(s3_client, sort):
+    keys = put_sharded_keys(s3_client, n_shards=4, n_keys=7)
+
+    objs = list(
+        _s3.iter_objects_sharded(
+            s3_client, BUCKET, max_workers=2, sort=sort, page_size=3, meta=True
+        )
+    )
+
+    listed = [obj["Key"] for obj in objs]
+    if sort:
+        assert listed == keys
+    else:
+        assert sorted(listed) == keys
+
+
+def test_iter_objects_sharded_stops_listing_once_closed(s3_client):
+    put_sharded_keys(s3_client, n_shards=10, n_keys=50)
+
+    requests = record_requests(s3_client)
+    objs = _s3.iter_objects_sharded(s3_client, BUCKET, max_workers=2, page_size=5)
+    first = [next(objs) for i in range(3)]
+    objs.close()
+
+    assert len(first) == 3
+    # the bucket takes 101 pages, and the 2 running shards 20: only the pages
+    # which were in flight or queued when the generator was closed are listed
+    assert len(requests) <= 8
+
+
+def client_error(code, operation="GetObject"):
+    return botocore_exceptions.ClientError({"Error": {"Code": code}}, operation)
+
+
+class FakeClock:
+    """A `time.monotonic` which only moves when it is advanced"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_controller_increases_while_the_limit_is_used(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(_s3._time, "monotonic", clock)
+    controller = _s3.ConcurrencyController(
+        min_concurrency=1, max_concurrency=3, increase=1, interval=1.0
+    )
+
+    for expected in [2, 3, 3]:
+        for i in range(controller.limit):
+            controller.acquire()
+        clock.now += 1.0
+        for i in range(controller.limit):
+            controller.release()
+        assert controller.limit == expected
+
+    # windows in which the limit isn't used don't grow it
+    controller = _s3.ConcurrencyController(max_concurrency=8, initial_concurrency=4)
+    controller.acquire()
+    clock.now += 2.0
+    controller.release()
+    assert controller.limit == 4
+
+
+def test_controller_decreases_once_per_interval(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(_s3._time, "monotonic", clock)
+    controller = _s3.ConcurrencyController(
+        min_concurrency=2, max_concurrency=16, initial_concurrency=16, interval=1.0
+    )
+
+    assert controller.on_error(client_error("SlowDown"))
+    assert controller.on_error(client_error("503"))
+    assert controller.limit == 8
+
+    clock.now += 1.0
+    for i in range(3):
+        controller.on_error(client_error("SlowDown"))
+        clock.now += 1.0
+    assert controller.limit == 2
+
+    assert not controller.on_error(client_error("NoSuchKey"))
+    assert controller.throughput()["throttles"] == 5
+
+
+def test_controller_bounds_the_transfers_in_flight():
+    controller = _s3.ConcurrencyController(
+        min_concurrency=1, max_concurrency=8, initial_concurrency=3, interval=60
+    )
+    lock = threading.Lock()
+    in_flight = [0, 0]
+
+    def work(i):
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight)
+        time.sleep(0.01)
+        with lock:
+            in_flight[0] -= 1
+        return i
+
+    items = list(range(30))
+    assert _s3.thread_map(work, items, controller=controller) == items
+    assert in_flight[1] == 3
+    assert controller.throughput()["in_flight"] == 0
+
+
+class RawBody:
+    def __init__(self, data):
+        self.data = data
+
+    def stream(self, **kwargs):
+        yield self.data
+
+
+def test_botocore_retried_throttles_are_reported(s3_client):
+    s3_client.meta.events.register("needs-retry.s3", _s3._report_throttle)
+    throttled = []
+
+    def throttle(request, **kwargs):
+        if len(throttled) < 2:
+            throttled.append(request.url)
+            body = b"<Error><Code>SlowDown</Code><Message></Message></Error>"
+            return AWSResponse(request.url, 503, {}, RawBody(body))
+
+    s3_client.meta.events.register_first("before-send.s3", throttle)
+    controller = _s3.ConcurrencyController(
+        max_concurrency=8, initial_concurrency=8, interval=0
+    )
+
+    with controller.slot():
+        s3_client.put_object(Bucket=BUCKET, Key="obj", Body=b"x")
+
+    # botocore retried both attempts, which never reached the helpers
+    assert len(throttled) == 2
+    assert controller.throughput()["throttles"] == 2
+    assert controller.limit == 2
+
+
+def zipped(files):
+    """The bytes of a zip file with the `files` (dictionary of name: bytes)"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zip_file:
+        for name, data in files.items():
+            zip_file.writestr(name, data)
+    return buffer.getvalue()
+
+
+def test_iter_download_objs_bounds_the_pending_objects(
+    s3_resource, s3_client, local_bucket
+):
+    keys = [f"i/{i:02d}.zip" if i % 3 == 0 else f"i/{i:02d}.txt" for i in range(24)]
+    for key in keys:
+        body = zipped({"frame.txt": key.encode()}) if key.endswith(".zip") else b"x"
+        s3_client.put_object(Bucket=BUCKET, Key=key, Body=body)
+
+    pulled = []
+
+    def objs():
+        for key in keys:
+            pulled.append(key)
+            yield key
+
+    max_pending = 3
+    fpaths = []
+    for fpath in _s3.iter_download_objs(
+        s3_resource,
+        BUCKET,
+        objs(),
+        local_bucket,
+        max_workers=2,
+        unzip_workers=1,
+        max_pending=max_pending,
+    ):
+        # the objects ahead of the consumer: downloads and unzips, see the docstring
+        assert len(pulled) - len(fpaths) <= 2 * max_pending + 1
+        fpaths.append(fpath)
+
+    local_keys = sorted(os.path.relpath(fpath, local_bucket) for fpath in fpaths)
+    assert local_keys == sorted(key.replace(".zip", "") for key in keys)
+    with open(os.path.join(local_bucket, "i/00/frame.txt"), "rb") as f:
+        assert f.read() == b"i/00.zip"
+
+
+def test_copy_single_object_multipart(s3_client):
+    data = os.urandom(11 * _s3.MB)
+    s3_client.put_object(
+        Bucket=BUCKET, Key="src.bin", Body=data, Metadata={"source": "camera"}
+    )
+
+    requests = record_requests(s3_client)
+    _s3.copy_single_object(
+        s3_client,
+        BUCKET,
+        "src.bin",
+        BUCKET,
+        "dst.bin",
+        multipart_threshold=5 * _s3.MB,
+        part_size=5 * _s3.MB,
+    )
+
+    names = [name for name, byte_range in requests]
+    assert names.count("UploadPartCopy") == 3
+    assert "CompleteMultipartUpload" in names
+    copy = s3_client.get_object(Bucket=BUCKET, Key="dst.bin")
+    assert copy["Body"].read() == data
+    assert copy["Metadata"] == {"source": "camera"}
+
+
+def test_copy_single_object_aborts_failed_multipart(s3_client, monkeypatch):
+    s3_client.put_object(Bucket=BUCKET, Key="src.bin", Body=os.urandom(6 * _s3.MB))
+
+    def upload_part_copy(**kwargs):
+        raise client_error("AccessDenied", "UploadPartCopy")
+
+    monkeypatch.setattr(s3_client, "upload_part_copy", upload_part_copy)
+
+    with pytest.raises(botocore_exceptions.ClientError):
+        _s3.copy_single_object(
+            s3_client,
+            BUCKET,
+            "src.bin",
+            BUCKET,
+            "dst.bin",
+            multipart_threshold=5 * _s3.MB,
+            part_size=5 * _s3.MB,
+        )
+    assert s3_client.list_multipart_uploads(Bucket=BUCKET).get("Uploads", []) == []
+
+
+def test_copy_objs_moves_objects(s3_client):
+    objs = [f"src/{i}.txt" for i in range(5)]
+    for key in objs:
+        s3_client.put_object(Bucket=BUCKET, Key=key, Body=key.encode())
+
+    requests = record_requests(s3_client)
+    dst_objs = [key.replace("src/", "dst/") for key in objs]
+    assert (
+        _s3.copy_objs(
+            s3_client, BUCKET, objs, BUCKET, dst_objs, delete_source=True, verbose=0
+        )
+        == dst_objs
+    )
+
+    # small objects are copied with a single CopyObject request each
+    names = [name for name, byte_range in requests]
+    assert names.count("CopyObject") == 5
+    assert names.count("DeleteObjects") == 1
+    assert list(_s3.iter_objects(s3_client, BUCKET)) == dst_objs
+    for key in dst_objs:
+        body = s3_client.get_object(Bucket=BUCKET, Key=key)["Body"].read()
+        assert body == key.replace("dst/", "src/").encode()
+
+    with pytest.raises(AssertionError):
+        _s3.copy_objs(s3_client, BUCKET, dst_objs, BUCKET, delete_source=True)
+
+
+def test_download_endpoint_resumes_from_the_journal(
+    s3_resource, s3_client, local_bucket, monkeypatch
+):
+    monkeypatch.setattr(
+        _s3, "ClientResource", lambda **kwargs: (s3_client, s3_resource)
+    )
+    for i in range(6):
+        s3_client.put_object(Bucket=BUCKET, Key=f"ep/{i}.bin", Body=b"%d" % i)
+
+    download_single_object = _s3.download_single_object
+    calls = []
+
+    def killed_download(s3_resource, s3_bucket, obj, *args, **kwargs):
+        calls.append(obj)
+        if obj == "ep/3.bin":
+            raise KeyboardInterrupt()
+        return download_single_object(s3_resource, s3_bucket, obj, *args, **kwargs)
+
+    kwargs = dict(
+        s3_bucket=BUCKET,
+        local_bucket=local_bucket,
+        endpoint="ep/",
+        resume=True,
+        verbose=0,
+        max_workers=1,
+    )
+    monkeypatch.setattr(_s3, "download_single_object", killed_download)
+    with pytest.raises(KeyboardInterrupt):
+        _s3.download_endpoint(None, **kwargs)
+
+    monkeypatch.setattr(_s3, "download_single_object", download_single_object)
+    requests = record_requests(s3_client)
+    _s3.download_endpoint(None, **kwargs)
+
+    # the resumed job neither lists the endpoint again nor downloads the done objs
+    assert [name for name, byte_range in requests] == ["GetObject"] * 3
+    assert sorted(os.listdir(os.path.join(local_bucket, "ep"))) == [
+        f"{i}.bin" for i in range(6)
+    ]
+
+
+def test_upload_endpoint_resume_uploads_files_changed_during_upload(
+    s3_resource, s3_client, local_bucket, monkeypatch
+):
+    monkeypatch.setattr(
+        _s3, "ClientResource", lambda **kwargs: (s3_client, s3_resource)
+    )
+    write_files(local_bucket, {f"u/{i}.txt": b"%d" % i for i in range(4)})
+
+    upload_single_object = _s3.upload_single_object
+    first = []
+
+    def interrupted_upload(s3_client, s3_bucket, fpath, *args, **kwargs):
+        if len(first) > 0:
+            raise KeyboardInterrupt()
+        first.append(os.path.relpath(fpath, local_bucket))
+        obj = upload_single_object(s3_client, s3_bucket, fpath, *args, **kwargs)
+
+        # the file is rewritten while it is uploaded
+        stat = os.stat(fpath)
+        with open(fpath, "wb") as f:
+            f.write(b"rewritten")
+        os.utime(fpath, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        return obj
+
+    kwargs = dict(
+        s3_bucket=BUCKET,
+        local_bucket=local_bucket,
+        local_endpoint_dir=os.path.join(local_bucket, "u"),
+        resume=True,
+        verbose=0,
+        max_workers=1,
+    )
+    monkeypatch.setattr(_s3, "upload_single_object", interrupted_upload)
+    with pytest.raises(KeyboardInterrupt):
+        _s3.upload_endpoint(**kwargs)
+
+    uploaded = []
+
+    def recorded_upload(s3_client, s3_bucket, fpath, *args, **kwargs):
+        uploaded.append(os.path.relpath(fpath, local_bucket))
+        return upload_single_object(s3_client, s3_bucket, fpath, *args, **kwargs)
+
+    monkeypatch.setattr(_s3, "upload_single_object", recorded_upload)
+    _s3.upload_endpoint(**kwargs)
+
+    assert sorted(uploaded) == [f"u/{i}.txt" for i in range(4)]
+    body = s3_client.get_object(Bucket=BUCKET, Key=first[0])["Body"].read()
+    assert body == b"rewritten"
+
+
+@pytest.fixture
+def regions(tmp_path, monkeypatch):
+    """
+    Fresh pool and circuit breaker state, where `_build_connection` returns the
+    (kind, region) it was called for, or fails for the regions in `down`
+    """
+
+    for name, value in [
+        ("_POOL", {}),
+        ("_BUILD_LOCKS", {}),
+        ("_REGION_HEALTH", {}),
+        ("_HEALTHY_REGIONS", {}),
+        ("_HEALTH_FPATHS", set()),
+        ("_REPROBES_STOPPED", threading.Event()),
+        ("REGION_HEALTH_DIR", str(tmp_path / "state")),
+    ]:
+        monkeypatch.setattr(_s3, name, value)
+    monkeypatch.setattr(_s3, "fetch_keys", lambda *args: ("id", "secret"))
+
+    down = set()
+    attempts = []
+
+    def build_connection(kind, region_name, *args):
+        attempts.append(region_name)
+        if region_name in down:
+            raise botocore_exceptions.EndpointConnectionError(endpoint_url=region_name)
+        return (kind, region_name)
+
+    monkeypatch.setattr(_s3, "_build_connection", build_connection)
+    yield down, attempts
+    _s3._cancel_reprobes()
+
+
+def connect(kind="client", pool_size=10):
+    credentials_fpath = "/secrets/aws/credentials.yml"
+    return _s3._pooled_connection(
+        kind, ["a", "b"], "ns", credentials_fpath, "443", pool_size, None
+    )
+
+
+def test_failed_region_is_skipped_until_probed(regions, monkeypatch):
+    down, attempts = regions
+    monkeypatch.setattr(_s3, "CIRCUIT_COOLDOWN", 0.2)
+
+    down.add("a")
+    assert connect() == ("client", "b")
+    health = _s3.region_health()
+    assert health["healthy"] == {"ns": "b"}
+    (failed,) = health["failed"].values()
+    assert (failed["region_name"], failed["failures"]) == ("a", 1)
+
+    # new connections start from the healthy region
+    attempts.clear()
+    assert connect(pool_size=20) == ("client", "b")
+    assert attempts == ["b"]
+
+    # once the region is back, the background probe puts it back in the pool
+    down.clear()
+    deadline = time.monotonic() + 5
+    while _s3.region_health()["failed"] and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert connect() == ("client", "a")
+
+
+def test_failed_region_drops_its_pooled_connections(regions):
+    down, attempts = regions
+
+    assert connect() == ("client", "a")
+    down.add("a")
+    # another pool size fails to connect to "a", and the client pooled before stops
+    # being used
+    assert connect(pool_size=20) == ("client", "b")
+    assert connect() == ("client", "b")
+    assert ("client", "a") not in [conn for conn, created in _s3._POOL.values()]
+
+
+def test_region_health_is_shared_through_a_state_file(regions, tmp_path):
+    down, attempts = regions
+    down.add("a")
+    connect()
+
+    (fpath,) = [str(path) for path in (tmp_path / "state").iterdir()]
+    assert fpath == _s3._region_health_fpath("/secrets/aws/credentials.yml")
+
+    # a new process loads the open circuit, and skips the region
+    _s3._cancel_reprobes()
+    _s3._REGION_HEALTH.clear()
+    _s3._HEALTHY_REGIONS.clear()
+    _s3._HEALTH_FPATHS.clear()
+    _s3.clear_pool()
+    attempts.clear()
+    assert connect() == ("client", "b")
+    assert attempts == ["b"]
+
+    # resetting this process leaves the state of the other processes alone
+    _s3.reset_region_health()
+    assert _s3.region_health() == {"healthy": {}, "failed": {}}
+    assert os.path.exists(fpath)
+    _s3.reset_region_health(shared=True)
+    assert not os.path.exists(fpath)
+
+
+def test_reprobes_stop_at_exit(regions):
+    down, attempts = regions
+    down.add("a")
+    connect()
+    (health,) = _s3._REGION_HEALTH.values()
+    timer = health["timer"]
+
+    _s3._stop_reprobes()
+    timer.join(1)
+    assert not timer.is_alive()
+
+    # no new probe is scheduled when the region fails again
+    _s3.reset_region_health()
+    attempts.clear()
+    connect(pool_size=20)
+    assert attempts == ["a", "b"]
+    (health,) = _s3._REGION_HEALTH.values()
+    assert health["timer"] is None
+
+
+def test_transfer_stats_summary(tmp_path, caplog, monkeypatch):
+    monkeypatch.setattr(_s3, "_STATS_COLLECTORS", [])
+    report_fpath = str(tmp_path / "reports" / "stats.json")
+
+    stats = _s3.TransferStats(name="run", report_fpath=report_fpath, log=False)
+    with stats:
+        for i in range(10):
+            stats.record("download", start=i, seconds=i + 1, nbytes=100 * (i + 1))
+        stats.record("download", start=20, seconds=1, ok=False, retries=2)
+        stats.record_retry(client_error("SlowDown"))
+        stats.record_retry(ConnectionError())
+        _s3._emit_wait("bytes", 1.5)
+    # stats which are not active anymore are left alone
+    _s3._emit_wait("bytes", 1.0)
+
+    download = stats.summary()["download"]
+    assert (download["count"], download["bytes"], download["errors"]) == (11, 5500, 1)
+    assert (download["retries"], download["wall_seconds"]) == (2, 21)
+    assert download["latency"]["p50"] == 5 and download["latency"]["max"] == 10
+    assert download["throughput"]["p50"] == 100
+    assert download["throughput"]["bytes_per_sec"] == 5500 / 21
+
+    report = stats.report()
+    assert report["retry_codes"] == {"SlowDown": 1, "ConnectionError": 1}
+    assert report["rate_limited"] == {"bytes": 1.5, "requests": 0.0}
+    with open(report_fpath) as f:
+        assert json.load(f)["ops"] == json.loads(json.dumps(report["ops"]))
+
+    with caplog.at_level("INFO", logger="fuegodata"):
+        stats.log()
+    assert caplog.messages[0].startswith("download: 11 ops, 11 objs")
+    assert caplog.messages[1].startswith("rate limited: 1.50s waiting for bandwidth")
+
+
+def test_transfer_stats_record_the_helpers(
+    s3_resource, s3_client, local_bucket, monkeypatch
+):
+    monkeypatch.setattr(_s3, "_STATS_COLLECTORS", [])
+    keys = [f"s/{i}.bin" for i in range(3)]
+    for key in keys:
+        s3_client.put_object(Bucket=BUCKET, Key=key, Body=b"x" * 1000)
+
+    with _s3.TransferStats(log=False) as stats:
+        _s3.download_objs(s3_resource, BUCKET, keys, local_bucket, verbose=0)
+        with pytest.raises(botocore_exceptions.ClientError):
+            _s3.download_single_object(s3_resource, BUCKET, "s/missing", local_bucket)
+        _s3.delete_objs(s3_client, BUCKET, keys)
+
+    summary = stats.summary()
+    assert (summary["download"]["count"], summary["download"]["bytes"]) == (4, 3000)
+    assert summary["download"]["errors"] == 1
+    assert (summary["delete"]["count"], summary["delete"]["objects"]) == (1, 3)
+
+
+def test_rate_limiter_waits_for_tokens(monkeypatch):
+    monkeypatch.setattr(_s3, "_STATS_COLLECTORS", [])
+    limiter = _s3.RateLimiter(requests_per_sec=50, burst_seconds=0.02)
+
+    with _s3.TransferStats(log=False) as stats:
+        start = time.monotonic()
+        for i in range(6):
+            limiter.consume("requests")
+        elapsed = time.monotonic() - start
+
+    # the bucket holds a single token, and refills one every 20ms
+    assert 0.08 <= elapsed < 1.0
+    assert stats.report()["rate_limited"]["requests"] > 0.05
+    assert stats.report()["rate_limited"]["bytes"] == 0
+
+    # unlimited kinds don't wait
+    start = time.monotonic()
+    limiter.consume("bytes", 10 * _s3.MB)
+    assert time.monotonic() - start < 0.05
+
+
+def test_rate_limiter_picks_up_new_rates():
+    limiter = _s3.RateLimiter(bytes_per_sec=1000)
+    limiter.consume("bytes", 1000)
+    assert limiter.rates() == {"bytes_per_sec": 1000.0, "requests_per_sec": None}
+
+    # the waiting thread would need 100s at the current rate
+    waiter = threading.Thread(target=limiter.consume, args=("bytes", 100_000))
+    waiter.start()
+    time.sleep(0.05)
+    assert waiter.is_alive()
+
+    limiter.set_rates(bytes_per_sec=None)
+    waiter.join(1)
+    assert not waiter.is_alive()
+
+
+def test_rate_limiter_aconsume_sleeps():
+    limiter = _s3.RateLimiter(requests_per_sec=50, burst_seconds=0.02)
+    ticks = []
+
+    async def tick():
+        while True:
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.005)
+
+    async def main():
+        ticker = asyncio.ensure_future(tick())
+        for i in range(6):
+            await limiter.aconsume("requests")
+        ticker.cancel()
+
+    start = time.monotonic()
+    asyncio.run(main())
+
+    # the event loop kept running while the requests waited for the tokens
+    assert time.monotonic() - start >= 0.08
+    assert len(ticks) >= 5
+
+
+class CountingLimiter(_s3.RateLimiter):
+    """A RateLimiter which counts the tokens taken"""
+
+    def __init__(self):
+        super().__init__()
+        self.taken = {"bytes": 0, "requests": 0}
+
+    def consume(self, kind, amount=1):
+        self.taken[kind] += amount
+        super().consume(kind, amount)
+
+    async def aconsume(self, kind, amount=1):
+        self.taken[kind] += amount
+        await super().aconsume(kind, amount)
+
+
+def test_limit_requests_counts_each_request_once(s3_client, monkeypatch):
+    limiter = CountingLimiter()
+    monkeypatch.setattr(_s3, "RATE_LIMITER", limiter)
+
+    _s3.limit_requests(s3_client)
+    _s3.limit_requests(s3_client)
+    requests = record_requests(s3_client)
+    s3_client.put_object(Bucket=BUCKET, Key="obj", Body=b"x" * 100)
+    assert _s3.get_bytes(s3_client, BUCKET, "obj").tobytes() == b"x" * 100
+
+    assert limiter.taken["requests"] == len(requests) >= 2
+    assert limiter.taken["bytes"] == 100
@@ -0,0 +1,217 @@
+"""
+Tests of the asyncio transfer helpers of `s3async`, against a moto server.
+They are skipped when aiobotocore (an optional dependency) is missing.
+"""
+import asyncio
+import gzip
+import os
+import socket
+
+import pytest
+
+pytest.importorskip("aiobotocore")
+moto_server = pytest.importorskip("moto.server")
+
+import boto3
+from aiobotocore.session import AioSession
+
+from fuegodata.utils import boto3 as _s3
+from fuegodata.utils import s3async
+
+from tests.conftest import BUCKET, write_files
+
+
+def fake_keys(namespace=None, aws_credentials_fpath=None):
+    """The keys of the moto server, instead of the credentials file"""
+    return "testing", "testing"
+
+
+@pytest.fixture(scope="module")
+def endpoint_url():
+    """The url of a moto server running for the tests of this module"""
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    server = moto_server.ThreadedMotoServer(ip_address="127.0.0.1", port=port)
+    server.start()
+    yield f"http://127.0.0.1:{port}"
+    server.stop()
+
+
+@pytest.fixture
+def s3_client(aws_env, endpoint_url, monkeypatch):
+    """A (sync) client of the moto server, with an empty BUCKET"""
+
+    monkeypatch.setattr(_s3, "fetch_keys", fake_keys)
+
+    s3_client = boto3.client("s3", endpoint_url=endpoint_url, region_name="us-east-1")
+    s3_client.create_bucket(Bucket=BUCKET)
+    yield s3_client
+    for key in list(_s3.iter_objects(s3_client, BUCKET)):
+        s3_client.delete_object(Bucket=BUCKET, Key=key)
+    s3_client.delete_bucket(Bucket=BUCKET)
+
+
+def run(endpoint_url, afxn):
+    """Run `afxn(s3_client)` with an async client of the moto server"""
+
+    async def main():
+        async with s3async.aclient(
+            region_names=["us-east-1"], endpoint_url=endpoint_url
+        ) as s3_client:
+            return await afxn(s3_client)
+
+    return asyncio.run(main())
+
+
+def test_alist_objects(s3_client, endpoint_url):
+    for i in range(25):
+        s3_client.put_object(Bucket=BUCKET, Key=f"p/{i:03d}", Body=b"x")
+    s3_client.put_object(Bucket=BUCKET, Key="q/0", Body=b"x")
+
+    async def list_keys(s3_client):
+        return [
+            key
+            async for key in s3async.alist_objects(
+                s3_client, BUCKET, prefix="p/", page_size=10
+            )
+        ]
+
+    assert run(endpoint_url, list_keys) == [f"p/{i:03d}" for i in range(25)]
+
+
+def test_adownload_objs(s3_client, endpoint_url, tmp_path):
+    for i in range(20):
+        s3_client.put_object(Bucket=BUCKET, Key=f"p/{i}.txt", Body=b"data%d" % i)
+    s3_client.put_object(
+        Bucket=BUCKET,
+        Key="gz/a.txt",
+        Body=gzip.compress(b"hello" * 1000),
+        Metadata={_s3.CODEC_METADATA_KEY: "gzip"},
+    )
+    objs = [f"p/{i}.txt" for i in range(20)] + ["gz/a.txt", "p/missing"]
+
+    fpaths = run(
+        endpoint_url,
+        lambda s3_client: s3async.adownload_objs(
+            s3_client, BUCKET, objs, tmp_path, ignore_missing=True, max_in_flight=4
+        ),
+    )
+
+    assert len(fpaths) == 21
+    with open(fpaths[5], "rb") as f:
+        assert f.read() == b"data5"
+    with open(fpaths[20], "rb") as f:
+        assert f.read() == b"hello" * 1000
+
+    with pytest.raises(Exception):
+        run(
+            endpoint_url,
+            lambda s3_client: s3async.adownload_objs(
+                s3_client, BUCKET, ["p/missing"], tmp_path
+            ),
+        )
+
+
+def test_aupload_objs(s3_client, endpoint_url, tmp_path):
+    local_bucket = str(tmp_path / BUCKET)
+    files = {"u/small.txt": b"x", "u/big.bin": os.urandom(6 * _s3.MB + 123)}
+    fpaths = write_files(local_bucket, files)
+
+    async def upload(s3_client):
+        objs = await s3async.aupload_objs(
+            s3_client, BUCKET, fpaths, max_buffer_bytes=2 * _s3.MB
+        )
+        multipart = await s3async.aupload_single_object(
+            s3_client,
+            BUCKET,
+            fpaths[1],
+            "mp",
+            multipart_threshold=5 * _s3.MB,
+            multipart_chunksize=5 * _s3.MB,
+        )
+        single = await s3async.aupload_single_object(
+            s3_client, BUCKET, fpaths[0], "single"
+        )
+        return objs, multipart, single
+
+    objs, multipart, single = run(endpoint_url, upload)
+
+    assert objs == ["u/small.txt", "u/big.bin"]
+    assert s3_client.get_object(Bucket=BUCKET, Key=single)["Body"].read() == b"x"
+    for key, data in files.items():
+        assert s3_client.get_object(Bucket=BUCKET, Key=key)["Body"].read() == data
+    assert s3_client.head_object(Bucket=BUCKET, Key=multipart)["ETag"].endswith('-2"')
+
+
+def test_byte_budget_caps_buffered_bytes():
+    budget = s3async._ByteBudget(10)
+    peak = 0
+
+    async def request(nbytes):
+        nonlocal peak
+        async with budget.hold(nbytes):
+            peak = max(peak, budget.used)
+            await asyncio.sleep(0.01)
+
+    async def main():
+        # a request larger than the whole budget still goes through
+        await asyncio.gather(*[request(nbytes) for nbytes in [4, 4, 4, 25, 3]])
+
+    asyncio.run(main())
+
+    assert peak <= 10
+    assert budget.used == 0
+
+
+def test_aclient_tries_endpoint_url_once(aws_env, monkeypatch):
+    monkeypatch.setattr(_s3, "fetch_keys", fake_keys)
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    attempts = []
+
+    async def main():
+        async with s3async.aclient(
+            region_names=["us-east-1", "us-west-2"],
+            endpoint_url=f"http://127.0.0.1:{port}",
+        ):
+            pass
+
+    create_client = AioSession.create_client
+
+    def counted_create_client(self, *args, **kwargs):
+        attempts.append(kwargs.get("region_name"))
+        return create_client(self, *args, **kwargs)
+
+    monkeypatch.setattr(AioSession, "create_client", counted_create_client)
+
+    with pytest.raises(Exception):
+        asyncio.run(main())
+    assert attempts == ["us-east-1"]
+
+
+def test_aclient_requests_are_rate_limited(
+    s3_client, endpoint_url, tmp_path, monkeypatch
+):
+    s3_client.put_object(Bucket=BUCKET, Key="p/obj", Body=b"x" * 1000)
+    fpaths = write_files(str(tmp_path / BUCKET), {"u/obj": b"y" * 500})
+    taken = {"bytes": 0, "requests": 0}
+
+    async def aconsume(kind, amount=1):
+        taken[kind] += amount
+
+    monkeypatch.setattr(_s3.RATE_LIMITER, "aconsume", aconsume)
+
+    async def transfer(s3_client):
+        await s3async.adownload_objs(s3_client, BUCKET, ["p/obj"], tmp_path / "down")
+        await s3async.aupload_objs(s3_client, BUCKET, fpaths)
+
+    run(endpoint_url, transfer)
+
+    # the connection check, the download and the upload
+    assert taken == {"bytes": 1500, "requests": 3}
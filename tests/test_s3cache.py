@@ -0,0 +1,144 @@
+"""
+Tests of the shared download cache of `s3cache`.
+"""
+import os
+import stat
+import threading
+
+from fuegodata.utils import boto3 as _s3
+from fuegodata.utils import s3cache
+
+from tests.conftest import BUCKET
+
+
+def cached_file(tmp_path, name, data):
+    fpath = str(tmp_path / name)
+    with open(fpath, "wb") as f:
+        f.write(data)
+    return fpath
+
+
+def test_store_and_fetch(tmp_path):
+    cache = s3cache.DownloadCache(tmp_path / "cache")
+    fpath = cached_file(tmp_path, "downloaded.bin", b"x" * 100)
+
+    assert not cache.fetch(BUCKET, "a/obj.bin", '"etag"', str(tmp_path / "hit.bin"))
+    cache.store(BUCKET, "a/obj.bin", '"etag"', fpath)
+
+    assert cache.fetch(BUCKET, "a/obj.bin", "etag", str(tmp_path / "hit.bin"))
+    assert not cache.fetch(BUCKET, "a/obj.bin", "other", str(tmp_path / "miss.bin"))
+    with open(tmp_path / "hit.bin", "rb") as f:
+        assert f.read() == b"x" * 100
+
+    # the cache owns its inode, so the downloaded and materialized files stay writable
+    cached_fpath = cache._fpath(cache.digest(BUCKET, "a/obj.bin", "etag"))
+    assert not os.stat(cached_fpath).st_mode & stat.S_IWUSR
+    for fname in ["downloaded.bin", "hit.bin"]:
+        assert os.stat(tmp_path / fname).st_mode & stat.S_IWUSR
+        assert os.stat(tmp_path / fname).st_nlink == 1
+
+    assert cache.stats() == {"hits": 1, "misses": 2, "bytes_saved": 100, "size": 100}
+    cache.close()
+
+
+def test_hardlink_hits_are_read_only(tmp_path):
+    cache = s3cache.DownloadCache(tmp_path / "cache", link="hardlink")
+    cache.store(BUCKET, "obj", "etag", cached_file(tmp_path, "downloaded", b"x"))
+
+    assert cache.fetch(BUCKET, "obj", "etag", str(tmp_path / "hit"))
+    assert os.stat(tmp_path / "hit").st_nlink == 2
+    assert not os.stat(tmp_path / "hit").st_mode & stat.S_IWUSR
+    cache.close()
+
+
+def test_evicts_least_recently_used(tmp_path, monkeypatch):
+    clock = iter(range(1000))
+    monkeypatch.setattr(s3cache._time, "time", lambda: next(clock))
+    cache = s3cache.DownloadCache(tmp_path / "cache", max_bytes=250)
+
+    for key in ["a", "b", "c"]:
+        cache.store(BUCKET, key, "etag", cached_file(tmp_path, key, b"x" * 100))
+
+    # "a" was evicted to fit "c", then "b" is used, so "d" evicts "c"
+    assert not cache.fetch(BUCKET, "a", "etag", str(tmp_path / "hit"))
+    assert cache.fetch(BUCKET, "b", "etag", str(tmp_path / "hit"))
+    cache.store(BUCKET, "d", "etag", cached_file(tmp_path, "d", b"x" * 100))
+
+    hits = [
+        key
+        for key in ["a", "b", "c", "d"]
+        if cache.fetch(BUCKET, key, "etag", str(tmp_path / "hit"))
+    ]
+    assert hits == ["b", "d"]
+    assert cache.size() == 200
+
+    # objects larger than the whole cache are not stored
+    cache.store(BUCKET, "e", "etag", cached_file(tmp_path, "e", b"x" * 300))
+    assert cache.size() == 200
+    cache.close()
+
+
+def test_concurrent_caches_share_the_budget(tmp_path):
+    caches = [
+        s3cache.DownloadCache(tmp_path / "cache", max_bytes=1000) for i in range(2)
+    ]
+    fpath = cached_file(tmp_path, "downloaded", b"x" * 100)
+
+    def store(i):
+        for j in range(20):
+            caches[i % 2].store(BUCKET, f"{i}/{j}", "etag", fpath)
+
+    threads = [threading.Thread(target=store, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    cached_fpaths = [
+        os.path.join(dirpath, fname)
+        for dirpath, dirnames, fnames in os.walk(caches[0].objects_dir)
+        for fname in fnames
+    ]
+    assert caches[0].size() <= 1000
+    assert len(cached_fpaths) * 100 == caches[1].size()
+    for cache in caches:
+        cache.close()
+
+
+def test_without_fcntl(tmp_path, monkeypatch):
+    monkeypatch.setattr(s3cache, "_fcntl", None)
+    cache = s3cache.DownloadCache(tmp_path / "cache")
+
+    cache.store(BUCKET, "obj", "etag", cached_file(tmp_path, "downloaded", b"x"))
+    assert cache.fetch(BUCKET, "obj", "etag", str(tmp_path / "hit"))
+    assert s3cache.materialize(str(tmp_path / "hit"), str(tmp_path / "copy")) == "copy"
+    cache.close()
+
+
+def test_download_single_object_hits_the_cache(
+    s3_resource, s3_client, local_bucket, tmp_path
+):
+    data = os.urandom(10_000)
+    s3_client.put_object(Bucket=BUCKET, Key="a/obj.bin", Body=data)
+    cache = s3cache.DownloadCache(tmp_path / "cache")
+
+    _s3.download_single_object(
+        s3_resource, BUCKET, "a/obj.bin", local_bucket, cache=cache
+    )
+    os.remove(os.path.join(local_bucket, "a/obj.bin"))
+
+    requests = []
+    s3_client.meta.events.register(
+        "before-parameter-build.s3",
+        lambda params, model, **kwargs: requests.append(params.get("Range")),
+    )
+    fpath = _s3.download_single_object(
+        s3_resource, BUCKET, "a/obj.bin", local_bucket, cache=cache
+    )
+
+    with open(fpath, "rb") as f:
+        assert f.read() == data
+    # a hit only requests the first byte, for the ETag
+    assert requests == ["bytes=0-0"]
+    assert cache.stats()["hits"] == 1
+    cache.close()
@@ -0,0 +1,81 @@
+"""
+Tests of the refresh and sweep of the `s3index` listing index, against the
+moto s3 (see `conftest.py`).
+"""
+from fuegodata.utils import s3index
+
+from tests.conftest import BUCKET
+
+
+def put(s3_client, keys, body=b"x"):
+    for key in keys:
+        s3_client.put_object(Bucket=BUCKET, Key=key, Body=body)
+
+
+def test_incremental_refresh_picks_up_new_keys(s3_client, tmp_path):
+    put(s3_client, [f"v/{i:03d}" for i in range(5)])
+
+    with s3index.ObjectIndex(tmp_path / "index.db") as index:
+        counts = index.refresh(s3_client, BUCKET, prefix="v/", page_size=2)
+        assert (counts["listed"], counts["added"]) == (5, 5)
+
+        put(s3_client, ["v/005", "v/006"])
+        counts = index.refresh(s3_client, BUCKET, prefix="v/")
+
+        # only the keys after the last indexed key are listed
+        assert (counts["listed"], counts["added"], counts["removed"]) == (2, 2, 0)
+        assert index.keys(BUCKET, prefix="v/") == [f"v/{i:03d}" for i in range(7)]
+
+
+def test_full_refresh_sweeps_deleted_keys(s3_client, tmp_path):
+    put(s3_client, ["a/0", "a/1", "a/2", "b/0"])
+
+    with s3index.ObjectIndex(tmp_path / "index.db") as index:
+        index.refresh(s3_client, BUCKET)
+
+        s3_client.delete_object(Bucket=BUCKET, Key="a/1")
+        s3_client.delete_object(Bucket=BUCKET, Key="b/0")
+        put(s3_client, ["a/0"], body=b"changed")
+
+        counts = index.refresh(s3_client, BUCKET, prefix="a/", full=True)
+        assert (counts["listed"], counts["updated"], counts["removed"]) == (2, 1, 1)
+
+        # keys outside of the refreshed prefix are kept until it is refreshed
+        assert index.keys(BUCKET) == ["a/0", "a/2", "b/0"]
+        assert index.refresh(s3_client, BUCKET, full=True)["removed"] == 1
+        assert index.keys(BUCKET) == ["a/0", "a/2"]
+
+
+def test_overlapping_refreshes_keep_listed_rows(s3_client, tmp_path):
+    put(s3_client, ["a/0", "a/1", "b/0"])
+
+    with s3index.ObjectIndex(tmp_path / "index.db") as index:
+        index.refresh(s3_client, BUCKET)
+        index.refresh(s3_client, BUCKET, prefix="a/", full=True)
+
+        # the rows stamped by the "a/" refresh were also listed by this one
+        counts = index.refresh(s3_client, BUCKET, prefix="", full=True)
+        assert counts["removed"] == 0
+        assert index.keys(BUCKET) == ["a/0", "a/1", "b/0"]
+
+        counts = index.refresh(s3_client, BUCKET, prefix="a/", full=True)
+        assert counts["removed"] == 0
+        assert index.keys(BUCKET, prefix="a/") == ["a/0", "a/1"]
+
+
+def test_query_by_glob_and_fields(s3_client, tmp_path):
+    keys = [
+        "v/R216_1578240_01302020_15-45-07UTC.mp4",
+        "v/R216_1578241_01302020_15-46-07UTC.mp4",
+        "v/R300_1578240_01302020_15-45-07UTC.mp4",
+        "v/notes.txt",
+    ]
+    put(s3_client, keys)
+
+    with s3index.ObjectIndex(tmp_path / "index.db") as index:
+        index.refresh(s3_client, BUCKET)
+
+        assert index.keys(BUCKET, glob="*.mp4") == keys[:3]
+        assert index.keys(BUCKET, fields={"storeID": "R216"}) == keys[:2]
+        objs = index.query(BUCKET, prefix="v/notes")
+        assert [(obj["Key"], obj["Size"]) for obj in objs] == [("v/notes.txt", 1)]
@@ -0,0 +1,120 @@
+"""
+Tests of the tar shards of `shards`, against the moto s3 (see `conftest.py`).
+"""
+import os
+import tarfile
+
+import pytest
+
+from fuegodata.utils import shards
+
+from tests.conftest import BUCKET, write_files
+
+
+@pytest.fixture
+def packed(tmp_path):
+    """Small files of a few KB, and an empty one"""
+    files = {f"frames/{i:03d}.json": os.urandom(1000 + i) for i in range(40)}
+    files["frames/empty.json"] = b""
+    fpaths = write_files(str(tmp_path / "src"), files)
+    return files, fpaths
+
+
+def record_ranges(s3_client):
+    ranges = []
+    s3_client.meta.events.register(
+        "before-parameter-build.s3.GetObject",
+        lambda params, **kwargs: ranges.append(params.get("Range")),
+    )
+    return ranges
+
+
+def test_pack_shard_offsets(tmp_path, packed):
+    files, fpaths = packed
+    shard_fpath = str(tmp_path / "shard.tar")
+
+    members = shards.pack_shard(fpaths[:5], shard_fpath, str(tmp_path / "src"))
+
+    with open(shard_fpath, "rb") as f:
+        for name, (offset, size) in members.items():
+            f.seek(offset)
+            assert f.read(size) == files[name]
+    with tarfile.open(shard_fpath) as tar:
+        assert sorted(tar.getnames()) == sorted(members)
+
+
+def test_upload_shards_and_read_back(s3_client, tmp_path, packed):
+    files, fpaths = packed
+    work_dir = tmp_path / "work"
+    work_dir.mkdir()
+
+    index = shards.upload_shards(
+        s3_client,
+        BUCKET,
+        fpaths,
+        "packed/",
+        root=str(tmp_path / "src"),
+        shard_size=10_000,
+        tmp_dir=str(work_dir),
+        verbose=0,
+    )
+
+    assert len(index["shards"]) == 5
+    assert os.listdir(work_dir) == []
+
+    reader = shards.ShardReader(s3_client, BUCKET, "packed")
+    assert reader.names() == sorted(files)
+    assert "frames/000.json" in reader and len(reader) == len(files)
+    for name in ["frames/000.json", "frames/039.json", "frames/empty.json"]:
+        assert reader.get(name).tobytes() == files[name]
+    assert reader.get("frames/001.json", parser=lambda data, name: len(data)) == 1001
+
+
+def test_get_many_coalesces_nearby_members(s3_client, packed):
+    files, fpaths = packed
+    # the names are relative to the common directory of the files by default
+    shards.upload_shards(s3_client, BUCKET, fpaths, "packed", verbose=0)
+    reader = shards.ShardReader(s3_client, BUCKET, "packed")
+    names = ["030.json", "empty.json", "002.json"]
+    files = {name.split("/")[-1]: data for name, data in files.items()}
+
+    ranges = record_ranges(s3_client)
+    datas = reader.get_many(names)
+
+    assert [data.tobytes() for data in datas] == [files[name] for name in names]
+    # all of the members are in the same shard, within `max_gap` of each other
+    assert len(ranges) == 1
+
+    ranges.clear()
+    datas = reader.get_many(names, max_gap=0)
+    assert [data.tobytes() for data in datas] == [files[name] for name in names]
+    assert len(ranges) == 2
+
+
+def test_upload_shards_cleans_up_after_failure(
+    s3_client, tmp_path, packed, monkeypatch
+):
+    files, fpaths = packed
+    work_dir = tmp_path / "work"
+    work_dir.mkdir()
+
+    def failed_upload(*args, **kwargs):
+        raise OSError("connection lost")
+
+    monkeypatch.setattr(shards._s3, "upload_single_object", failed_upload)
+    with pytest.raises(OSError):
+        shards.upload_shards(
+            s3_client,
+            BUCKET,
+            fpaths,
+            "packed",
+            shard_size=10_000,
+            tmp_dir=str(work_dir),
+            verbose=0,
+        )
+
+    assert os.listdir(work_dir) == []
+    assert shards.upload_shards(s3_client, BUCKET, [], "packed") == {
+        "shards": [],
+        "members": {},
+    }